@@ -7,11 +7,15 @@ Python 3
 """
 import colectica
 import api
+from rows import RowBuilder
+import mirror
 import pandas as pd
 import os
 import numpy as np
 from pandas.io.json import json_normalize
 import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 
 def root_to_dict_interviewer_instruction(root):
@@ -25,9 +29,22 @@ def root_to_dict_interviewer_instruction(root):
     return info
 
 
-def item_to_dict(dict_item):
+# fields read from each item type, the others are not parsed
+FIELDS = {
+    'Instrument': ['InstrumentURN', 'InstrumentName'],
+    'Category': ['URN', 'Label'],
+    'Question': ['QuestionURN', 'QuestionLiteral', 'QuestionItemName', 'Response'],
+    'Interviewer Instruction': ['InstructionURN', 'InstructionText'],
+    'Code Set': ['Code'],
+    'Statement': ['StatementURN', 'Literal'],
+    'Conditional': ['URN', 'IfCondition'],
+    'Loop': ['URN', 'LoopWhile'],
+}
+
+
+def item_to_dict(dict_item, fields=None):
     """
-    Flat out item in dict_item
+    Flat out item in dict_item, parsing only fields when given
     """
     info = {}
     item_info = None
@@ -36,7 +53,7 @@ def item_to_dict(dict_item):
         if k == 'ItemType':
             info[k] = api.item_dict_inv[dict_item['ItemType']]
         elif k == 'Item':
-            item_info = colectica.parse_xml(v, api.item_dict_inv[dict_item['ItemType']])
+            item_info = colectica.parse_xml(v, dict_item['ItemType'], fields)
         else:
             info[k] = v
     d = {**info, **item_info}
@@ -50,7 +67,7 @@ def generate_category_dict(category_file):
     L = json.load(open(category_file))
     d = {}
     for dict_item in L:
-        item = item_to_dict(dict_item)
+        item = item_to_dict(dict_item, FIELDS['Category'])
         if not item['Label'] is None:
             d[item['URN']] = item['Label']
         else:
@@ -63,7 +80,7 @@ def get_one_study(study_dir):
     output for one study
     """
     df_columns = ['item_type', 'item_urn', 'content']
-    df = pd.DataFrame(columns=df_columns)
+    rows = RowBuilder(df_columns)
 
     # category urn and label
     list_files = os.listdir(study_dir)
@@ -71,7 +88,7 @@ def get_one_study(study_dir):
     instrument_dict = {}
     if 'Instrument.txt' in list_files:
         L = json.load(open(os.path.join(study_dir, 'Instrument.txt')))
-        item = item_to_dict(L[0])
+        item = item_to_dict(L[0], FIELDS['Instrument'])
         instrument_dict['instrument_urn'] = item['InstrumentURN']
         instrument_dict['instrument_name'] = item['InstrumentName']
 
@@ -88,50 +105,51 @@ def get_one_study(study_dir):
 
         if filename == 'Question':
             for dict_item in L:
-                item = item_to_dict(dict_item)
+                item = item_to_dict(dict_item, FIELDS[filename])
                 if not item['QuestionLiteral'] is None:
                     literal = item['QuestionLiteral'].replace('\n', '')
                 else:
                     literal = None
-                df.loc[len(df)] = ['question',  item['QuestionURN'], literal]
-                df.loc[len(df)] = ['question name', None, item['QuestionItemName']]
+                rows.append(['question',  item['QuestionURN'], literal])
+                rows.append(['question name', None, item['QuestionItemName']])
 
                 if item['Response'] != {} and item['Response']['response_type'] != 'CodeList':
-                    df.loc[len(df)] = [item['Response']['response_type'], None, item['Response']['response_label']]
+                    rows.append([item['Response']['response_type'], None, item['Response']['response_label']])
 
         elif filename == 'Interviewer Instruction':
             for dict_item in L:
-                item = item_to_dict(dict_item)
-                df.loc[len(df)] = ['instruction', item['InstructionURN'], item['InstructionText']]
+                item = item_to_dict(dict_item, FIELDS[filename])
+                rows.append(['instruction', item['InstructionURN'], item['InstructionText']])
 
         elif filename == 'Code Set' and category_dict != []:
             for dict_item in L:
-                item = item_to_dict(dict_item)
+                item = item_to_dict(dict_item, FIELDS[filename])
                 for code in item['Code']:
                     if code['Value'] is None:
                         code['Value'] = ''
                     cat_urn = 'urn:ddi:' + code['CategoryReference']['Agency'] + ':' + code['CategoryReference']['ID'] + ':' + code['CategoryReference']['Version']
-                    df.loc[len(df)] = ['codelist', code['URN'], code['Value'] + ', ' + category_dict[cat_urn]]
+                    rows.append(['codelist', code['URN'], code['Value'] + ', ' + category_dict[cat_urn]])
 
         elif filename == 'Statement':
             for dict_item in L:
-                item = item_to_dict(dict_item)
-                df.loc[len(df)] = ['statement', item['StatementURN'], item['Literal']]
+                item = item_to_dict(dict_item, FIELDS[filename])
+                rows.append(['statement', item['StatementURN'], item['Literal']])
 
         elif filename == 'Conditional':
             for dict_item in L:
-                item = item_to_dict(dict_item)
-                df.loc[len(df)] = ['conditional', item['URN'], item['IfCondition']['Description'] + item['IfCondition']['CommandContent'] if not item['IfCondition']['CommandContent'] is None else item['IfCondition']['Description']]
+                item = item_to_dict(dict_item, FIELDS[filename])
+                rows.append(['conditional', item['URN'], item['IfCondition']['Description'] + item['IfCondition']['CommandContent'] if not item['IfCondition']['CommandContent'] is None else item['IfCondition']['Description']])
 
         elif filename == 'Loop':
             for dict_item in L:
-                item = item_to_dict(dict_item)
-                df.loc[len(df)] = ['loop', item['URN'], item['LoopWhile']['CommandContent']]
+                item = item_to_dict(dict_item, FIELDS[filename])
+                rows.append(['loop', item['URN'], item['LoopWhile']['CommandContent']])
 
         else:
             # TODO
             print(filename)
 
+    df = rows.to_frame()
     df = df.drop_duplicates(keep='first')
     df['instrument_name'] = instrument_dict['instrument_name']
     df['instrument_urn'] = instrument_dict['instrument_urn']
@@ -139,14 +157,30 @@ def get_one_study(study_dir):
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='processes parsing study directories in parallel, 1 to run serially')
+    parser.add_argument('--mirror', help='first write the study directories from this mirror.py SQLite file')
+    args = parser.parse_args()
+
     top_dir = 'instrument_dict_original'
-    dir_list = [os.path.join(top_dir, o) for o in os.listdir(top_dir) if os.path.isdir(os.path.join(top_dir,o))]
+    if args.mirror:
+        # no portal requests, see mirror.py
+        mirror.dump_mirror(args.mirror, top_dir)
+    dir_list = sorted(os.path.join(top_dir, o) for o in os.listdir(top_dir) if os.path.isdir(os.path.join(top_dir,o)))
 
     appended_data = []
-    for study_dir in dir_list:
-        print(study_dir)
-        df = get_one_study(study_dir)
-        appended_data.append(df)
+    if args.workers > 1:
+        # results come back in dir_list order, whichever worker finishes first
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            for study_dir, df in zip(dir_list, executor.map(get_one_study, dir_list)):
+                print(study_dir)
+                appended_data.append(df)
+    else:
+        for study_dir in dir_list:
+            print(study_dir)
+            df = get_one_study(study_dir)
+            appended_data.append(df)
 
     df_all = pd.concat(appended_data)
     df_all.to_csv('ESRC.csv', sep='\t', index=False)
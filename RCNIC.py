@@ -7,11 +7,15 @@ Python 3
 """
 import api
 import colectica
+from rows import RowBuilder
+import mirror
 import pandas as pd
 import os
 import numpy as np
 from pandas.io.json import json_normalize
 import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 
 def item_to_dict(dict_item):
@@ -25,7 +29,7 @@ def item_to_dict(dict_item):
         if k == 'ItemType':
             info[k] = api.item_dict_inv[dict_item['ItemType']]
         elif k == 'Item':
-            item_info = colectica.parse_xml(v, api.item_dict_inv[dict_item['ItemType']])
+            item_info = colectica.parse_xml(v, dict_item['ItemType'])
         else:
             info[k] = v
     d = {**info, **item_info}
@@ -89,7 +93,6 @@ def generate_sequence_d(sequence_file):
 
             d_seq[ref_urn] = d_item
 
-    pd.DataFrame.from_dict(d_seq, orient='index').to_csv('tmp_seq.csv', sep='\t')
     return d_seq
 
 
@@ -100,20 +103,20 @@ def generate_question_activity(question_activity_file):
     L_qa = json.load(open(question_activity_file))
 
     df_qa_columns = ['QuestionURN', 'QuestionType', 'QCURN', 'QCID', 'QCName', 'QCLabel']
-    df_qa = pd.DataFrame(columns=df_qa_columns)
+    rows = RowBuilder(df_qa_columns)
 
     for dict_item in L_qa:
         item = item_to_dict(dict_item)
 
         ref_urn = 'urn:ddi:' + item['QuestionReference']['Agency'] + ':' + item['QuestionReference']['ID'] + ':' + item['QuestionReference']['Version']
-        df_qa.loc[len(df_qa)] = [ref_urn,
-                                 item['QuestionReference']['TypeOfObject'],
-                                 item['URN'],
-                                 item['UserID'],
-                                 item['ConstructName'],
-                                 item['Label']
-                                ]
-    return df_qa
+        rows.append([ref_urn,
+                     item['QuestionReference']['TypeOfObject'],
+                     item['URN'],
+                     item['UserID'],
+                     item['ConstructName'],
+                     item['Label']
+                    ])
+    return rows.to_frame()
 
 
 def generate_condition_d(condition_file):
@@ -160,6 +163,52 @@ def generate_loop_d(loop_file):
     return d_loop
 
 
+class SectionError(ValueError):
+    """
+    A sequence whose nearest section cannot be resolved
+    """
+
+
+def nearest_sections(d_seq, d_con, d_loop):
+    """
+    For each construct in d_seq, its nearest enclosing sequence that is a real section:
+    then / else / loop sequences are replaced by the sequence holding their conditional or loop.
+
+    Parents are looked up in one index and each sequence is resolved once, then memoized.
+    Raise SectionError on an orphan (a then / else / loop sequence no conditional or loop refers to,
+    or a conditional or loop no sequence holds) or a cycle.
+    """
+    # then / else / loop sequence URN -> URN of the conditional or loop referring to it
+    parent = {urn: value['URN'] for urn, value in d_con.items()}
+    parent.update({urn: value['URN'] for urn, value in d_loop.items()})
+    resolved = {}
+
+    def resolve(info):
+        path = []
+        while True:
+            seq_urn = info['SequenceURN']
+            if seq_urn in resolved:
+                info = resolved[seq_urn]
+                break
+            seq_name = info['SequenceCCName']
+            if seq_name is None or not seq_name.startswith(('else', 'then', 'loop')):
+                break
+            if seq_urn in path:
+                raise SectionError('cycle of sequences: ' + ' -> '.join(path + [seq_urn]))
+            path.append(seq_urn)
+            construct_urn = parent.get(seq_urn)
+            if construct_urn is None:
+                raise SectionError('sequence {} ({}) is not referenced by any conditional or loop'.format(seq_urn, seq_name))
+            if construct_urn not in d_seq:
+                raise SectionError('{} holding sequence {} ({}) is not in any sequence'.format(construct_urn, seq_urn, seq_name))
+            info = d_seq[construct_urn]
+        for seq_urn in path:
+            resolved[seq_urn] = info
+        return info
+
+    return {k: resolve(info) for k, info in d_seq.items()}
+
+
 def get_question_nearest_section(sequence_file, condition_file, loop_file, question_activity_file):
     """
     Generate a df for question item and it's nearest section label
@@ -174,26 +223,8 @@ def get_question_nearest_section(sequence_file, condition_file, loop_file, quest
     else:
         d_loop = {}
 
-    # find nearest section
-    # if it is condition, then keep looking
-    d_section = d_seq
-    for k in d_seq.keys():
-        seq_name = d_section[k]['SequenceCCName']
-
-        while seq_name is not None and seq_name.startswith(('else', 'then')):
-            for key, value in d_con.items():
-                if d_section[k]['SequenceURN'] == key:
-                    c_urn = value['URN']
-                    d_section[k] = d_seq[c_urn]
-                    seq_name = d_section[k]['SequenceCCName']
-
-        while seq_name is not None and seq_name.startswith('loop'):
-            for key, value in d_loop.items():
-                if d_section[k]['SequenceURN'] == key:
-                    l_urn = value['URN']
-                    d_section[k] = d_seq[l_urn]
-                    seq_name = d_section[k]['SequenceCCName']
-
+    # find nearest section, looking through conditions and loops
+    d_section = nearest_sections(d_seq, d_con, d_loop)
     df_seq_nearest = pd.DataFrame.from_dict(d_section, orient='index')
     # replace tab with space in Sequence Label
     df_seq_nearest['SequenceLabel'] = df_seq_nearest['SequenceLabel'].replace('\t', ' ', regex=True)
@@ -210,7 +241,7 @@ def get_one_study(study_dir, df_qg):
     list_files = os.listdir(study_dir)
 
     df_columns = ['InstrumentURN', 'Instrument', 'QuestionURN', 'QuestionLiteral', 'ResponseType', 'Response']
-    df_q = pd.DataFrame(columns=df_columns)
+    rows = RowBuilder(df_columns)
 
     instrument_dict = {}
     if 'Instrument.txt' in list_files:
@@ -264,12 +295,13 @@ def get_one_study(study_dir, df_qg):
                 response_type = item['Response']['response_type']
                 response = code_dict[item['Response']['code_list_URN']]
 
-            df_q.loc[len(df_q)] = [instrument_dict['instrument_urn'],
-                                   instrument_dict['instrument_name'],
-                                   item['QuestionURN'],
-                                   literal,
-                                   response_type,
-                                   response]
+            rows.append([instrument_dict['instrument_urn'],
+                         instrument_dict['instrument_name'],
+                         item['QuestionURN'],
+                         literal,
+                         response_type,
+                         response])
+    df_q = rows.to_frame()
 
     # merge with question group
     df = df_q.merge(df_qg.loc[:, ['QI_URN', 'QG_URN', 'QG_Name', 'QG_Label']], how='left', left_on='QuestionURN', right_on='QI_URN')
@@ -291,7 +323,25 @@ def get_one_study(study_dir, df_qg):
     return df_new
 
 
+# question groups shared by the studies parsed in a worker process
+_df_qg = None
+
+
+def _init_worker(df_qg):
+    global _df_qg
+    _df_qg = df_qg
+
+
+def _get_one_study_worker(study_dir):
+    return get_one_study(study_dir, _df_qg)
+
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='processes parsing study directories in parallel, 1 to run serially')
+    parser.add_argument('--mirror', help='first write the study directories from this mirror.py SQLite file')
+    args = parser.parse_args()
 
     # question group
     df_qg = pd.read_csv('question_group/question_group_all.csv', sep='\t')
@@ -325,14 +375,24 @@ def main():
 
 
     top_dir = 'instrument_dict_20210421'
-    dir_list = [os.path.join(top_dir, o) for o in os.listdir(top_dir) if os.path.isdir(os.path.join(top_dir,o))]
+    if args.mirror:
+        # no portal requests, see mirror.py
+        mirror.dump_mirror(args.mirror, top_dir)
+    dir_list = sorted(os.path.join(top_dir, o) for o in os.listdir(top_dir) if os.path.isdir(os.path.join(top_dir,o)))
 
     appended_data = []
     #dir_list = ['instrument_dict_20210421/nshd_52_iwm-in-001211']
-    for study_dir in dir_list:
-        print(study_dir)
-        df = get_one_study(study_dir, df_qg)
-        appended_data.append(df)
+    if args.workers > 1:
+        # results come back in dir_list order, whichever worker finishes first
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(df_qg,)) as executor:
+            for study_dir, df in zip(dir_list, executor.map(_get_one_study_worker, dir_list)):
+                print(study_dir)
+                appended_data.append(df)
+    else:
+        for study_dir in dir_list:
+            print(study_dir)
+            df = get_one_study(study_dir, df_qg)
+            appended_data.append(df)
 
     df_all = pd.concat(appended_data)
     df_all.to_csv('RCNIC.csv', sep='\t', index=False)
@@ -2,8 +2,22 @@
     Colectica API
 """
 
+import base64
 import requests
+import requests.adapters
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cache import MemoryLRU
+from transport import RetryPolicy, TokenBucket, AdaptiveConcurrencyLimit, is_overload_status
+
+# use a faster json decoder when one is installed
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 
 # item type dictionary
@@ -111,17 +125,25 @@ item_dict = {
 item_dict_inv = {v:k for k,v in item_dict.items()} 
 
 
-def get_jwtToken(hostname, username, password):
+class TokenError(RuntimeError):
+    """
+    The portal refused to give an access token
+    """
+
+
+def get_jwtToken(hostname, username, password, session=None, scheme="https", timeout=None):
     """
         First obtain a JWT access token
         documented at https://docs.colectica.com/portal/technical/deployment/local-jwt-provider/#usage
+        If a requests.Session is given the token request reuses its connection pool.
     """
-    tokenEndpoint = "https://" + hostname + "/token/createtoken"
-    response = requests.post(tokenEndpoint, json={'username': username, 'password': password}, allow_redirects=True, verify=False)
+    if session is None:
+        session = requests
+    tokenEndpoint = scheme + "://" + hostname + "/token/createtoken"
+    response = session.post(tokenEndpoint, json={'username': username, 'password': password}, allow_redirects=True, verify=False, timeout=timeout)
 
     if response.ok is not True:
-        print("Could not get token. Status code: ", response.status_code)
-        quit()
+        raise TokenError("Could not get token. Status code: {}".format(response.status_code))
 
     jsonResponse = response.json()
     jwtToken = jsonResponse["access_token"]
@@ -132,14 +154,429 @@ def get_jwtToken(hostname, username, password):
     return tokenHeader
 
 
+def jwt_expiry(tokenHeader):
+    """
+        Expiry time (seconds since the epoch) from the exp claim of a bearer token header,
+        None if the token does not say
+    """
+    try:
+        payload = tokenHeader['Authorization'].split(' ', 1)[1].split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenManager():
+    """
+    Keeps a valid token header for a client.
+
+    The token is replaced refresh_margin seconds before its exp claim, or when the portal
+    answers 401. Concurrent callers holding the same stale token share a single refresh.
+    A token is kept at least min_refresh_interval seconds before its expiry replaces it, so a
+    token that looks expired already (clock skew) does not cost a login per call; a 401 still replaces it.
+    """
+    def __init__(self, fetch, refresh_margin=60, tokenHeader=None, min_refresh_interval=30):
+        """
+            fetch: function returning a new token header, e.g. a get_jwtToken call
+            refresh_margin: seconds before expiry at which the token is replaced
+            tokenHeader: the current token header, fetched now if not given
+            min_refresh_interval: seconds a token is kept at least before it is renewed on expiry
+        """
+        self._fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._set(tokenHeader if tokenHeader is not None else fetch())
+
+    def _set(self, tokenHeader):
+        self._header = tokenHeader
+        self.expires = jwt_expiry(tokenHeader)
+        if self.expires is not None:
+            now = time.time()
+            # a short lived token is renewed half way, not on every call
+            margin = max(0.0, min(self.refresh_margin, (self.expires - now) / 2))
+            self._refresh_at = max(self.expires - margin, now + self.min_refresh_interval)
+
+    def _expiring(self):
+        return self.expires is not None and time.time() > self._refresh_at
+
+    def header(self):
+        """
+        The token header to send, refreshed first if it is about to expire
+        """
+        tokenHeader = self._header
+        if self._expiring():
+            tokenHeader = self.refresh(tokenHeader)
+        return tokenHeader
+
+    def refresh(self, stale):
+        """
+        Replace the stale token header unless another caller already did, return the current header
+        """
+        with self._lock:
+            if self._header is stale:
+                self._set(self._fetch())
+                self.refreshes += 1
+            return self._header
+
+
+def latest_ttl_of(cache, latest_ttl=None):
+    """
+        Seconds a client memoizes a latest version lookup: latest_ttl if given,
+        else the cache's latest_ttl, else 24 hours
+    """
+    if latest_ttl is not None:
+        return latest_ttl
+    if cache is not None:
+        return cache.latest_ttl
+    return 24 * 3600
+
+
+def search_json(item_type, search_term, MaxResults=1, RankResults=True, SearchDepricatedItems=False, SearchLatestVersion=True, ResultOffset=0):
+    """
+        Body of a general search query, see ColecticaLowLevelAPI.general_search
+    """
+    return {
+         "Cultures": [
+             "en-US"
+         ],
+         "ItemTypes": [
+             item_type
+         ],
+         "LanguageSortOrder": [
+             "en-US"
+         ],
+         "MaxResults": MaxResults,
+         "RankResults": RankResults,
+         "ResultOffset": ResultOffset,
+         "ResultOrdering": "None",
+         "SearchDepricatedItems": SearchDepricatedItems,
+         "SearchTerms": [
+             search_term
+         ],
+         "SearchLatestVersion": SearchLatestVersion
+     }
+
+
+def relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem=True, UseDistinctTargetItem=True):
+    """
+        Body of a relationship query, see ColecticaLowLevelAPI.relationship_bysubject
+        item_type is an item type GUID or a list of them, the server filters on all of them
+    """
+    return {
+         "ItemTypes": list(item_type) if isinstance(item_type, (list, tuple)) else [item_type],
+         "TargetItem": {
+             "AgencyId": AgencyId,
+             "Identifier": Identifier,
+             "Version": Version
+         },
+         "UseDistinctResultItem": UseDistinctResultItem,
+         "UseDistinctTargetItem": UseDistinctTargetItem
+    }
+
+
+def relationship_key(result):
+    """
+        (AgencyId, Identifier, Version) of a relationship query result or set entry, an identifier or a description
+    """
+    if "Item1" in result:
+        return (result["Item1"]["Item3"], result["Item1"]["Item1"], result["Item1"]["Item2"])
+    return (result["AgencyId"], result["Identifier"], result["Version"])
+
+
+def merge_relationships(results):
+    """
+        The results of several relationship queries in one list, each item once, in query order
+    """
+    merged = {}
+    for result in results:
+        for r in result or []:
+            merged.setdefault(relationship_key(r), r)
+    return list(merged.values())
+
+
+def relationship_query_plan(targets, item_types, direction, descriptions):
+    """
+        Check and normalize the arguments of ColecticaLowLevelAPI.relationship_query
+        Return the name of the query method, the item type GUIDs, the targets as tuples
+        and the targets without a version, whose latest version is looked up first
+    """
+    if direction not in ('bysubject', 'byobject'):
+        raise ValueError("direction is 'bysubject' or 'byobject', not {!r}".format(direction))
+    method = 'relationship_' + direction + ('_descriptions' if descriptions else '')
+    if isinstance(item_types, str):
+        item_types = [item_types]
+    item_types = [item_dict.get(t, t) for t in item_types]
+    targets = [tuple(t) for t in targets]
+    latest = [t for t in targets if len(t) < 3 or t[2] is None]
+    return method, item_types, targets, latest
+
+
+def versioned_targets(targets, latest, results):
+    """
+        targets as (AgencyId, Identifier, Version), the version of the ones in latest taken
+        from their get_items results, None for the items not found
+    """
+    versions = {t[:2]: r['Version'] for t, r in zip(latest, results) if r is not None}
+    return [t if len(t) == 3 and t[2] is not None else t[:2] + (versions.get(t[:2]),) for t in targets]
+
+
+def relationship_results(results, merge):
+    """
+        What relationship_query returns from the result of each target, None for the targets not queried
+    """
+    if merge:
+        return merge_relationships(results)
+    return [r or [] for r in results]
+
+
+def matrix_json(AgencyId, Identifier, Version, Predicate, ReverseTraversal=True):
+    """
+        Body of a relationship matrix query, see ColecticaLowLevelAPI.relationship_matrix
+    """
+    return {
+        "RootItems": [
+            {
+            "AgencyId": AgencyId,
+            "Identifier": Identifier,
+            "Version": Version
+            }
+        ],
+        "Facet": {
+            "Predicate": Predicate,
+            "ReverseTraversal": ReverseTraversal
+        }
+    }
+
+
+def identifier_json(AgencyId, Identifier, Version):
+    """
+        Identification triple as used in request bodies
+    """
+    return {
+        "AgencyId": AgencyId,
+        "Identifier": Identifier,
+        "Version": int(Version)
+    }
+
+
+class ResponseStats():
+    """
+    Instrumentation hook collecting payload size and decode time per endpoint.
+
+        stats = ResponseStats()
+        C = ColecticaObject(hostname, username, password, instrumentation_hook=stats)
+        ...
+        print(stats.summary())
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def __call__(self, endpoint, nbytes, decode_seconds):
+        with self.lock:
+            d = self.endpoints.setdefault(endpoint, {'calls': 0, 'bytes': 0, 'decode_seconds': 0.0})
+            d['calls'] += 1
+            d['bytes'] += nbytes
+            d['decode_seconds'] += decode_seconds
+
+    def summary(self):
+        """
+        Return a dictionary of endpoint: {calls, bytes, decode_seconds}
+        """
+        with self.lock:
+            return {k: dict(v) for k, v in self.endpoints.items()}
+
+
+def decode_response(response, endpoint, instrumentation_hook=None):
+    """
+        Decode a response body once, None if the request failed.
+        instrumentation_hook(endpoint, payload bytes, decode seconds) is called for each decoded body.
+    """
+    if not response.ok:
+        return None
+    content = response.content
+    start = time.perf_counter()
+    result = json_loads(content)
+    if instrumentation_hook is not None:
+        instrumentation_hook(endpoint, len(content), time.perf_counter() - start)
+    return result
+
+
+def new_session(pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True):
+    """
+        Create a requests.Session with a sized connection pool mounted for http and https
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                            pool_maxsize=pool_maxsize,
+                                            pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
 class ColecticaLowLevelAPI():
     """Acts as a frontend to a Colectica portal.
 
     You can then make API calls to this.  It caches authentication credentials, etc.
     """
-    def __init__(self, hostname, username, password):
+    def __init__(self, hostname, username, password,
+                 pool_connections=10, pool_maxsize=10, pool_block=False,
+                 keep_alive=True, timeout=(10, 300), scheme="https", max_workers=8,
+                 instrumentation_hook=None, cache=None, memo_size=4096, retry_policy=None,
+                 rate_limiter=None, concurrency_limit=None, token_refresh_margin=60, latest_ttl=None):
+        """
+        All endpoint methods share one requests.Session, so TCP+TLS connections
+        to the portal are kept alive and reused between calls.
+            pool_connections: number of per-host connection pools to keep
+            pool_maxsize: maximum connections kept open per host
+            pool_block: block instead of opening extra connections when the pool is full
+            keep_alive: set to False to close the connection after each request
+            timeout: (connect, read) timeout in seconds, None waits forever
+            max_workers: number of threads used by batch methods such as get_items
+            instrumentation_hook: called as hook(endpoint, payload bytes, decode seconds)
+                                  for every response, see ResponseStats
+            cache: a cache.ItemCache, e.g. cache.SQLiteItemCache(path), keeping
+                   fetched items between runs
+            memo_size: maximum number of items and parsed items memoized in memory
+                       for the lifetime of the object, 0 disables it, see self.memo.stats()
+            retry_policy: a transport.RetryPolicy, default RetryPolicy(), see self.retry_policy.stats()
+            rate_limiter: a transport.TokenBucket capping requests per second, default no cap
+            concurrency_limit: a transport.AdaptiveConcurrencyLimit, default one adapting
+                               between 1 and max_workers requests in flight; not shared with an async client
+            token_refresh_margin: seconds before the token expires at which it is renewed
+            latest_ttl: seconds a latest version lookup stays memoized, default the cache's latest_ttl,
+                        24 hours without a cache
+        """
         self.host = hostname
-        self.token = get_jwtToken(hostname, username, password)
+        self.base_url = scheme + "://" + hostname
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.instrumentation_hook = instrumentation_hook
+        self.cache = cache
+        self.memo = MemoryLRU(memo_size)
+        self.latest_ttl = latest_ttl_of(cache, latest_ttl)
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.rate_limiter = rate_limiter
+        if concurrency_limit is None:
+            concurrency_limit = AdaptiveConcurrencyLimit(initial=min(4, max_workers), max_limit=max(1, max_workers))
+        self.concurrency_limit = concurrency_limit
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.session = new_session(pool_connections, pool_maxsize, pool_block, keep_alive)
+        self.token_manager = TokenManager(lambda: get_jwtToken(hostname, username, password, session=self.session, scheme=scheme, timeout=timeout),
+                                          refresh_margin=token_refresh_margin)
+
+
+    @property
+    def token(self):
+        """
+        Current token header
+        """
+        return self.token_manager.header()
+
+
+    def close(self):
+        """
+        Close all pooled connections
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.session.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _request(self, method, path, endpoint, jsonquery=None):
+        """
+        Send a request through the shared session, return the decoded json or None on error
+        All the portal calls made here are reads, so failed attempts are retried following self.retry_policy
+        Each attempt waits for self.rate_limiter and self.concurrency_limit
+        On 401 the token is renewed and the request sent again, once
+        """
+        policy = self.retry_policy
+        started = time.monotonic()
+        attempt = 0
+        reauthenticated = False
+        while True:
+            tokenHeader = self.token_manager.header()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            self.concurrency_limit.acquire()
+            sent = time.monotonic()
+            try:
+                try:
+                    response = self.session.request(method, self.base_url + path, headers=tokenHeader, json=jsonquery, verify=False, timeout=self.timeout)
+                except BaseException:
+                    self.concurrency_limit.release(error=True)
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                delay = policy.next_delay(attempt, started)
+                if delay is None:
+                    policy.record_give_up(endpoint)
+                    raise
+            else:
+                self.concurrency_limit.release(time.monotonic() - sent, is_overload_status(response.status_code))
+                if response.status_code == 401 and not reauthenticated:
+                    self.token_manager.refresh(tokenHeader)
+                    reauthenticated = True
+                    continue
+                if not policy.should_retry_status(response.status_code):
+                    break
+                delay = policy.next_delay(attempt, started, response.headers.get('Retry-After'))
+                if delay is None:
+                    policy.record_give_up(endpoint)
+                    break
+            policy.record_retry(endpoint)
+            time.sleep(delay)
+            attempt += 1
+        return decode_response(response, endpoint, self.instrumentation_hook)
+
+
+    def _get(self, path, endpoint):
+        """
+        GET a portal path, return the decoded json or None on error
+        """
+        return self._request("GET", path, endpoint)
+
+
+    def _post(self, path, jsonquery, endpoint):
+        """
+        POST a json query to a portal path, return the decoded json or None on error
+        """
+        return self._request("POST", path, endpoint, jsonquery)
+
+
+    def _map_concurrent(self, fn, args_list):
+        """
+        Call fn(*args) for each args in args_list on the worker threads, return results in input order
+        """
+        args_list = list(args_list)
+        if len(args_list) <= 1 or self.max_workers <= 1:
+            return [fn(*args) for args in args_list]
+        return list(self._worker_pool().map(lambda args: fn(*args), args_list))
+
+
+    def _worker_pool(self):
+        """
+        The thread pool shared by batch methods, created on first use
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
 
 
     def item_code(self, item):
@@ -157,72 +594,80 @@ class ColecticaLowLevelAPI():
         Request Type: GET
         URL: /api/v1/item/agenct/Id
         """
-        response = requests.get("https://"+self.host+"/api/v1/item/"+AgencyId+"/"+Identifier, headers=self.token, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return response.json()
-
-
-    def general_search(self, item_type, search_term, MaxResults=1, RankResults=True, SearchDepricatedItems=False, SearchLatestVersion=True):
+        memoized = self.memo.get(('item', AgencyId, Identifier))
+        if memoized is not None:
+            return memoized
+        if self.cache is not None:
+            cached = self.cache.get_item(AgencyId, Identifier)
+            if cached is not None:
+                self.memo.put(('item', AgencyId, Identifier), cached, self.latest_ttl)
+                return cached
+        result = self._get("/api/v1/item/"+AgencyId+"/"+Identifier, "get_an_item")
+        if result != []:
+            if self.cache is not None and result is not None:
+                self.cache.put_item(result, latest=True)
+            self.memo.put(('item', AgencyId, Identifier), result, self.latest_ttl)
+            return result
+
+
+    def general_search(self, item_type, search_term, MaxResults=1, RankResults=True, SearchDepricatedItems=False, SearchLatestVersion=True, ResultOffset=0):
         """
             Perform a general search: https://docs.colectica.com/portal/api/examples/search/
             Request Type: POST
             URL: /api/v1/_query
         """
         # MaxResults=0 returns all results
-        jsonquery =  {
-             "Cultures": [
-                 "en-US"
-             ],
-             "ItemTypes": [
-                 item_type
-             ],
-             "LanguageSortOrder": [
-                 "en-US"
-             ],
-             "MaxResults": MaxResults,
-             "RankResults": RankResults,
-             "ResultOffset": 0,
-             "ResultOrdering": "None",
-             "SearchDepricatedItems": SearchDepricatedItems,
-             "SearchTerms": [
-                 search_term
-             ],
-             "SearchLatestVersion": SearchLatestVersion
-         }
-
-        response = requests.post("https://"+self.host+"/api/v1/_query/", headers=self.token, json=jsonquery, verify=False)
-        if response.ok:
-            return response.json()
-
-
-
-
-    def relationship_search(self, item_type, AgencyId, Identifier, UseDistinctResultItem=True, UseDistinctTargetItem=True):
+        jsonquery = search_json(item_type, search_term, MaxResults, RankResults, SearchDepricatedItems, SearchLatestVersion, ResultOffset)
+
+        result = self._post("/api/v1/_query/", jsonquery, "general_search")
+        return result
+
+
+    def search_iter(self, item_type, search_term, page_size=500, prefetch=True, **kwargs):
+        """
+            Yield general_search results one at a time, walking ResultOffset a page at a time.
+            With prefetch the next page is requested in the background while the current one is consumed.
+            Other keyword arguments are passed to general_search.
+            Example:
+                for result in C.search_iter(C.item_code('Question Group'), ''):
+                    print(result['AgencyId'], result['Identifier'])
+        """
+        def page(offset):
+            return self.general_search(item_type, search_term, MaxResults=page_size, ResultOffset=offset, **kwargs)
+
+        offset = 0
+        current = page(offset)
+        while current is not None and current['Results'] != []:
+            offset += len(current['Results'])
+            more = offset < current['TotalResults']
+            if more and prefetch:
+                upcoming = self._worker_pool().submit(page, offset)
+            for result in current['Results']:
+                yield result
+            if not more:
+                break
+            current = upcoming.result() if prefetch else page(offset)
+
+
+    def relationship_search(self, item_type, AgencyId, Identifier, UseDistinctResultItem=True, UseDistinctTargetItem=True, Version=None):
         """
             Option 1: retrieve identifiers only
             https://docs.colectica.com/portal/api/examples/relationship-search/
             Request Type: POST
             URL: /api/v1/_query/relationship/bysubject
+            Version None searches from the latest version of the item, None if the item is not found.
         """
+        if Version is None:
+            item = self.get_an_item(AgencyId, Identifier)
+            if item is None:
+                return None
+            Version = item['Version']
 
-        jsonquery = {
-             "ItemTypes": [
-                 item_type
-             ],
-             "TargetItem": {
-                 "AgencyId": AgencyId,
-                 "Identifier": Identifier,
-                 "Version": 1
-             },
-             "UseDistinctResultItem": UseDistinctResultItem,
-             "UseDistinctTargetItem": UseDistinctTargetItem
-        }
+        jsonquery = relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
 
-        response = requests.post("https://"+self.host+"/api/v1/_query/relationship/bysubject/", headers=self.token, json=jsonquery, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return(response.json())
+        result = self._post("/api/v1/_query/relationship/bysubject/", jsonquery, "relationship_search")
+        if result != []:
+            return result
 
 
     def get_an_item_version(self, AgencyId, Identifier, Version):
@@ -232,10 +677,15 @@ class ColecticaLowLevelAPI():
             Request Type: GET
             URL: /api/v1/item/{agency}/{id}/{version}
         """
-        response = requests.get("https://"+self.host+"/api/v1/item/"+AgencyId+"/"+Identifier+"/"+Version, headers=self.token, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return response.json()
+        if self.cache is not None:
+            cached = self.cache.get_item(AgencyId, Identifier, Version)
+            if cached is not None:
+                return cached
+        result = self._get("/api/v1/item/"+AgencyId+"/"+Identifier+"/"+Version, "get_an_item_version")
+        if result != []:
+            if self.cache is not None and result is not None:
+                self.cache.put_item(result)
+            return result
 
 
     def get_item_version_history(self, AgencyId, Identifier):
@@ -245,10 +695,9 @@ class ColecticaLowLevelAPI():
             Request Type: GET
             URL: /api/v1/item/{agency}/{id}/history
         """
-        response = requests.get("https://"+self.host+"/api/v1/item/"+AgencyId+"/"+Identifier+"/history", headers=self.token, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return response.json()
+        result = self._get("/api/v1/item/"+AgencyId+"/"+Identifier+"/history", "get_item_version_history")
+        if result != []:
+            return result
 
     def colectica_get_api(self, url, hostname, tokenHeader):
         """
@@ -257,10 +706,9 @@ class ColecticaLowLevelAPI():
             Request Type: GET
             URL: /api/v1/item/{agency}/{id}/history
         """
-        response = requests.get("https://"+self.host+"/api/v1/"+url, headers=self.token, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return response.json()
+        result = self._get("/api/v1/"+url, "colectica_get_api")
+        if result != []:
+            return result
 
     def get_item_description(self, AgencyId, Identifier, Version):
         """
@@ -270,10 +718,9 @@ class ColecticaLowLevelAPI():
             Request Type: GET
             URL: /api/v1/item/{agency}/{id}/{version}/description
         """
-        response = requests.get("https://"+self.host+"/api/v1/item/"+AgencyId+"/"+Identifier+"/"+Version+"/description", headers=self.token, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return response.json()
+        result = self._get("/api/v1/item/"+AgencyId+"/"+Identifier+"/"+Version+"/description", "get_item_description")
+        if result != []:
+            return result
 
 
     def relationship_bysubject_descriptions(self, item_type, AgencyId, Identifier, Version, UseDistinctResultItem=True, UseDistinctTargetItem=True):
@@ -285,23 +732,11 @@ class ColecticaLowLevelAPI():
             URL: /api/v1/_query/relationship/bysubject/descriptions
         """
 
-        jsonquery = {
-             "ItemTypes": [
-                 item_type
-             ],
-             "TargetItem": {
-                 "AgencyId": AgencyId,
-                 "Identifier": Identifier,
-                 "Version": Version
-             },
-             "UseDistinctResultItem": UseDistinctResultItem,
-             "UseDistinctTargetItem": UseDistinctTargetItem
-        }
+        jsonquery = relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
 
-        response = requests.post("https://"+self.host+"/api/v1/_query/relationship/bysubject/descriptions", headers=self.token, json=jsonquery, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return(response.json())
+        result = self._post("/api/v1/_query/relationship/bysubject/descriptions", jsonquery, "relationship_bysubject_descriptions")
+        if result != []:
+            return result
 
 
     def relationship_byobject_descriptions(self, item_type, AgencyId, Identifier, Version, UseDistinctResultItem=True, UseDistinctTargetItem=True):
@@ -313,23 +748,11 @@ class ColecticaLowLevelAPI():
             URL: /api/v1/_query/relationship/byobject/descriptions
         """
 
-        jsonquery = {
-             "ItemTypes": [
-                 item_type
-             ],
-             "TargetItem": {
-                 "AgencyId": AgencyId,
-                 "Identifier": Identifier,
-                 "Version": Version
-             },
-             "UseDistinctResultItem": UseDistinctResultItem,
-             "UseDistinctTargetItem": UseDistinctTargetItem
-        }
+        jsonquery = relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
 
-        response = requests.post("https://"+self.host+"/api/v1/_query/relationship/bysubject/descriptions", headers=self.token, json=jsonquery, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return(response.json())
+        result = self._post("/api/v1/_query/relationship/byobject/descriptions", jsonquery, "relationship_byobject_descriptions")
+        if result != []:
+            return result
 
 
     def relationship_bysubject(self, item_type, AgencyId, Identifier, Version,  UseDistinctResultItem=True, UseDistinctTargetItem=True):
@@ -340,23 +763,11 @@ class ColecticaLowLevelAPI():
             URL: /api/v1/_query/relationship/bysubject
         """
 
-        jsonquery = {
-             "ItemTypes": [
-                 item_type
-             ],
-             "TargetItem": {
-                 "AgencyId": AgencyId,
-                 "Identifier": Identifier,
-                 "Version": Version
-             },
-             "UseDistinctResultItem": UseDistinctResultItem,
-             "UseDistinctTargetItem": UseDistinctTargetItem
-        }
+        jsonquery = relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
 
-        response = requests.post("https://"+self.host+"/api/v1/_query/relationship/bysubject", headers=self.token, json=jsonquery, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return(response.json())
+        result = self._post("/api/v1/_query/relationship/bysubject", jsonquery, "relationship_bysubject")
+        if result != []:
+            return result
 
 
     def relationship_byobject(self, item_type, AgencyId, Identifier, Version, UseDistinctResultItem=True, UseDistinctTargetItem=True):
@@ -367,23 +778,33 @@ class ColecticaLowLevelAPI():
             URL: /api/v1/_query/relationship/byobject
         """
 
-        jsonquery = {
-             "ItemTypes": [
-                 item_type
-             ],
-             "TargetItem": {
-                 "AgencyId": AgencyId,
-                 "Identifier": Identifier,
-                 "Version": Version
-             },
-             "UseDistinctResultItem": UseDistinctResultItem,
-             "UseDistinctTargetItem": UseDistinctTargetItem
-        }
+        jsonquery = relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
+
+        result = self._post("/api/v1/_query/relationship/byobject", jsonquery, "relationship_byobject")
+        if result != []:
+            return result
 
-        response = requests.post("https://"+self.host+"/api/v1/_query/relationship/bysubject", headers=self.token, json=jsonquery, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return(response.json())
+
+    def relationship_query(self, targets, item_types, direction='byobject', descriptions=False, merge=True, UseDistinctResultItem=True, UseDistinctTargetItem=True):
+        """
+            Relationship search from many targets for many item types, e.g. the question groups
+            referencing any of a list of questions:
+                C.relationship_query(questions, ['Question Group'])
+            targets: list of (AgencyId, Identifier, Version), or (AgencyId, Identifier) for the latest version
+            item_types: item type names or GUIDs, or one of them; all go in the same request
+            direction: 'byobject' for the items referencing a target, 'bysubject' for the items it references
+            descriptions: item descriptions instead of identifiers
+            One request per target, sent concurrently. With merge, return the results of all targets in one list,
+            each item once, in target order; otherwise a list of results per target, in input order.
+        """
+        method, item_types, targets, latest = relationship_query_plan(targets, item_types, direction, descriptions)
+        query = getattr(self, method)
+        targets = versioned_targets(targets, latest, self.get_items(latest))
+        results = self._map_concurrent(
+            lambda AgencyId, Identifier, Version: None if Version is None else query(
+                item_types, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem),
+            targets)
+        return relationship_results(results, merge)
 
 
     def relationship_matrix(self, AgencyId, Identifier, Version, Predicate, ReverseTraversal=True):
@@ -394,24 +815,11 @@ class ColecticaLowLevelAPI():
             URL: /api/v1/_query/relationship/matrix
         """
 
-        jsonquery = {
-            "RootItems": [
-                {
-                "AgencyId": AgencyId,
-                "Identifier": Identifier,
-                "Version": Version
-                }
-            ],
-            "Facet": {
-                "Predicate": Predicate,
-                "ReverseTraversal": ReverseTraversal
-            }
-        }
+        jsonquery = matrix_json(AgencyId, Identifier, Version, Predicate, ReverseTraversal)
 
-        response = requests.post("https://"+self.host+"/api/v1/_query/relationship/matrix", headers=self.token, json=jsonquery, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return(response.json())
+        result = self._post("/api/v1/_query/relationship/matrix", jsonquery, "relationship_matrix")
+        if result != []:
+            return result
 
 
     def relationship_matrix_typed(self, AgencyId, Identifier, Version, Predicate, ReverseTraversal=True):
@@ -422,24 +830,11 @@ class ColecticaLowLevelAPI():
             URL: /api/v1/_query/relationship/matrix/typed
         """
 
-        jsonquery = {
-            "RootItems": [
-                {
-                "AgencyId": AgencyId,
-                "Identifier": Identifier,
-                "Version": Version
-                }
-            ],
-            "Facet": {
-                "Predicate": Predicate,
-                "ReverseTraversal": ReverseTraversal
-            }
-        }
+        jsonquery = matrix_json(AgencyId, Identifier, Version, Predicate, ReverseTraversal)
 
-        response = requests.post("https://"+self.host+"/api/v1/_query/relationship/matrix/typed", headers=self.token, json=jsonquery, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return(response.json())
+        result = self._post("/api/v1/_query/relationship/matrix/typed", jsonquery, "relationship_matrix_typed")
+        if result != []:
+            return result
 
 
     def get_a_set(self, AgencyId, Identifier, Version):
@@ -460,10 +855,9 @@ class ColecticaLowLevelAPI():
         [1] https://docs.colectica.com/portal/technical/api/v1/#operation/ApiV1SetByAgencyByIdByVersionGet
         """
 
-        response = requests.get("https://" + self.host + "/api/v1/set/" + AgencyId + "/" + Identifier + "/" + Version , headers=self.token, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return response.json()
+        result = self._get("/api/v1/set/" + AgencyId + "/" + Identifier + "/" + Version, "get_a_set")
+        if result != []:
+            return result
 
 
     def get_a_set_typed(self, AgencyId, Identifier, Version):
@@ -474,10 +868,9 @@ class ColecticaLowLevelAPI():
             URL: /api/v1/set/{agency}/{id}/{version}/typed
         """
 
-        response = requests.get("https://" + self.host + "/api/v1/set/" + AgencyId + "/" + Identifier + "/" + Version + "/typed", headers=self.token, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return response.json()
+        result = self._get("/api/v1/set/" + AgencyId + "/" + Identifier + "/" + Version + "/typed", "get_a_set_typed")
+        if result != []:
+            return result
 
 
     def get_a_set_lasted(self, AgencyId, Identifier):
@@ -488,10 +881,71 @@ class ColecticaLowLevelAPI():
             URL: /api/v1/set/{agency}/{id}
         """
 
-        response = requests.get("https://" + self.host + "/api/v1/set/" + AgencyId + "/" + Identifier, headers=self.token, verify=False)
-        if response.ok:
-            if response.json() != []:
-                return response.json()
+        result = self._get("/api/v1/set/" + AgencyId + "/" + Identifier, "get_a_set_lasted")
+        if result != []:
+            return result
+
+
+    def get_many_items(self, identifiers):
+        """
+            Get several items, one call each on the worker threads, in input order.
+            identifiers is a list of (AgencyId, Identifier) for the latest version
+            or (AgencyId, Identifier, Version) for a given version.
+        """
+        def get_one(*ident):
+            if len(ident) == 3:
+                return self.get_an_item_version(ident[0], ident[1], str(ident[2]))
+            return self.get_an_item(ident[0], ident[1])
+        return self._map_concurrent(get_one, identifiers)
+
+
+    def get_item_list(self, identifiers):
+        """
+            Gets a list of items in one request.
+            https://docs.colectica.com/portal/technical/api/v1/#operation/ApiV1Item_getListPost
+            Request Type: POST
+            URL: /api/v1/item/_getList
+            identifiers is a list of (AgencyId, Identifier, Version).
+            Items are returned in the server's order, missing items are left out.
+        """
+        jsonquery = {"Identifiers": [identifier_json(*ident) for ident in identifiers]}
+        result = self._post("/api/v1/item/_getList", jsonquery, "get_item_list")
+        if result != []:
+            return result
+
+
+    def get_items(self, identifiers, chunk_size=200):
+        """
+            Get many items with as few requests as possible, results in input order.
+            identifiers is a list of (AgencyId, Identifier, Version). The list is split into
+            chunks of chunk_size for /api/v1/item/_getList and the chunks are sent concurrently.
+            Entries without a version, (AgencyId, Identifier) or Version None,
+            are fetched with get_an_item instead.
+            A missing item gives None at its position.
+        """
+        identifiers = [tuple(ident) for ident in identifiers]
+        versioned = [ident for ident in identifiers if len(ident) == 3 and ident[2] is not None]
+        latest = [ident for ident in identifiers if len(ident) < 3 or ident[2] is None]
+
+        found = {}
+        if self.cache is not None:
+            for ident in versioned:
+                cached = self.cache.get_item(*ident)
+                if cached is not None:
+                    found[(ident[0], ident[1], str(ident[2]))] = cached
+            versioned = [ident for ident in versioned if (ident[0], ident[1], str(ident[2])) not in found]
+
+        chunks = [(versioned[i:i + chunk_size],) for i in range(0, len(versioned), chunk_size)]
+        for chunk_result in self._map_concurrent(self.get_item_list, chunks):
+            for item in chunk_result or []:
+                found[(item['AgencyId'], item['Identifier'], str(item['Version']))] = item
+                if self.cache is not None:
+                    self.cache.put_item(item)
+        for ident, item in zip(latest, self._map_concurrent(self.get_an_item, [ident[:2] for ident in latest])):
+            found[(ident[0], ident[1], None)] = item
+
+        return [found.get((ident[0], ident[1], str(ident[2]) if len(ident) == 3 and ident[2] is not None else None))
+                for ident in identifiers]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,686 @@
+"""
+    Asyncio Colectica API
+
+    AsyncColecticaLowLevelAPI mirrors api.ColecticaLowLevelAPI on aiohttp, with a
+    semaphore bounding the number of requests in flight.
+    AsyncColecticaObject mirrors colectica.ColecticaObject.
+    SyncColecticaObject runs an AsyncColecticaObject on a background event loop,
+    so scripts written against ColecticaObject keep working unchanged.
+"""
+
+import asyncio
+import inspect
+import threading
+import time
+import aiohttp
+import api
+import colectica
+from cache import MemoryLRU
+from transport import RetryPolicy, AdaptiveConcurrencyLimit, is_overload_status
+
+
+async def get_jwtToken(session, hostname, username, password, scheme="https"):
+    """
+        Async version of api.get_jwtToken
+    """
+    tokenEndpoint = scheme + "://" + hostname + "/token/createtoken"
+    async with session.post(tokenEndpoint, json={'username': username, 'password': password}, allow_redirects=True) as response:
+        if response.status >= 400:
+            raise api.TokenError("Could not get token. Status code: {}".format(response.status))
+        jsonResponse = await response.json(content_type=None)
+    return {'Authorization': 'Bearer ' + jsonResponse["access_token"]}
+
+
+class AsyncTokenManager(api.TokenManager):
+    """
+    api.TokenManager for the event loop: fetch is a coroutine function and
+    header / refresh are awaited. Create it with await AsyncTokenManager.create(fetch).
+    """
+    @classmethod
+    async def create(cls, fetch, refresh_margin=60, min_refresh_interval=30):
+        manager = cls(fetch, refresh_margin, tokenHeader=await fetch(), min_refresh_interval=min_refresh_interval)
+        manager._lock = asyncio.Lock()
+        return manager
+
+    async def header(self):
+        tokenHeader = self._header
+        if self._expiring():
+            tokenHeader = await self.refresh(tokenHeader)
+        return tokenHeader
+
+    async def refresh(self, stale):
+        async with self._lock:
+            if self._header is stale:
+                self._set(await self._fetch())
+                self.refreshes += 1
+            return self._header
+
+
+class AsyncColecticaLowLevelAPI():
+    """Async frontend to a Colectica portal.
+
+    Use as an async context manager, which logs in and opens the connection pool:
+
+        async with AsyncColecticaLowLevelAPI(hostname, username, password) as C:
+            item = await C.get_an_item(AgencyId, Identifier)
+    """
+    def __init__(self, hostname, username, password,
+                 max_concurrency=20, pool_maxsize=100, limit_per_host=20,
+                 keep_alive=True, timeout=(10, 300), scheme="https",
+                 instrumentation_hook=None, cache=None, memo_size=4096, retry_policy=None,
+                 rate_limiter=None, concurrency_limit=None, token_refresh_margin=60, latest_ttl=None):
+        """
+            max_concurrency: maximum number of requests in flight
+            pool_maxsize: maximum number of open connections
+            limit_per_host: maximum open connections per host
+            keep_alive: set to False to close the connection after each request
+            timeout: (connect, read) timeout in seconds
+            instrumentation_hook: see api.ResponseStats
+            cache: see cache.ItemCache
+            memo_size: see api.ColecticaLowLevelAPI
+            retry_policy: see transport.RetryPolicy
+            rate_limiter: see transport.TokenBucket
+            concurrency_limit: see transport.AdaptiveConcurrencyLimit, default one adapting
+                               between 1 and max_concurrency requests in flight; not shared with a blocking client
+            token_refresh_margin: seconds before the token expires at which it is renewed
+            latest_ttl: see api.ColecticaLowLevelAPI
+        """
+        self.host = hostname
+        self.base_url = scheme + "://" + hostname
+        self.scheme = scheme
+        self._username = username
+        self._password = password
+        self.max_concurrency = max_concurrency
+        self.pool_maxsize = pool_maxsize
+        self.limit_per_host = limit_per_host
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.instrumentation_hook = instrumentation_hook
+        self.cache = cache
+        self.memo = MemoryLRU(memo_size)
+        self.latest_ttl = api.latest_ttl_of(cache, latest_ttl)
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.rate_limiter = rate_limiter
+        if concurrency_limit is None:
+            concurrency_limit = AdaptiveConcurrencyLimit(initial=min(4, max_concurrency), max_limit=max(1, max_concurrency))
+        self.concurrency_limit = concurrency_limit
+        self.token_refresh_margin = token_refresh_margin
+        self.session = None
+        self.token_manager = None
+        self.semaphore = None
+
+
+    async def open(self):
+        """
+        Open the connection pool and get a token
+        """
+        connect, read = self.timeout if self.timeout is not None else (None, None)
+        connector = aiohttp.TCPConnector(limit=self.pool_maxsize,
+                                         limit_per_host=self.limit_per_host,
+                                         force_close=not self.keep_alive,
+                                         ssl=False)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.token_manager = await AsyncTokenManager.create(
+            lambda: get_jwtToken(self.session, self.host, self._username, self._password, scheme=self.scheme),
+            refresh_margin=self.token_refresh_margin)
+        return self
+
+
+    async def close(self):
+        """
+        Close all pooled connections
+        """
+        if self.session is not None:
+            await self.session.close()
+
+
+    async def __aenter__(self):
+        return await self.open()
+
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+    async def _request(self, method, path, endpoint, jsonquery=None):
+        """
+        Send one request under the concurrency semaphore, return the decoded json or None on error
+        Failed attempts are retried following self.retry_policy, without holding the semaphore while waiting
+        Each attempt waits for self.rate_limiter and self.concurrency_limit
+        On 401 the token is renewed and the request sent again, once
+        """
+        policy = self.retry_policy
+        started = time.monotonic()
+        attempt = 0
+        reauthenticated = False
+        while True:
+            tokenHeader = await self.token_manager.header()
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+            try:
+                async with self.semaphore:
+                    await self.concurrency_limit.acquire_async()
+                    sent = time.monotonic()
+                    try:
+                        async with self.session.request(method, self.base_url + path, headers=tokenHeader, json=jsonquery) as response:
+                            status = response.status
+                            retry_after = response.headers.get('Retry-After')
+                            content = await response.read()
+                    except BaseException:
+                        await self.concurrency_limit.release_async(error=True)
+                        raise
+                    await self.concurrency_limit.release_async(time.monotonic() - sent, is_overload_status(status))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                delay = policy.next_delay(attempt, started)
+                if delay is None:
+                    policy.record_give_up(endpoint)
+                    raise
+            else:
+                if status == 401 and not reauthenticated:
+                    await self.token_manager.refresh(tokenHeader)
+                    reauthenticated = True
+                    continue
+                if not policy.should_retry_status(status):
+                    break
+                delay = policy.next_delay(attempt, started, retry_after)
+                if delay is None:
+                    policy.record_give_up(endpoint)
+                    break
+            policy.record_retry(endpoint)
+            await asyncio.sleep(delay)
+            attempt += 1
+        if status >= 400:
+            return None
+        start = time.perf_counter()
+        result = api.json_loads(content)
+        if self.instrumentation_hook is not None:
+            self.instrumentation_hook(endpoint, len(content), time.perf_counter() - start)
+        return result
+
+
+    async def _get(self, path, endpoint):
+        return await self._request("GET", path, endpoint)
+
+
+    async def _post(self, path, jsonquery, endpoint):
+        return await self._request("POST", path, endpoint, jsonquery)
+
+
+    def item_code(self, item):
+        return api.item_dict[item]
+
+
+    def item_code_inv(self, item_type_id):
+        return api.item_dict_inv[item_type_id]
+
+
+    async def _cache_call(self, fn, *args):
+        """
+        Run a cache call in the default executor: an SQLiteItemCache blocks on file I/O
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+    async def get_an_item(self, AgencyId, Identifier):
+        """
+        See api.ColecticaLowLevelAPI.get_an_item
+        """
+        memoized = self.memo.get(('item', AgencyId, Identifier))
+        if memoized is not None:
+            return memoized
+        if self.cache is not None:
+            cached = await self._cache_call(self.cache.get_item, AgencyId, Identifier)
+            if cached is not None:
+                self.memo.put(('item', AgencyId, Identifier), cached, self.latest_ttl)
+                return cached
+        result = await self._get("/api/v1/item/"+AgencyId+"/"+Identifier, "get_an_item")
+        if result != []:
+            if self.cache is not None and result is not None:
+                await self._cache_call(self.cache.put_item, result, True)
+            self.memo.put(('item', AgencyId, Identifier), result, self.latest_ttl)
+            return result
+
+
+    async def general_search(self, item_type, search_term, MaxResults=1, RankResults=True, SearchDepricatedItems=False, SearchLatestVersion=True, ResultOffset=0):
+        """
+        See api.ColecticaLowLevelAPI.general_search
+        """
+        jsonquery = api.search_json(item_type, search_term, MaxResults, RankResults, SearchDepricatedItems, SearchLatestVersion, ResultOffset)
+        return await self._post("/api/v1/_query/", jsonquery, "general_search")
+
+
+    async def search_iter(self, item_type, search_term, page_size=500, prefetch=True, **kwargs):
+        """
+        See api.ColecticaLowLevelAPI.search_iter, as an async generator
+            async for result in C.search_iter(item_type, ''):
+        """
+        def page(offset):
+            return self.general_search(item_type, search_term, MaxResults=page_size, ResultOffset=offset, **kwargs)
+
+        offset = 0
+        current = await page(offset)
+        while current is not None and current['Results'] != []:
+            offset += len(current['Results'])
+            more = offset < current['TotalResults']
+            if more and prefetch:
+                upcoming = asyncio.ensure_future(page(offset))
+            for result in current['Results']:
+                yield result
+            if not more:
+                break
+            current = await upcoming if prefetch else await page(offset)
+
+
+    async def relationship_search(self, item_type, AgencyId, Identifier, UseDistinctResultItem=True, UseDistinctTargetItem=True, Version=None):
+        """
+        See api.ColecticaLowLevelAPI.relationship_search
+        """
+        if Version is None:
+            item = await self.get_an_item(AgencyId, Identifier)
+            if item is None:
+                return None
+            Version = item['Version']
+        jsonquery = api.relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
+        result = await self._post("/api/v1/_query/relationship/bysubject/", jsonquery, "relationship_search")
+        if result != []:
+            return result
+
+
+    async def get_an_item_version(self, AgencyId, Identifier, Version):
+        """
+        See api.ColecticaLowLevelAPI.get_an_item_version
+        """
+        if self.cache is not None:
+            cached = await self._cache_call(self.cache.get_item, AgencyId, Identifier, Version)
+            if cached is not None:
+                return cached
+        result = await self._get("/api/v1/item/"+AgencyId+"/"+Identifier+"/"+str(Version), "get_an_item_version")
+        if result != []:
+            if self.cache is not None and result is not None:
+                await self._cache_call(self.cache.put_item, result)
+            return result
+
+
+    async def get_item_version_history(self, AgencyId, Identifier):
+        """
+        See api.ColecticaLowLevelAPI.get_item_version_history
+        """
+        result = await self._get("/api/v1/item/"+AgencyId+"/"+Identifier+"/history", "get_item_version_history")
+        if result != []:
+            return result
+
+
+    async def colectica_get_api(self, url, hostname=None, tokenHeader=None):
+        """
+        See api.ColecticaLowLevelAPI.colectica_get_api
+        """
+        result = await self._get("/api/v1/"+url, "colectica_get_api")
+        if result != []:
+            return result
+
+
+    async def get_item_description(self, AgencyId, Identifier, Version):
+        """
+        See api.ColecticaLowLevelAPI.get_item_description
+        """
+        result = await self._get("/api/v1/item/"+AgencyId+"/"+Identifier+"/"+str(Version)+"/description", "get_item_description")
+        if result != []:
+            return result
+
+
+    async def relationship_bysubject_descriptions(self, item_type, AgencyId, Identifier, Version, UseDistinctResultItem=True, UseDistinctTargetItem=True):
+        """
+        See api.ColecticaLowLevelAPI.relationship_bysubject_descriptions
+        """
+        jsonquery = api.relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
+        result = await self._post("/api/v1/_query/relationship/bysubject/descriptions", jsonquery, "relationship_bysubject_descriptions")
+        if result != []:
+            return result
+
+
+    async def relationship_byobject_descriptions(self, item_type, AgencyId, Identifier, Version, UseDistinctResultItem=True, UseDistinctTargetItem=True):
+        """
+        See api.ColecticaLowLevelAPI.relationship_byobject_descriptions
+        """
+        jsonquery = api.relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
+        result = await self._post("/api/v1/_query/relationship/byobject/descriptions", jsonquery, "relationship_byobject_descriptions")
+        if result != []:
+            return result
+
+
+    async def relationship_bysubject(self, item_type, AgencyId, Identifier, Version, UseDistinctResultItem=True, UseDistinctTargetItem=True):
+        """
+        See api.ColecticaLowLevelAPI.relationship_bysubject
+        """
+        jsonquery = api.relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
+        result = await self._post("/api/v1/_query/relationship/bysubject", jsonquery, "relationship_bysubject")
+        if result != []:
+            return result
+
+
+    async def relationship_byobject(self, item_type, AgencyId, Identifier, Version, UseDistinctResultItem=True, UseDistinctTargetItem=True):
+        """
+        See api.ColecticaLowLevelAPI.relationship_byobject
+        """
+        jsonquery = api.relationship_json(item_type, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
+        result = await self._post("/api/v1/_query/relationship/byobject", jsonquery, "relationship_byobject")
+        if result != []:
+            return result
+
+
+    async def relationship_query(self, targets, item_types, direction='byobject', descriptions=False, merge=True, UseDistinctResultItem=True, UseDistinctTargetItem=True):
+        """
+        See api.ColecticaLowLevelAPI.relationship_query, the targets are queried concurrently
+        """
+        method, item_types, targets, latest = api.relationship_query_plan(targets, item_types, direction, descriptions)
+        query = getattr(self, method)
+        targets = api.versioned_targets(targets, latest, await self.get_items(latest))
+
+        async def one(AgencyId, Identifier, Version):
+            if Version is None:
+                return None
+            return await query(item_types, AgencyId, Identifier, Version, UseDistinctResultItem, UseDistinctTargetItem)
+
+        results = await asyncio.gather(*[one(*t) for t in targets])
+        return api.relationship_results(results, merge)
+
+
+    async def relationship_matrix(self, AgencyId, Identifier, Version, Predicate, ReverseTraversal=True):
+        """
+        See api.ColecticaLowLevelAPI.relationship_matrix
+        """
+        jsonquery = api.matrix_json(AgencyId, Identifier, Version, Predicate, ReverseTraversal)
+        result = await self._post("/api/v1/_query/relationship/matrix", jsonquery, "relationship_matrix")
+        if result != []:
+            return result
+
+
+    async def relationship_matrix_typed(self, AgencyId, Identifier, Version, Predicate, ReverseTraversal=True):
+        """
+        See api.ColecticaLowLevelAPI.relationship_matrix_typed
+        """
+        jsonquery = api.matrix_json(AgencyId, Identifier, Version, Predicate, ReverseTraversal)
+        result = await self._post("/api/v1/_query/relationship/matrix/typed", jsonquery, "relationship_matrix_typed")
+        if result != []:
+            return result
+
+
+    async def get_a_set(self, AgencyId, Identifier, Version):
+        """
+        See api.ColecticaLowLevelAPI.get_a_set
+        """
+        result = await self._get("/api/v1/set/" + AgencyId + "/" + Identifier + "/" + str(Version), "get_a_set")
+        if result != []:
+            return result
+
+
+    async def get_a_set_typed(self, AgencyId, Identifier, Version):
+        """
+        See api.ColecticaLowLevelAPI.get_a_set_typed
+        """
+        result = await self._get("/api/v1/set/" + AgencyId + "/" + Identifier + "/" + str(Version) + "/typed", "get_a_set_typed")
+        if result != []:
+            return result
+
+
+    async def get_a_set_lasted(self, AgencyId, Identifier):
+        """
+        See api.ColecticaLowLevelAPI.get_a_set_lasted
+        """
+        result = await self._get("/api/v1/set/" + AgencyId + "/" + Identifier, "get_a_set_lasted")
+        if result != []:
+            return result
+
+
+    async def get_item_list(self, identifiers):
+        """
+        See api.ColecticaLowLevelAPI.get_item_list
+        """
+        jsonquery = {"Identifiers": [api.identifier_json(*ident) for ident in identifiers]}
+        result = await self._post("/api/v1/item/_getList", jsonquery, "get_item_list")
+        if result != []:
+            return result
+
+
+    async def get_items(self, identifiers, chunk_size=200):
+        """
+        See api.ColecticaLowLevelAPI.get_items, chunks are sent concurrently
+        """
+        identifiers = [tuple(ident) for ident in identifiers]
+        versioned = [ident for ident in identifiers if len(ident) == 3 and ident[2] is not None]
+        latest = [ident for ident in identifiers if len(ident) < 3 or ident[2] is None]
+
+        found = {}
+        if self.cache is not None:
+            cached_items = await self._cache_call(lambda: [self.cache.get_item(*ident) for ident in versioned])
+            for ident, cached in zip(versioned, cached_items):
+                if cached is not None:
+                    found[(ident[0], ident[1], str(ident[2]))] = cached
+            versioned = [ident for ident in versioned if (ident[0], ident[1], str(ident[2])) not in found]
+
+        chunk_results, latest_results = await asyncio.gather(
+            asyncio.gather(*[self.get_item_list(versioned[i:i + chunk_size]) for i in range(0, len(versioned), chunk_size)]),
+            self.get_many_items([ident[:2] for ident in latest]))
+        fetched = [item for chunk_result in chunk_results for item in chunk_result or []]
+        for item in fetched:
+            found[(item['AgencyId'], item['Identifier'], str(item['Version']))] = item
+        if self.cache is not None and fetched:
+            await self._cache_call(lambda: [self.cache.put_item(item) for item in fetched])
+        for ident, item in zip(latest, latest_results):
+            found[(ident[0], ident[1], None)] = item
+
+        return [found.get((ident[0], ident[1], str(ident[2]) if len(ident) == 3 and ident[2] is not None else None))
+                for ident in identifiers]
+
+
+    async def get_many_items(self, identifiers):
+        """
+            Get several items concurrently, in input order.
+            identifiers is a list of (AgencyId, Identifier) for the latest version
+            or (AgencyId, Identifier, Version) for a given version.
+        """
+        calls = []
+        for ident in identifiers:
+            if len(ident) == 3:
+                calls.append(self.get_an_item_version(ident[0], ident[1], ident[2]))
+            else:
+                calls.append(self.get_an_item(ident[0], ident[1]))
+        return list(await asyncio.gather(*calls))
+
+
+class AsyncColecticaObject(AsyncColecticaLowLevelAPI):
+    """Ask practical questions to Colectica, concurrently."""
+
+    async def item_to_dict(self, AgencyId, Identifier, fields=None):
+        """
+        See colectica.ColecticaObject.item_to_dict
+        """
+        key = ('dict', AgencyId, Identifier, None) if fields is None else ('dict', AgencyId, Identifier, None, tuple(fields))
+        memoized = self.memo.get(key)
+        if memoized is not None:
+            return memoized
+        d = colectica.result_to_dict(await self.get_an_item(AgencyId, Identifier), fields)
+        if d != {}:
+            self.memo.put(key, d, self.latest_ttl)
+        return d
+
+
+    async def lazy_item(self, AgencyId, Identifier):
+        """
+        See colectica.ColecticaObject.lazy_item
+        """
+        result = await self.get_an_item(AgencyId, Identifier)
+        return None if result is None else colectica.LazyItem(result)
+
+
+    async def items_to_dicts(self, identifiers):
+        """
+        See colectica.ColecticaObject.items_to_dicts, fetched concurrently
+        """
+        keys = [('dict', ident[0], ident[1], str(ident[2]) if len(ident) == 3 and ident[2] is not None else None)
+                for ident in identifiers]
+        dicts = [self.memo.get(key) for key in keys]
+        missing = [i for i, d in enumerate(dicts) if d is None]
+        for i, result in zip(missing, await self.get_items([identifiers[i] for i in missing])):
+            dicts[i] = colectica.result_to_dict(result)
+            if dicts[i] != {}:
+                self.memo.put(keys[i], dicts[i], self.latest_ttl if keys[i][3] is None else None)
+        return dicts
+
+
+    async def get_a_set_to_df(self, AgencyId, Identifier, Version):
+        """
+        See colectica.ColecticaObject.get_a_set_to_df
+        """
+        l = await self.get_a_set_typed(AgencyId, Identifier, Version)
+        return colectica.set_to_df(l, self.item_code_inv)
+
+
+    async def item_info_set(self, AgencyId, Identifier):
+        """
+        See colectica.ColecticaObject.item_info_set
+        """
+        info = await self.item_to_dict(AgencyId, Identifier)
+        df = await self.get_a_set_to_df(AgencyId, Identifier, str(info['Version']))
+        return df, info
+
+
+    async def load_instrument_graph(self, AgencyId, Identifier):
+        """
+        See colectica.ColecticaObject.load_instrument_graph, the set items are fetched concurrently
+        """
+        instrument = await self.item_to_dict(AgencyId, Identifier)
+        entries = await self.get_a_set_typed(AgencyId, Identifier, str(instrument['Version']))
+        G = colectica.InstrumentGraph(instrument, entries, await self.items_to_dicts([api.relationship_key(e) for e in entries]))
+        for missing in G.missing_levels():
+            G.add_outside(await self.items_by_key(colectica.at_version(missing, latest=True)))
+        return G
+
+
+    async def traverse(self, roots, follow=None, max_depth=None, latest=False):
+        """
+        See colectica.ColecticaObject.traverse, the items of each level are fetched concurrently
+        """
+        G = colectica.ItemGraph(roots, follow, latest)
+        for frontier in G.walk(max_depth):
+            G.add_level(await self.items_by_key(frontier))
+        return G
+
+
+    async def items_to_models(self, identifiers):
+        """
+        See colectica.ColecticaObject.items_to_models
+        """
+        return [colectica.result_to_model(result) for result in await self.get_items(identifiers)]
+
+
+    async def get_question_group_info(self, AgencyId, Identifier):
+        """
+        See colectica.ColecticaObject.get_question_group_info
+        """
+        return colectica.question_group_info(await self.get_an_item(AgencyId, Identifier))
+
+
+    async def items_by_key(self, identifiers):
+        """
+        See colectica.ColecticaObject.items_by_key
+        """
+        identifiers = colectica.distinct_identifiers(identifiers)
+        return colectica.dicts_by_key(identifiers, await self.items_to_dicts(identifiers))
+
+
+    async def get_question_all(self, AgencyId, Identifier, latest=True):
+        """
+        See colectica.ColecticaObject.get_question_all
+        """
+        return (await self.get_questions_all(AgencyId, [Identifier], latest))[0]
+
+
+    async def get_questions_all(self, AgencyId, identifiers, latest=True):
+        """
+        See colectica.ColecticaObject.get_questions_all
+        Each level (questions, instructions and code lists, categories) is one concurrent bulk fetch
+        """
+        questions = await self.items_by_key((AgencyId, Identifier) for Identifier in identifiers)
+        items = await self.items_by_key(colectica.at_version(
+            (ref for q in questions.values() for ref in colectica.question_references(q)), latest))
+        code_lists = [d for d in items.values() if d.get('ItemType') == 'Code Set']
+        items.update(await self.items_by_key(colectica.at_version(
+            (ref for d in code_lists for ref in colectica.category_references(d)), latest)))
+        questions, items = colectica.item_lookup(questions), colectica.item_lookup(items)
+        return [colectica.resolved_question_frames(questions(AgencyId, Identifier, 'question'), items) for Identifier in identifiers]
+
+
+class SyncColecticaObject():
+    """Blocking facade over AsyncColecticaObject.
+
+    Every coroutine method of AsyncColecticaObject is available as a plain method,
+    so C = SyncColecticaObject(hostname, username, password) can replace ColecticaObject.
+    Batch methods (get_items, get_many_items, items_to_dicts, get_questions_all) run concurrently.
+    """
+    def __init__(self, hostname, username, password, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._async = AsyncColecticaObject(hostname, username, password, **kwargs)
+        self._run(self._async.open())
+
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+
+    def _iterate(self, agen):
+        try:
+            while True:
+                yield self._run(agen.__anext__())
+        except StopAsyncIteration:
+            pass
+        finally:
+            self._run(agen.aclose())
+
+
+    @property
+    def token(self):
+        """
+        Current token header, see api.ColecticaLowLevelAPI.token
+        """
+        return self._run(self._async.token_manager.header())
+
+
+    def __getattr__(self, name):
+        attr = getattr(self._async, name)
+        if inspect.isasyncgenfunction(attr):
+            def blocking_iter(*args, **kwargs):
+                return self._iterate(attr(*args, **kwargs))
+            blocking_iter.__doc__ = attr.__doc__
+            return blocking_iter
+        if asyncio.iscoroutinefunction(attr):
+            def blocking(*args, **kwargs):
+                return self._run(attr(*args, **kwargs))
+            blocking.__doc__ = attr.__doc__
+            return blocking
+        return attr
+
+
+    def close(self):
+        """
+        Close the connection pool and stop the event loop
+        """
+        self._run(self._async.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    raise RuntimeError("don't run this directly")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""
+Python 3
+    Compare one connection per call (module level requests.get)
+    against the pooled session in ColecticaLowLevelAPI, using a local stub portal.
+
+    python benchmarks/connection_reuse.py --calls 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import requests
+import api
+from stub_portal import StubPortal
+
+
+def run_unpooled(portal, calls):
+    token = api.get_jwtToken(portal.hostname, 'user', 'pass', scheme='http')
+    for i in range(calls):
+        requests.get('http://' + portal.hostname + '/api/v1/item/uk.cls/' + str(i), headers=token, verify=False)
+
+
+def run_pooled(portal, calls):
+    with api.ColecticaLowLevelAPI(portal.hostname, 'user', 'pass', scheme='http') as C:
+        for i in range(calls):
+            C.get_an_item('uk.cls', str(i))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=1000)
+    args = parser.parse_args()
+
+    with StubPortal() as portal:
+        for name, fn in [('unpooled', run_unpooled), ('pooled', run_pooled)]:
+            portal.reset()
+            start = time.perf_counter()
+            fn(portal, args.calls)
+            elapsed = time.perf_counter() - start
+            print('{:<10} requests={:<6} connections={:<6} {:.2f}s ({:.0f} req/s)'.format(
+                name, portal.requests, portal.connections, elapsed, portal.requests / elapsed))
+
+
+if __name__ == '__main__':
+    main()
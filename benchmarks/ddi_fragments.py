@@ -0,0 +1,287 @@
+"""
+    Synthetic DDI 3.2 item fragments shaped like the ones the Colectica portal returns,
+    used by the benchmarks.
+"""
+
+import uuid
+import api
+
+AGENCY = 'uk.cls.mcs'
+
+FRAGMENT = ('<Fragment xmlns:r="ddi:reusable:3_2" xmlns="ddi:instance:3_2">'
+            '<{tag} isUniversallyUnique="true" versionDate="2021-03-01T12:00:00Z" xmlns="{ns}">'
+            '{body}</{tag}></Fragment>')
+
+DATACOLLECTION = 'ddi:datacollection:3_2'
+LOGICALPRODUCT = 'ddi:logicalproduct:3_2'
+
+
+def new_id(n):
+    return str(uuid.UUID(int=n))
+
+
+def identification(n, user_id=None, agency=AGENCY, version=1):
+    """
+    URN, Agency, ID, Version and an optional colectica:sourceId UserID
+    """
+    xml = ('<r:URN>urn:ddi:{a}:{i}:{v}</r:URN><r:Agency>{a}</r:Agency><r:ID>{i}</r:ID>'
+           '<r:Version>{v}</r:Version>').format(a=agency, i=new_id(n), v=version)
+    if user_id is not None:
+        xml += '<r:UserID typeOfUserID="colectica:sourceId">{}</r:UserID>'.format(user_id)
+    return xml
+
+
+def reference(tag, n, type_of_object, agency=AGENCY, version=1):
+    return ('<r:{tag}><r:Agency>{a}</r:Agency><r:ID>{i}</r:ID><r:Version>{v}</r:Version>'
+            '<r:TypeOfObject>{t}</r:TypeOfObject></r:{tag}>').format(
+                tag=tag, a=agency, i=new_id(n), v=version, t=type_of_object)
+
+
+def label(text):
+    return '<r:Label><r:Content xml:lang="en-GB">{}</r:Content></r:Label>'.format(text)
+
+
+def question(n, domain='code'):
+    """
+    Question Item fragment, domain in code, text, numeric, datetime
+    """
+    if domain == 'code':
+        response = ('<CodeDomain><r:ResponseCardinality minimumResponses="1" maximumResponses="1"/>'
+                    + reference('CodeListReference', 10 ** 6 + n, 'CodeList') + '</CodeDomain>')
+    elif domain == 'text':
+        response = ('<r:TextDomain maxLength="255">' + label('Generic text')
+                    + '<r:ResponseCardinality minimumResponses="1" maximumResponses="1"/></r:TextDomain>')
+    elif domain == 'numeric':
+        response = ('<r:NumericDomain><r:NumericTypeCode>Integer</r:NumericTypeCode>'
+                    '<r:NumberRange><r:Low isInclusive="true">0</r:Low><r:High isInclusive="true">99</r:High>'
+                    '</r:NumberRange>' + label('How many')
+                    + '<r:ResponseCardinality minimumResponses="1" maximumResponses="1"/></r:NumericDomain>')
+    else:
+        response = ('<r:DateTimeDomain><r:DateTypeCode>Date</r:DateTypeCode>' + label('Date')
+                    + '<r:ResponseCardinality minimumResponses="1" maximumResponses="1"/></r:DateTimeDomain>')
+    body = (identification(n, 'qi_{}'.format(n))
+            + '<r:UserAttributePair><r:AttributeKey>extension:Label</r:AttributeKey>'
+              '<r:AttributeValue>{{"en-GB":"Q{n}a"}}</r:AttributeValue></r:UserAttributePair>'
+            + '<QuestionItemName><r:String xml:lang="en-GB">qi_{n}</r:String></QuestionItemName>'
+            + '<QuestionText audienceLanguage="en-GB"><LiteralText><Text>How many times did you '
+              'do thing {n} in the last year?</Text></LiteralText></QuestionText>'
+            + response
+            + reference('InterviewerInstructionReference', 2 * 10 ** 6 + n, 'Instruction')).format(n=n)
+    return FRAGMENT.format(tag='QuestionItem', ns=DATACOLLECTION, body=body)
+
+
+def code_set(n, codes=5):
+    """
+    Code List fragment with codes codes, each referencing a category
+    """
+    body = identification(n, 'cs_{}'.format(n)) + label('cs_{}'.format(n))
+    for c in range(codes):
+        body += ('<Code isUniversallyUnique="true">' + identification(3 * 10 ** 6 + n * 100 + c)
+                 + reference('CategoryReference', 4 * 10 ** 6 + n * 100 + c, 'Category')
+                 + '<r:Value>{}</r:Value></Code>'.format(c + 1))
+    return FRAGMENT.format(tag='CodeList', ns=LOGICALPRODUCT, body=body)
+
+
+def category(n):
+    body = (identification(n, 'cat_{}'.format(n))
+            + '<CategoryName><r:String xml:lang="en-GB">cat_{}</r:String></CategoryName>'.format(n)
+            + label('Answer {}'.format(n)))
+    return FRAGMENT.format(tag='Category', ns=LOGICALPRODUCT, body=body)
+
+
+def instruction(n):
+    body = (identification(n, 'ii_{}'.format(n))
+            + '<InstructionText><LiteralText><Text>Read out the options</Text></LiteralText></InstructionText>')
+    return FRAGMENT.format(tag='Instruction', ns=DATACOLLECTION, body=body)
+
+
+def sequence(n, children=10):
+    body = (identification(n, 's_{}'.format(n))
+            + '<ConstructName><r:String xml:lang="en-GB">s_{}</r:String></ConstructName>'.format(n)
+            + label('Section {}'.format(n)))
+    for c in range(children):
+        body += reference('ControlConstructReference', 5 * 10 ** 6 + n * 100 + c, 'QuestionConstruct')
+    return FRAGMENT.format(tag='Sequence', ns=DATACOLLECTION, body=body)
+
+
+def question_activity(n):
+    body = (identification(n, 'qc_{}'.format(n))
+            + '<ConstructName><r:String xml:lang="en-GB">qc_{}</r:String></ConstructName>'.format(n)
+            + label('Q{}'.format(n))
+            + reference('QuestionReference', n, 'QuestionItem')
+            + '<ResponseUnit>Cohort Member</ResponseUnit>')
+    return FRAGMENT.format(tag='QuestionConstruct', ns=DATACOLLECTION, body=body)
+
+
+def statement(n):
+    body = (identification(n, 'st_{}'.format(n))
+            + '<r:UserAttributePair><r:AttributeKey>extension:Instruction</r:AttributeKey>'
+              '<r:AttributeValue>{}</r:AttributeValue></r:UserAttributePair>'
+            + '<ConstructName><r:String xml:lang="en-GB">st_{}</r:String></ConstructName>'.format(n)
+            + '<DisplayText audienceLanguage="en-GB"><LiteralText><Text>Now some questions</Text>'
+              '</LiteralText></DisplayText>')
+    return FRAGMENT.format(tag='StatementItem', ns=DATACOLLECTION, body=body)
+
+
+def conditional(n):
+    body = (identification(n, 'if_{}'.format(n))
+            + '<ConstructName><r:String xml:lang="en-GB">if_{}</r:String></ConstructName>'.format(n)
+            + '<IfCondition><r:Description><r:Content>Q{n} = 1</r:Content></r:Description>'
+              '<r:Command><r:ProgramLanguage>pseudo-code</r:ProgramLanguage>'
+              '<r:CommandContent>qc_{n} == 1</r:CommandContent></r:Command></IfCondition>'.format(n=n)
+            + reference('ThenConstructReference', 6 * 10 ** 6 + n, 'Sequence'))
+    return FRAGMENT.format(tag='IfThenElse', ns=DATACOLLECTION, body=body)
+
+
+def loop(n):
+    command = ('<r:Command><r:ProgramLanguage>pseudo-code</r:ProgramLanguage>'
+               '<r:CommandContent>{}</r:CommandContent></r:Command>')
+    body = (identification(n, 'l_{}'.format(n))
+            + '<ConstructName><r:String xml:lang="en-GB">l_{}</r:String></ConstructName>'.format(n)
+            + '<InitialValue>' + command.format('i = 1') + '</InitialValue>'
+            + '<LoopWhile>' + command.format('i &lt;= 5') + '</LoopWhile>'
+            + reference('ControlConstructReference', 7 * 10 ** 6 + n, 'Sequence'))
+    return FRAGMENT.format(tag='Loop', ns=DATACOLLECTION, body=body)
+
+
+def instrument(n, children=3):
+    body = (identification(n)
+            + '<r:UserID typeOfUserID="colectica:sourceId">inst_{n}</r:UserID>'
+              '<r:UserID typeOfUserID="closer:sourceFileName">mcs_{n}</r:UserID>'.format(n=n)
+            + '<InstrumentName><r:String xml:lang="en-GB">Instrument {}</r:String></InstrumentName>'.format(n))
+    for c in range(children):
+        body += reference('ControlConstructReference', 8 * 10 ** 6 + n * 100 + c, 'Sequence')
+    return FRAGMENT.format(tag='Instrument', ns=DATACOLLECTION, body=body)
+
+
+def question_group(n, questions=5):
+    body = (identification(n)
+            + '<QuestionGroupName><r:String xml:lang="en-GB">qg_{}</r:String></QuestionGroupName>'.format(n)
+            + label('Topic {}'.format(n))
+            + reference('ConceptReference', 9 * 10 ** 6 + n, 'Concept'))
+    for c in range(questions):
+        body += reference('QuestionItemReference', n * 100 + c, 'QuestionItem')
+    return FRAGMENT.format(tag='QuestionGroup', ns=DATACOLLECTION, body=body)
+
+
+def variable(n):
+    body = (identification(n, 'v_{}'.format(n))
+            + '<VariableName><r:String xml:lang="en-GB">V{}</r:String></VariableName>'.format(n)
+            + label('Variable {}'.format(n))
+            + reference('QuestionReference', n, 'QuestionItem')
+            + '<VariableRepresentation><CodeRepresentation><r:RecommendedDataType>Integer</r:RecommendedDataType>'
+            + reference('CodeListReference', 10 ** 6 + n, 'CodeList')
+            + '</CodeRepresentation></VariableRepresentation>')
+    return FRAGMENT.format(tag='Variable', ns=LOGICALPRODUCT, body=body)
+
+
+def question_grid(n):
+    body = (identification(n, 'qg_{}'.format(n))
+            + '<r:UserAttributePair><r:AttributeKey>extension:Label</r:AttributeKey>'
+              '<r:AttributeValue>{{"en-GB":"G{n}"}}</r:AttributeValue></r:UserAttributePair>'.format(n=n)
+            + '<QuestionGridName><r:String xml:lang="en-GB">qg_{}</r:String></QuestionGridName>'.format(n)
+            + '<QuestionText><LiteralText><Text>Grid {}</Text></LiteralText></QuestionText>'.format(n))
+    for rank in (1, 2):
+        body += ('<GridDimension rank="{}"><CodeDomain>'
+                 '<r:ResponseCardinality minimumResponses="1" maximumResponses="1"/>'.format(rank)
+                 + reference('CodeListReference', 10 ** 6 + n * 10 + rank, 'CodeList')
+                 + '</CodeDomain></GridDimension>')
+    body += ('<r:NumericDomain><r:NumericTypeCode>Integer</r:NumericTypeCode>' + label('Amount')
+             + '<r:NumberRange><r:Low>0</r:Low><r:High>10</r:High></r:NumberRange></r:NumericDomain>')
+    return FRAGMENT.format(tag='QuestionGrid', ns=DATACOLLECTION, body=body)
+
+
+# item type name: fragment builder, for the types above
+BUILDERS = {'Question': question,
+            'Code Set': code_set,
+            'Category': category,
+            'Interviewer Instruction': instruction,
+            'Sequence': sequence,
+            'Question Activity': question_activity,
+            'Statement': statement,
+            'Conditional': conditional,
+            'Loop': loop,
+            'Instrument': instrument,
+            'Question Group': question_group,
+            'Variable': variable,
+            'Question Grid': question_grid}
+
+
+def series(n, studies):
+    """
+    Series fragment referring to the studies numbered in studies
+    """
+    body = (identification(n)
+            + '<r:Citation><r:Title><r:String xml:lang="en-GB">Series {}</r:String></r:Title></r:Citation>'.format(n))
+    for st in studies:
+        body += reference('StudyUnitReference', st, 'StudyUnit')
+    return FRAGMENT.format(tag='Group', ns='ddi:group:3_2', body=body)
+
+
+def study(n, data_collection):
+    body = (identification(n)
+            + '<r:Citation><r:Title><r:String xml:lang="en-GB">Sweep {}</r:String></r:Title></r:Citation>'.format(n)
+            + '<r:Abstract><r:Content xml:lang="en-GB">Sweep {} of a cohort</r:Content></r:Abstract>'.format(n)
+            + '<KindOfData><r:String>Survey</r:String></KindOfData><r:AnalysisUnit>Individual</r:AnalysisUnit>'
+            + reference('DataCollectionReference', data_collection, 'DataCollection'))
+    return FRAGMENT.format(tag='StudyUnit', ns='ddi:studyunit:3_2', body=body)
+
+
+def data_collection(n, instrument, modes=('Interview.FaceToFace.CAPIorCAMI', 'SelfAdministeredQuestionnaire.CASI')):
+    body = (identification(n)
+            + '<r:UserAttributePair><r:AttributeKey>extension:InstrumentReferences</r:AttributeKey>'
+              '<r:AttributeValue>["urn:ddi:{}:{}:1"]</r:AttributeValue></r:UserAttributePair>'.format(AGENCY, new_id(instrument))
+            + '<DataCollectionModuleName><r:String xml:lang="en-GB">dc_{}</r:String></DataCollectionModuleName>'.format(n)
+            + '<CollectionEvent>' + identification(n + 1))
+    for m, mode in enumerate(modes):
+        body += ('<ModeOfCollection>' + identification(n + 2 + m)
+                 + '<TypeOfModeOfCollection>{}</TypeOfModeOfCollection></ModeOfCollection>'.format(mode))
+    body += '</CollectionEvent>'
+    return FRAGMENT.format(tag='DataCollection', ns=DATACOLLECTION, body=body)
+
+
+def item_result(item_type, n, xml, version=1):
+    """
+    get_an_item result of a fragment
+    """
+    return {"ItemType": api.item_dict[item_type], "AgencyId": AGENCY, "Identifier": new_id(n),
+            "Version": version, "Item": xml}
+
+
+def instrument_catalogue(questions, codes=5, statements=10, n=9 * 10 ** 7):
+    """
+    get_an_item results of a synthetic instrument n and of the items of its set:
+    questions (half CodeList, half text / numeric / datetime), their instructions,
+    code lists and categories, and statements.
+    Return (instrument result, member results)
+    """
+    domains = ['code', 'text', 'code', 'numeric', 'code', 'datetime']
+    members = []
+    for q in range(n + 1, n + 1 + questions):
+        domain = domains[q % len(domains)]
+        members.append(item_result('Question', q, question(q, domain)))
+        members.append(item_result('Interviewer Instruction', 2 * 10 ** 6 + q, instruction(2 * 10 ** 6 + q)))
+        if domain == 'code':
+            cs = 10 ** 6 + q
+            members.append(item_result('Code Set', cs, code_set(cs, codes)))
+            for c in range(codes):
+                cat = 4 * 10 ** 6 + cs * 100 + c
+                members.append(item_result('Category', cat, category(cat)))
+    for st in range(n + 1 + questions, n + 1 + questions + statements):
+        members.append(item_result('Statement', st, statement(st)))
+    return item_result('Instrument', n, instrument(n)), members
+
+
+def series_catalogue(series_count, studies=5, n=6 * 10 ** 7):
+    """
+    get_an_item results of series_count series of studies studies each, and of their studies and data collections
+    """
+    results = []
+    for s in range(series_count):
+        sn = n + s * 1000
+        sts = [sn + 10 * k for k in range(1, studies + 1)]
+        results.append(item_result('Series', sn, series(sn, sts)))
+        for st in sts:
+            results.append(item_result('Study', st, study(st, st + 1)))
+            results.append(item_result('Data Collection', st + 1, data_collection(st + 1, 9 * 10 ** 7)))
+    return results
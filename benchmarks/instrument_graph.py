@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""
+Python 3
+    Requests and time to export the questions of a synthetic instrument from the stub portal:
+    item_info_set and get_questions_all, references at their latest version (one request per item)
+    or at the version they name (latest=False, one bulk fetch per level of references),
+    against load_instrument_graph and questions_all.
+
+    python benchmarks/instrument_graph.py --questions 200
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import colectica
+import ddi_fragments
+from stub_portal import StubPortal
+
+
+def by_questions(C, agency, identifier, latest=True):
+    set_info, _ = C.item_info_set(agency, identifier)
+    questions = set_info.loc[set_info.ItemType == 'Question', 'Identifier'].tolist()
+    return C.get_questions_all(agency, questions, latest)
+
+
+def by_questions_pinned(C, agency, identifier):
+    return by_questions(C, agency, identifier, latest=False)
+
+
+def graph(C, agency, identifier):
+    return C.load_instrument_graph(agency, identifier).questions_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=200)
+    args = parser.parse_args()
+
+    instrument, members = ddi_fragments.instrument_catalogue(args.questions)
+    key = (instrument['AgencyId'], instrument['Identifier'])
+    with StubPortal(items=[instrument] + members, sets={key: members}) as portal:
+        for name, fn in [('questions', by_questions), ('pinned', by_questions_pinned), ('graph', graph)]:
+            with colectica.ColecticaObject(portal.hostname, 'user', 'password', scheme='http') as C:
+                portal.reset()
+                start = time.perf_counter()
+                frames = fn(C, *key)
+                elapsed = time.perf_counter() - start
+                print('{:<10} questions={:<5} requests={:<6} {:.2f}s'.format(name, len(frames), portal.requests, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Python 3
+    Memory held by a synthetic catalogue parsed into result_to_dict dictionaries
+    against the slotted models of result_to_model: question groups (35,952 in the portal), questions and code sets.
+    Sizes are measured with tracemalloc, after the transient parse objects are freed.
+
+    python benchmarks/item_models.py --question-groups 35952 --questions 20000 --code-sets 5000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import colectica
+import ddi_fragments
+
+
+def catalogue(question_groups, questions, code_sets):
+    """
+    get_an_item results of the catalogue
+    """
+    domains = ['code', 'text', 'numeric', 'datetime']
+    results = [ddi_fragments.item_result('Question Group', n, ddi_fragments.question_group(n, questions=1 + n % 10))
+               for n in range(question_groups)]
+    results += [ddi_fragments.item_result('Question', n, ddi_fragments.question(n, domains[n % 4]))
+                for n in range(questions)]
+    results += [ddi_fragments.item_result('Code Set', n, ddi_fragments.code_set(n, codes=2 + n % 8))
+                for n in range(code_sets)]
+    return results
+
+
+def held(fn, results):
+    """
+    Bytes allocated by fn(result) for every result and still held afterwards, and the time it took
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    parsed = [fn(result) for result in results]
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return parsed, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--question-groups', type=int, default=35952)
+    parser.add_argument('--questions', type=int, default=20000)
+    parser.add_argument('--code-sets', type=int, default=5000)
+    args = parser.parse_args()
+
+    results = catalogue(args.question_groups, args.questions, args.code_sets)
+    dicts, dict_size, dict_time = held(colectica.result_to_dict, results)
+    models, model_size, model_time = held(colectica.result_to_model, results)
+    assert all(m.to_dict() == d for m, d in zip(models, dicts))
+
+    print('items={}'.format(len(results)))
+    print('dict   {:8.1f} MB  {:6.0f} bytes/item  {:.1f}s'.format(dict_size / 1e6, dict_size / len(results), dict_time))
+    print('model  {:8.1f} MB  {:6.0f} bytes/item  {:.1f}s'.format(model_size / 1e6, model_size / len(results), model_time))
+
+
+if __name__ == '__main__':
+    main()
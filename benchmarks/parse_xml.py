@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+"""
+Python 3
+    Parse Question and Code Set fragments with the spec based colectica.parse_xml
+    against the previous hand written parsers, kept below as they were.
+    "parse" times xml text to dictionary, "lookup" times the field lookups on already parsed trees.
+
+    python benchmarks/parse_xml.py --items 5000
+"""
+import argparse
+import os
+import sys
+import time
+from io import StringIO
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import api
+import colectica
+import ddi_fragments
+
+
+def remove_xml_ns(xml):
+    it = ET.iterparse(StringIO(xml))
+    for _, el in it:
+        prefix, has_namespace, postfix = el.tag.partition('}')
+        if has_namespace:
+            el.tag = postfix  # strip all namespaces
+    root = it.root
+    return root
+
+
+def root_to_dict_question(root):
+    info = {}
+    info['QuestionURN'] = root.find('.//URN').text
+    info['QuestionUserID'] = root.find('.//UserID').text
+    QLabel = root.find('.//UserAttributePair/AttributeValue').text
+    info['QuestionLabel'] = list(eval(QLabel).values())[0]
+    info['QuestionItemName'] = root.find(".//QuestionItemName/String").text
+    if root.find(".//QuestionText/LiteralText/Text") is not None:
+        info['QuestionLiteral'] = root.find(".//QuestionText/LiteralText/Text").text
+    else:
+        info['QuestionLiteral'] = None
+    cardinality = root.find('.//ResponseCardinality')
+    car_dict = {}
+    car_dict['minimumResponses'] = cardinality.attrib['minimumResponses']
+    car_dict['maximumResponses'] = cardinality.attrib['maximumResponses']
+    info['ResponseCardinality'] = car_dict
+    response = {}
+    CodeDomain = root.find(".//CodeDomain")
+    TextDomain = root.find(".//TextDomain")
+    NumericDomain = root.find(".//NumericDomain")
+    DateTimeDomain = root.find(".//DateTimeDomain")
+    if CodeDomain is not None:
+        response['response_type'] = 'CodeList'
+        response['CodeList_Agency'] = root.find('.//CodeListReference/Agency').text
+        response['CodeList_ID'] = CodeDomain.find(".//CodeListReference/ID").text
+        response['CodeList_version'] = CodeDomain.find(".//CodeListReference/Version").text
+        response['code_list_URN'] = (':').join(['urn:ddi', response['CodeList_Agency'], response['CodeList_ID'], response['CodeList_version']])
+    elif TextDomain is not None:
+        response['response_type'] = 'Text'
+        response['response_label'] = TextDomain.find(".//Label/Content").text
+    elif NumericDomain is not None:
+        response['response_type'] = 'Numeric'
+        response['response_label'] = root.find(".//Label").text
+        response['response_NumericType'] = root.find(".//NumericTypeCode").text
+        if root.find(".//NumberRange/Low") is not None:
+            response['response_RangeLow'] = root.find(".//NumberRange/Low").text
+        else:
+            response['response_RangeLow'] = None
+        if root.find(".//NumberRange/High") is not None:
+            response['response_RangeHigh'] = root.find(".//NumberRange/High").text
+        else:
+            response['response_RangeHigh'] = None
+    elif DateTimeDomain is not None:
+        response['response_type'] = 'DateTime'
+        response['DateTypeCode'] = DateTimeDomain.find(".//DateTypeCode").text
+        response['response_label'] = DateTimeDomain.find(".//Label/Content").text
+    info['Response'] = response
+    inst_dict = {}
+    InstructionRef = root.find(".//InterviewerInstructionReference")
+    if InstructionRef is not None:
+        inst_dict['Agency'] = InstructionRef.find(".//Agency").text
+        inst_dict['ID'] = InstructionRef.find(".//ID").text
+        inst_dict['Version'] = InstructionRef.find(".//Version").text
+        inst_dict['Type'] = InstructionRef.find(".//TypeOfObject").text
+    info['Instruction'] = inst_dict
+    return info
+
+
+def root_to_dict_code_set(root):
+    info = {}
+    info['URN'] = root.find('.//URN').text
+    info['UserID'] = root.find('.//UserID').text
+    info['Label'] = root.find('.//Label/Content').text
+    codes = root.findall('.//Code')
+    code_list = []
+    for x, code in enumerate(codes):
+        code_dict={}
+        code_dict['URN'] = code.find('.//URN').text
+        code_dict['Agency'] = code.find('.//Agency').text
+        code_dict['ID'] = code.find('.//ID').text
+        code_dict['Version'] = code.find('.//Version').text
+        code_dict['Value'] = code.find('.//Value').text
+        cat_ref_dict = {}
+        cat = code.find('CategoryReference')
+        if not cat is None:
+            cat_ref_dict['Agency'] = cat.find('.//Agency').text
+            cat_ref_dict['ID'] = cat.find('.//ID').text
+            cat_ref_dict['Version'] = cat.find('.//Version').text
+            cat_ref_dict['TypeOfObject'] = cat.find('.//TypeOfObject').text
+        code_dict['CategoryReference'] = cat_ref_dict
+        code_list.append(code_dict)
+    info['Code'] = code_list
+    return info
+
+
+LEGACY = {'Question': root_to_dict_question, 'Code Set': root_to_dict_code_set}
+
+
+def legacy_parse_xml(xml, item_type):
+    return LEGACY[item_type](remove_xml_ns(xml))
+
+
+def fragments(items):
+    """
+    items Question fragments cycling through the four response domains, and as many Code Sets
+    """
+    domains = ['code', 'text', 'numeric', 'datetime']
+    questions = [ddi_fragments.question(n, domains[n % 4]) for n in range(items)]
+    code_sets = [ddi_fragments.code_set(n, codes=2 + n % 8) for n in range(items)]
+    return [('Question', questions), ('Code Set', code_sets)]
+
+
+def best_time(fn, args, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for a in args:
+            fn(*a)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=5000, help='fragments of each item type')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for item_type, xmls in fragments(args.items):
+        for xml in xmls[:50]:
+            assert legacy_parse_xml(xml, item_type) == colectica.parse_xml(xml, item_type)
+        roots = [(remove_xml_ns(xml),) for xml in xmls]
+        spec = colectica.ITEM_SPECS[api.item_dict[item_type]]
+        runs = [('legacy', legacy_parse_xml, LEGACY[item_type]), ('spec', colectica.parse_xml, spec.parse)]
+        for name, parse, lookup in runs:
+            parse_time = best_time(parse, [(xml, item_type) for xml in xmls], args.repeat)
+            lookup_time = best_time(lookup, roots, args.repeat)
+            print('{:<10} {:<8} items={:<6} parse {:.3f}s ({:.0f} items/s)  lookup {:.3f}s ({:.0f} items/s)'.format(
+                item_type, name, len(xmls), parse_time, len(xmls) / parse_time, lookup_time, len(xmls) / lookup_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""
+Python 3
+    Build the RCNIC question frame of a synthetic instrument row by row,
+    df.loc[len(df)] = row against rows.RowBuilder, doubling the number of questions up to --questions.
+    The cost per row of df.loc grows with the frame it copies, RowBuilder's stays flat.
+
+    python benchmarks/row_builder.py --questions 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd
+import colectica
+import ddi_fragments
+from rows import RowBuilder
+
+COLUMNS = ['InstrumentURN', 'Instrument', 'QuestionURN', 'QuestionLiteral', 'ResponseType', 'Response']
+
+
+def question_rows(questions):
+    domains = ['code', 'text', 'numeric', 'datetime']
+    rows = []
+    for n in range(questions):
+        item = colectica.parse_xml(ddi_fragments.question(n, domains[n % 4]), 'Question')
+        rows.append(['urn:ddi:uk.cls.mcs:instrument:1', 'Synthetic instrument', item['QuestionURN'],
+                     item['QuestionLiteral'], item['Response']['response_type'], None])
+    return rows
+
+
+def build_loc(rows):
+    df = pd.DataFrame(columns=COLUMNS)
+    for row in rows:
+        df.loc[len(df)] = row
+    return df
+
+
+def build_rows(rows):
+    builder = RowBuilder(COLUMNS)
+    for row in rows:
+        builder.append(row)
+    return builder.to_frame()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=5000)
+    args = parser.parse_args()
+
+    all_rows = question_rows(args.questions)
+    sizes = []
+    n = args.questions
+    while n >= 500:
+        sizes.insert(0, n)
+        n //= 2
+
+    for n in sizes:
+        timings = []
+        for fn in [build_loc, build_rows]:
+            start = time.perf_counter()
+            df = fn(all_rows[:n])
+            timings.append(time.perf_counter() - start)
+            assert len(df) == n
+        print('questions={:<6} loc {:.3f}s ({:.1f} us/row)  RowBuilder {:.4f}s ({:.1f} us/row)'.format(
+            n, timings[0], 1e6 * timings[0] / n, timings[1], 1e6 * timings[1] / n))
+
+
+if __name__ == '__main__':
+    main()
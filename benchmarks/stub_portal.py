@@ -0,0 +1,161 @@
+"""
+    Local stub of the Colectica portal used by the benchmarks.
+    Speaks HTTP/1.1 with keep-alive and counts the TCP connections it accepts.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stub_item(AgencyId, Identifier, Version=1, ItemType="a1bb19bd-a24a-4443-8728-a6ad80eb42b8", Item="<Fragment/>"):
+    return {"ItemType": ItemType,
+            "AgencyId": AgencyId,
+            "Identifier": Identifier,
+            "Version": Version,
+            "Item": Item}
+
+
+def get_list(payload):
+    # answer in reverse order, as the real portal does not promise input order
+    return [stub_item(i["AgencyId"], i["Identifier"], i["Version"]) for i in reversed(payload["Identifiers"])]
+
+
+def set_entry(item):
+    """
+    get_a_set_typed entry of an item
+    """
+    return {"Item1": {"Item1": item["Identifier"], "Item2": item["Version"], "Item3": item["AgencyId"]},
+            "Item2": item["ItemType"]}
+
+
+DEFAULT_ROUTES = {("POST", "/api/v1/item/_getList"): get_list}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _send_json(self, obj, status=200, headers=None):
+        if isinstance(obj, tuple):
+            # a route may answer (status, body, headers)
+            obj, status, headers = obj[1], obj[0], obj[2]
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            return json.loads(self.rfile.read(length))
+        return None
+
+    def do_POST(self):
+        payload = self._read_body()
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.last_headers = self.headers
+        time.sleep(self.server.latency)
+        route = self.server.routes.get(("POST", self.path.split("?")[0]))
+        if route is not None:
+            self._send_json(route(payload))
+        elif self.path == "/token/createtoken":
+            self._send_json({"access_token": "stub-token"})
+        else:
+            self._send_json([])
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.last_headers = self.headers
+        time.sleep(self.server.latency)
+        route = self.server.routes.get(("GET", self.path.split("?")[0]))
+        parts = self.path.strip("/").split("/")
+        if route is not None:
+            self._send_json(route(None))
+        elif parts[:3] == ["api", "v1", "item"] and (parts[3], parts[4]) in self.server.items:
+            self._send_json(self.server.items[(parts[3], parts[4])])
+        elif parts[:3] == ["api", "v1", "set"] and (parts[3], parts[4]) in self.server.sets:
+            self._send_json([set_entry(item) for item in self.server.sets[(parts[3], parts[4])]])
+        elif parts[:3] == ["api", "v1", "item"] and len(parts) >= 5:
+            self._send_json(stub_item(parts[3], parts[4], int(parts[5]) if len(parts) > 5 and parts[5].isdigit() else 1))
+        else:
+            self._send_json([])
+
+
+class StubPortal():
+    """
+    Run the stub portal on a free localhost port in a background thread.
+    items (get_an_item results) are served by the item and _getList endpoints,
+    sets ({(agency, id): [items]}) by the typed set endpoint; other items are made up.
+    Every request is answered after latency seconds.
+    """
+    def __init__(self, routes=None, items=None, sets=None, latency=0.0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.requests = 0
+        self.server.latency = latency
+        self.server.items = {(item["AgencyId"], item["Identifier"]): item for item in items or []}
+        self.server.sets = dict(sets or {})
+        self.server.routes = dict(DEFAULT_ROUTES)
+        if self.server.items:
+            self.server.routes[("POST", "/api/v1/item/_getList")] = self.get_list
+            self.server.routes[("POST", "/api/v1/_query/")] = self.search
+        self.server.routes.update(routes or {})
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def get_list(self, payload):
+        return [self.server.items.get((i["AgencyId"], i["Identifier"]), stub_item(i["AgencyId"], i["Identifier"], i["Version"]))
+                for i in reversed(payload["Identifiers"])]
+
+    def search(self, payload):
+        """
+        general_search over the items, in (AgencyId, Identifier) order, search terms ignored
+        """
+        found = sorted((key, item) for key, item in self.server.items.items() if item["ItemType"] in payload["ItemTypes"])
+        end = None if payload["MaxResults"] == 0 else payload["ResultOffset"] + payload["MaxResults"]
+        results = [{"ItemType": item["ItemType"], "AgencyId": item["AgencyId"], "Identifier": item["Identifier"],
+                    "Version": item["Version"], "ItemName": {"en-GB": item["Identifier"]}, "Label": {}}
+                   for _, item in found[payload["ResultOffset"]:end]]
+        return {"TotalResults": len(found), "Results": results}
+
+    @property
+    def hostname(self):
+        return "%s:%d" % self.server.server_address
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def reset(self):
+        with self.server.lock:
+            self.server.connections = 0
+            self.server.requests = 0
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""
+Python 3
+    Requests and time of the mode of data collection report (Series -> Study -> Data Collection)
+    over synthetic series on the stub portal, answering each request after --latency seconds:
+    an item_to_dict per study and data collection, one after the other, against ColecticaObject.traverse
+    at the latest versions (get_mode_collection) and at the referenced versions (one bulk request per level).
+
+    python benchmarks/traversal.py --series 20 --studies 5 --latency 0.02
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import colectica
+import ddi_fragments
+import get_mode_collection
+from rows import RowBuilder
+from stub_portal import StubPortal
+
+
+def serial(C):
+    # the walk get_instruments_df made before traverse
+    rows = RowBuilder(['study_name', 'instrument_name', 'instrument_urn', 'data_collection_mode'])
+    for s in get_mode_collection.get_all_series(C):
+        study_name = list(s['ItemName'].values())[0]
+        for st in C.item_to_dict(s['AgencyId'], s['Identifier'])['study']:
+            d = C.item_to_dict(st['Agency'], st['ID'])
+            c = C.item_to_dict(d['Data Collection']['Agency'], d['Data Collection']['ID'])
+            rows.append([study_name] + list(get_mode_collection.from_data_collection_get_instrument(c)))
+    return get_mode_collection.unlist_modes(rows.to_frame())
+
+
+def traverse(C):
+    return get_mode_collection.get_instruments_df(C)
+
+
+def pinned(C):
+    return get_mode_collection.get_instruments_df(C, latest=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--series', type=int, default=20)
+    parser.add_argument('--studies', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    items = ddi_fragments.series_catalogue(args.series, args.studies)
+    with StubPortal(items=items, latency=args.latency) as portal:
+        for name, fn in [('serial', serial), ('traverse', traverse), ('pinned', pinned)]:
+            with colectica.ColecticaObject(portal.hostname, 'user', 'password', scheme='http') as C:
+                portal.reset()
+                start = time.perf_counter()
+                df = fn(C)
+                elapsed = time.perf_counter() - start
+                print('{:<9} rows={:<5} requests={:<5} {:.2f}s'.format(name, len(df), portal.requests, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+    Item caches for the Colectica API
+
+    A versioned item (agency, id, version) never changes once published, so it is kept
+    for good. A "latest version" lookup (agency, id) is kept for latest_ttl seconds.
+"""
+
+import abc
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def item_key(AgencyId, Identifier, Version=None):
+    """
+    Cache key of an item, Version None for the latest version
+    """
+    if Version is None:
+        return AgencyId + "/" + Identifier
+    return AgencyId + "/" + Identifier + "/" + str(Version)
+
+
+class ItemCache(abc.ABC):
+    """
+    Interface of an item cache used by api.ColecticaLowLevelAPI(cache=...)
+
+    Subclasses store json-able values with get(key) / put(key, value, ttl).
+    """
+    def __init__(self, latest_ttl=24 * 3600):
+        """
+            latest_ttl: seconds a latest version lookup is kept, None keeps it for good
+        """
+        self.latest_ttl = latest_ttl
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def get(self, key):
+        """
+        Stored value, None on a miss or once expired
+        """
+
+    @abc.abstractmethod
+    def put(self, key, value, ttl=None):
+        """
+        Store a value, for ttl seconds or, with ttl None, for good
+        """
+
+    def get_item(self, AgencyId, Identifier, Version=None):
+        """
+        Cached get_an_item / get_an_item_version result, None on a miss
+        """
+        value = self.get(item_key(AgencyId, Identifier, Version))
+        with self._counter_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put_item(self, result, latest=False):
+        """
+        Store a get_an_item / get_an_item_version result.
+        With latest=True it also answers latest version lookups until latest_ttl expires.
+        """
+        self.put(item_key(result['AgencyId'], result['Identifier'], result['Version']), result)
+        if latest:
+            self.put(item_key(result['AgencyId'], result['Identifier']), result, ttl=self.latest_ttl)
+
+    def stats(self):
+        """
+        Return a dictionary of hits, misses and entries
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self)}
+
+
+class SQLiteItemCache(ItemCache):
+    """
+    Item cache in an SQLite file, evicting the least recently used entries above max_entries
+
+        C = ColecticaObject(hostname, username, password, cache=SQLiteItemCache('colectica_cache.sqlite'))
+
+    The number of entries is kept in memory and, once it goes over max_entries, the oldest
+    evict_batch entries go in one delete along the last_access index. Reads note their access
+    time in memory and write them to the file touch_batch at a time, or after touch_interval seconds.
+    """
+    def __init__(self, path='colectica_cache.sqlite', max_entries=1000000, latest_ttl=24 * 3600,
+                 evict_batch=1000, touch_batch=1000, touch_interval=30.0):
+        """
+            path: SQLite file, created if needed
+            max_entries: maximum number of entries kept, None for no limit
+            latest_ttl: seconds a latest version lookup is kept, None keeps it for good
+            evict_batch: entries evicted at a time once over max_entries
+            touch_batch, touch_interval: access times kept in memory before they are written
+        """
+        super().__init__(latest_ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_batch = evict_batch
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS items (
+                                  key TEXT PRIMARY KEY,
+                                  value BLOB NOT NULL,
+                                  expires REAL,
+                                  last_access REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_last_access ON items (last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        # key: last access time not written yet
+        self._touched = {}
+        self._touched_since = time.time()
+
+    def _flush_touched(self):
+        # with self._lock held
+        if self._touched:
+            self._conn.executemany("UPDATE items SET last_access = ? WHERE key = ?",
+                                   [(t, key) for key, t in self._touched.items()])
+            self._conn.commit()
+            self._touched = {}
+        self._touched_since = time.time()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires FROM items WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < now:
+                self._conn.execute("DELETE FROM items WHERE key = ?", (key,))
+                self._conn.commit()
+                self._count -= 1
+                self._touched.pop(key, None)
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= self.touch_batch or now - self._touched_since >= self.touch_interval:
+                self._flush_touched()
+        return json.loads(row[0])
+
+    def put(self, key, value, ttl=None):
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        with self._lock:
+            new = self._conn.execute("SELECT 1 FROM items WHERE key = ?", (key,)).fetchone() is None
+            self._conn.execute("INSERT OR REPLACE INTO items (key, value, expires, last_access) VALUES (?, ?, ?, ?)",
+                               (key, json.dumps(value), expires, now))
+            self._touched.pop(key, None)
+            if new:
+                self._count += 1
+            if self.max_entries is not None and self._count > self.max_entries:
+                # the access times read so far count for which entries are the oldest
+                self._flush_touched()
+                deleted = self._conn.execute("""DELETE FROM items WHERE key IN (
+                                                    SELECT key FROM items ORDER BY last_access LIMIT ?)""",
+                                             (max(self.evict_batch, self._count - self.max_entries),)).rowcount
+                self._count -= deleted
+            self._conn.commit()
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM items")
+            self._conn.commit()
+            self._count = 0
+            self._touched = {}
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.close()
+
+
+class MemoryLRU():
+    """
+    Bounded in-process least recently used memo, used for get_an_item and item_to_dict.
+    An entry put with a ttl is a miss once ttl seconds have passed, as for ItemCache.
+
+    Values are shared between callers, do not modify them.
+    """
+    def __init__(self, max_entries=4096):
+        """
+            max_entries: maximum number of entries kept, 0 disables the memo
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Memoized value, None on a miss
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, ttl=None):
+        """
+        Memoize a value, for ttl seconds or, with ttl None, until it is evicted
+        """
+        if self.max_entries <= 0 or value is None:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Return a dictionary of hits, misses and entries
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self)}
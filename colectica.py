@@ -5,13 +5,21 @@
 from io import StringIO
 import xml.etree.ElementTree as ET
 import pandas as pd
+import ast
+import functools
 import json
+import warnings
 import api
+import models
+from rows import RowBuilder
+from item_spec import (OMIT, Path, Context, parse_fragment, ItemSpec, Text, Attr, Ref, RefList, RefUrn, Group, Each, Choice,
+                       Const, Custom, child)
 
 
 def remove_xml_ns(xml):
     """
-    Read xml from string, remove namespaces, return root
+    Read xml from string, remove namespaces, return root.
+    parse_xml does not need it, it matches local names on the namespaced tree.
     """
     it = ET.iterparse(StringIO(xml))
     for _, el in it:
@@ -22,842 +30,979 @@ def remove_xml_ns(xml):
     return root
 
 
-def root_to_dict_study(root):
+_USER_IDS = Path('.//UserID')
+_USER_ATTRIBUTE_PAIRS = Path('.//UserAttributePair')
+_ATTRIBUTE_VALUES = Path('.//UserAttributePair/AttributeValue')
+_KIND_OF_DATA = Path('.//KindOfData')
+
+
+@functools.lru_cache(maxsize=65536)
+def decode_attribute(text):
     """
-    Part of parse xml, item_type = Study
+    Value of a UserAttributePair: json, else a python literal, else the text as it is.
+    Attribute values repeat across items, decoded values are memoized: do not modify them.
+    Nothing is evaluated, unlike eval.
     """
-    info = {}
-    info['URN'] = root.find('.//URN').text
-    # Sweep Description
-    sweep = {}
-    sweep['title'] = root.find('.//Citation/Title/String').text
-    sweep['principal_investigator'] = root.find('.//Citation/Creator/CreatorName/String').text
-    if root.find('.//Citation/Publisher') is not None:
-        sweep['publisher'] = root.find('.//Citation/Publisher/PublisherName/String').text
-    else:
-        sweep['publisher'] = None
-    sweep['abstract'] = root.find('.//Abstract/Content').text
-    pop = {}
-    if root.find('.//UniverseReference') is not None:
-        pop['Agency'] = root.find('.//UniverseReference/Agency').text
-        pop['ID'] = root.find('.//UniverseReference/ID').text
-        pop['Version'] = root.find('.//UniverseReference/Version').text
-        pop['Type'] = root.find('.//UniverseReference/TypeOfObject').text
-    sweep['population'] = pop
-    # custom filed
-    CustomFields = root.findall('.//UserAttributePair/AttributeValue')
-    custom_list = []
-    for x, cus in enumerate(CustomFields):
-        # Convert a string representation of a dictionary to a dictionary
-        custom_list.append(json.loads(cus.text))
-    sweep['custom_field'] = custom_list
-    info['sweep'] = sweep
-
-    # Funding
-    funding = {}
-    organization = {}
-    organization['Agency'] = root.find('.//FundingInformation/AgencyOrganizationReference/Agency').text
-    organization['ID'] = root.find('.//FundingInformation/AgencyOrganizationReference/ID').text
-    organization['Version'] = root.find('.//FundingInformation/AgencyOrganizationReference/Version').text
-    organization['Type'] = root.find('.//FundingInformation/AgencyOrganizationReference/TypeOfObject').text
-    funding['organization'] = organization
-    info['funding'] = funding
-    # TODO: Coverage
-    coverages = root.findall('.//Coverage')
-    # Data
-    data = {}
-    k = root.find('.//KindOfData')
-    data['KindOfData'] = '-'.join(item.text for item in k)
-    data['Analysis Unit'] = root.find('.//AnalysisUnit').text
-    # data files
-    datafile = {}
-    if root.find('.//PhysicalInstanceReference') is not None:
-        datafile['Agency'] = root.find('.//PhysicalInstanceReference/Agency').text
-        datafile['ID'] = root.find('.//PhysicalInstanceReference/ID').text
-        datafile['Version'] = root.find('.//PhysicalInstanceReference/Version').text
-        datafile['Type'] = root.find('.//PhysicalInstanceReference/TypeOfObject').text
-    data['Data File'] = datafile
-    info['data'] = data
-    # data collection
-    datacol = {}
-    datacol['Agency'] = root.find('.//DataCollectionReference/Agency').text
-    datacol['ID'] = root.find('.//DataCollectionReference/ID').text
-    datacol['Version'] = root.find('.//DataCollectionReference/Version').text
-    datacol['Type'] = root.find('.//DataCollectionReference/TypeOfObject').text
-    info['Data Collection'] = datacol
-    # Extra
-    metadata = {}
-    if root.find('.//RequiredResourcePackages/ResourcePackageReference') is not None:
-        metadata['Agency'] = root.find('.//RequiredResourcePackages/ResourcePackageReference/Agency').text
-        metadata['ID'] = root.find('.//RequiredResourcePackages/ResourcePackageReference/ID').text
-        metadata['Version'] = root.find('.//RequiredResourcePackages/ResourcePackageReference/Version').text
-        metadata['Type'] = root.find('.//RequiredResourcePackages/ResourcePackageReference/TypeOfObject').text
-    info['Metadata Packages'] = metadata
-    return info
-
-
-def root_to_dict_series(root):
-    """
-    Part of parse xml, item_type = Series
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return text
+
+
+def copy_value(value):
     """
-    info = {}
-    info['URN'] = root.find('.//URN').text
-    # Study Description
-    study = {}
-    study['title'] = root.find('.//Citation/Title/String').text
-    study['principal_investigator'] = root.find('.//Citation/Creator/CreatorName/String').text
-    study['publisher'] = root.find('.//Citation/Publisher/PublisherName/String').text
-    study['rights'] = root.find('.//Citation/Copyright/String').text
-    study['abstract'] = root.find('.//Abstract/Content').text
-    pop = {}
-    pop['Agency'] = root.find('.//UniverseReference/Agency').text
-    pop['ID'] = root.find('.//UniverseReference/ID').text
-    pop['Version'] = root.find('.//UniverseReference/Version').text
-    pop['Type'] = root.find('.//UniverseReference/TypeOfObject').text
-    study['population'] = pop
-    info['study'] = study
-    # Funding
-    funding = {}
-    if not root.find('.//FundingInformation/GrantNumber') is None:
-        funding['GrantNumber'] = root.find('.//FundingInformation/GrantNumber').text
-    organization = {}
-    organization['Agency'] = root.find('.//FundingInformation/AgencyOrganizationReference/Agency').text
-    organization['ID'] = root.find('.//FundingInformation/AgencyOrganizationReference/ID').text
-    organization['Version'] = root.find('.//FundingInformation/AgencyOrganizationReference/Version').text
-    organization['Type'] = root.find('.//FundingInformation/AgencyOrganizationReference/TypeOfObject').text
-    funding['organization'] = organization
-    info['funding'] = funding
-    # Studies
-    studies = root.findall('.//StudyUnitReference')
-    study_list = []
-    for x, study in enumerate(studies):
-        study_dict={}
-        study_dict['position'] = x + 1
-        study_dict['Agency'] = study.find(".//Agency").text
-        study_dict['ID'] = study.find(".//ID").text
-        study_dict['Version'] = study.find(".//Version").text
-        study_dict['Type'] = study.find(".//TypeOfObject").text
-        study_list.append(study_dict)
-    info['study'] = study_list
-    return info
-
-
-def root_to_dict_metadata_package(root):
-    """
-    Part of parse xml, item_type = Data Collection
-    """
-    info = dict([[i.attrib['typeOfUserID'].split(':')[-1], i.text] for i in root.findall('.//UserID')])
-    info['URN'] = root.find('.//URN').text
-    info['VersionResponsibility'] = root.find('.//VersionResponsibility').text
-    if not root.find('.//VersionRationale') is None:
-        info['VersionRationale'] = root.find('.//VersionRationale/RationaleDescription/String').text
-    info['Citation'] = root.find('.//Citation/Title/String').text
-    info['Purpose'] = root.find('.//Purpose/Content').text
-
-    # InterviewerInstructionSchemeReference
-    instruction_dict = {}
-    instruction_ref = root.find('.//InterviewerInstructionSchemeReference')
-    if not instruction_ref is None:
-        instruction_dict['Agency'] = instruction_ref.find(".//Agency").text
-        instruction_dict['ID'] = instruction_ref.find(".//ID").text
-        instruction_dict['Version'] = instruction_ref.find(".//Version").text
-        instruction_dict['Type'] = instruction_ref.find(".//TypeOfObject").text
-    info['InterviewerInstructionSchemeReference'] = instruction_dict
-
-    # ControlConstructSchemeReference
-    cc_dict = {}
-    cc_ref = root.find('.//ControlConstructSchemeReference')
-    if not instruction_ref is None:
-        cc_dict['Agency'] = cc_ref.find(".//Agency").text
-        cc_dict['ID'] = cc_ref.find(".//ID").text
-        cc_dict['Version'] = cc_ref.find(".//Version").text
-        cc_dict['Type'] = cc_ref.find(".//TypeOfObject").text
-    info['ControlConstructSchemeReference'] = cc_dict
-
-    # QuestionSchemeReference
-    question_all = root.findall('.//QuestionSchemeReference')
-    question_list = []
-    for question in question_all:
-        question_dict = {}
-        question_dict['Agency'] = question.find('.//Agency').text
-        question_dict['ID'] = question.find('.//ID').text
-        question_dict['Version'] = question.find('.//Version').text
-        question_dict['Type'] = question.find('.//TypeOfObject').text
-        question_list.append(question_dict)
-    info['QuestionSchemeReference'] = question_list
-
-    # CategorySchemeReference
-    category_dict = {}
-    category_ref = root.find('.//CategorySchemeReference')
-    if not instruction_ref is None:
-        category_dict['Agency'] = category_ref.find(".//Agency").text
-        category_dict['ID'] = category_ref.find(".//ID").text
-        category_dict['Version'] = category_ref.find(".//Version").text
-        category_dict['Type'] = category_ref.find(".//TypeOfObject").text
-    info['CategorySchemeReference'] = category_dict
-
-    # CodeListSchemeReference
-    code_dict = {}
-    code_ref = root.find('.//CodeListSchemeReference')
-    if not instruction_ref is None:
-        code_dict['Agency'] = code_ref.find(".//Agency").text
-        code_dict['ID'] = code_ref.find(".//ID").text
-        code_dict['Version'] = code_ref.find(".//Version").text
-        code_dict['Type'] = code_ref.find(".//TypeOfObject").text
-    info['CodeListSchemeReference'] = code_dict
-
-    # InstrumentSchemeReference
-    instrument_dict = {}
-    instrument_ref = root.find('.//InstrumentSchemeReference')
-    if not instruction_ref is None:
-        instrument_dict['Agency'] = instrument_ref.find(".//Agency").text
-        instrument_dict['ID'] = instrument_ref.find(".//ID").text
-        instrument_dict['Version'] = instrument_ref.find(".//Version").text
-        instrument_dict['Type'] = instrument_ref.find(".//TypeOfObject").text
-    info['InstrumentSchemeReference'] = instrument_dict
-
-    return info
-
-
-def root_to_dict_data_collection(root):
-    """
-    Part of parse xml, item_type = Data Collection
+    Shallow copy of a memoized dict or list, to hand out in a parsed item
     """
-    info = {}
-    print(info)
-    info['URN'] = root.find('.//URN').text
-    info['Name'] = root.find('.//DataCollectionModuleName/String').text
-    info['Label'] = root.find('.//Label/Content').text
-    # InstrumentRef
-    cus_dict = {}
-    cus = root.findall('.//UserAttributePair')
-    for item in cus:
-        k = item.find('.//AttributeKey').text.split(':')[-1]
-        v = item.find('.//AttributeValue').text.replace('[','').replace(']','').replace('"', '').replace("'","")
-        cus_dict[k] = v
-    info['Ref'] = cus_dict
-
-    # CollectionEvent
-    event = {}
-    event['URN'] = root.find('.//CollectionEvent/URN').text
-    event['Agency'] = root.find('.//CollectionEvent/Agency').text
-    event['ID'] = root.find('.//CollectionEvent/ID').text
-    event['Version'] = root.find('.//CollectionEvent/Version').text
-    # Organization Reference
-    organization_list = []
-    organization_all = root.findall('.//CollectionEvent/DataCollectorOrganizationReference')
-    for organization in organization_all:
-        OrganizationRef = {}
-        OrganizationRef['Agency'] = organization.find('.//Agency').text
-        OrganizationRef['ID'] = organization.find('.//ID').text
-        OrganizationRef['Version'] = organization.find('.//Version').text
-        OrganizationRef['Type'] = organization.find('.//TypeOfObject').text
-    event['OrganizationRef'] = organization_list
-
-    # Data Collection Date
-    DCDate = {}
-    date = root.find('.//CollectionEvent/DataCollectionDate')
-    if date.find('.//StartDate') is not None:
-        DCDate['StartDate'] = date.find('.//StartDate').text
-    elif date.find('.//EndDate') is not None:
-        DCDate['EndDate'] = date.find('.//EndDate').text
-    elif date.find('.//SimpleDate') is not None:
-        DCDate['SimpleDate'] = date.find('.//SimpleDate').text
-    event['Date'] = DCDate
-    # Mode Of Collection
-    mode_list = []
-    mode_all = root.findall('.//CollectionEvent/ModeOfCollection')
-    # list multiple types
-    for type_mode in mode_all:
-        mode_dict = {}
-        mode_dict['URN'] = type_mode.find('./URN').text
-        mode_dict['Agency'] = type_mode.find('./Agency').text
-        mode_dict['ID'] = type_mode.find('./ID').text
-        mode_dict['Version'] = type_mode.find('./Version').text
-        mode_dict['TypeOfMode'] = type_mode.find('./TypeOfModeOfCollection').text
-        mode_dict['Description'] = type_mode.find('./Description/Content').text
-        mode_list.append(mode_dict)
-    event['ModeOfCollection'] = mode_list
-    info['CollectionEvent'] = event
-    # Question Scheme Reference
-    QSR = {}
-    if root.find('.//QuestionSchemeReference') is not None:
-        QSR['Agency'] = root.find('.//QuestionSchemeReference/Agency').text
-        QSR['ID'] = root.find('.//QuestionSchemeReference/ID').text
-        QSR['Version'] = root.find('.//QuestionSchemeReference/Version').text
-        QSR['TypeOfObject'] = root.find('.//QuestionSchemeReference/TypeOfObject').text
-    info['reference'] = QSR
-    return info
-
-
-def root_to_dict_sequence(root):
-    """
-    Part of parse xml, item_type = Sequence
+    if isinstance(value, (dict, list)):
+        return value.copy()
+    return value
+
+
+def custom_fields(ctx):
     """
-    info = {}
-    info['URN'] = root.find('.//URN').text
-    info['SourceId'] = root.find('.//UserID').text
-    if root.find('.//ConstructName/String') is not None:
-        info['ConstructName'] = root.find('.//ConstructName/String').text
-    else:
-        info['ConstructName'] = None
-    if root.find('.//Label/Content') is not None:
-        info['Label'] = root.find('.//Label/Content').text
-    else:
-        info['Label'] = None
-    references = root.findall(".//ControlConstructReference")
-    ref_list = []
-    for x, ref in enumerate(references):
-        ref_dict={}
-        ref_dict['position'] = x + 1
-        ref_dict['Agency'] = ref.find(".//Agency").text
-        ref_dict['ID'] = ref.find(".//ID").text
-        ref_dict['Version'] = ref.find(".//Version").text
-        ref_dict['Type'] = ref.find(".//TypeOfObject").text
-        ref_list.append(ref_dict)
-    info['references'] = ref_list
-    return info
+    Study custom fields, each a json dictionary
+    """
+    return [copy_value(decode_attribute(el.text)) for el in _ATTRIBUTE_VALUES.all(ctx)]
+
+
+def kind_of_data(ctx):
+    return '-'.join(el.text for el in _KIND_OF_DATA.first(ctx))
 
 
-def root_to_dict_statement(root):
+def user_id_dict(ctx):
     """
-    Part of parse xml, item_type = Statement
+    UserID text keyed by the last part of its typeOfUserID
     """
-    info = {}
-    info['StatementURN'] = root.find('.//URN').text
-    info['SourceId'] = root.find('.//UserID').text
-    instruction = root.find(".//UserAttributePair/AttributeValue").text
-    if instruction == '{}':
-        info['Instruction'] = ''
-    else:
-        info['Instruction'] = instruction
-    info['Label'] = root.find(".//ConstructName/String").text
-    info['Literal'] = root.find(".//DisplayText/LiteralText/Text").text
-    return info
+    return {el.attrib['typeOfUserID'].split(':')[-1]: el.text for el in _USER_IDS.all(ctx)}
 
 
-def root_to_dict_organization(root):
+def user_id_of_type(type_of_user_id):
     """
-    Part of parse xml, item_type = Organization
+    Field: text of the first UserID of a given typeOfUserID, left out if there is none
     """
-    info = {}
-    info['URN'] = root.find('.//URN').text
-    # Nickname
-    cus_dict = {}
-    cus = root.findall('.//UserAttributePair')
-    for item in cus:
-        k = item.find('.//AttributeKey').text.split(':')[-1]
-        v = item.find('.//AttributeValue').text
-        cus_dict[k] = v
-    info['cust'] = cus_dict
-    info['Name'] = root.find('.//OrganizationIdentification/OrganizationName/String').text
-    info['Image'] = root.find('.//OrganizationIdentification/OrganizationImage/ImageLocation').text
-    info['Description'] = root.find('.//Description/Content').text
-    return info
+    def value(ctx):
+        for el in _USER_IDS.all(ctx):
+            if el.attrib.get('typeOfUserID') == type_of_user_id:
+                return el.text
+        return OMIT
+    return value
 
 
-def root_to_dict_instrument(root):
+def attribute_text(text):
     """
-    Part of parse xml, item_type = Instrument
+    A UserAttributePair value as plain text: the brackets and quotes of its json taken out,
+    so '["urn:a", "urn:b"]' gives 'urn:a, urn:b'
     """
-    info = {}
-    info['InstrumentURN'] = root.find('.//URN').text
-    if root.findall(".//*[@typeOfUserID='colectica:sourceId']") != []:
-        info['InstrumentSourceID'] = root.findall(".//*[@typeOfUserID='colectica:sourceId']")[0].text 
-    if root.findall(".//*[@typeOfUserID='closer:sourceFileName']") != []:
-        info['InstrumentLabel'] = root.findall(".//*[@typeOfUserID='closer:sourceFileName']")[0].text
-    info['InstrumentName'] = root.find(".//InstrumentName/String").text
-    if not root.find(".//ExternalInstrumentLocation") is None:
-        info['ExternalInstrumentLocation'] = root.find(".//ExternalInstrumentLocation").text
-    else:
-        info['ExternalInstrumentLocation'] = None
-    references = root.findall(".//ControlConstructReference")
-    ref_list = []
-    for x, ref in enumerate(references):
-        ref_dict={}
-        ref_dict['position'] = x + 1
-        ref_dict['Agency'] = ref.find(".//Agency").text
-        ref_dict['ID'] = ref.find(".//ID").text
-        ref_dict['Version'] = ref.find(".//Version").text
-        ref_dict['Type'] = ref.find(".//TypeOfObject").text
-        ref_list.append(ref_dict)
-    info['references'] = ref_list
-    return info
+    if text is None:
+        return None
+    return text.replace('[', '').replace(']', '').replace('"', '').replace("'", '')
 
 
-def root_to_dict_question_group(root):
+def user_attributes(as_text=False):
     """
-    Part of parse xml, item_type = Question Group
+    Field: UserAttributePair values keyed by the last part of their AttributeKey,
+    as plain text (see attribute_text) with as_text=True
     """
-    info = {}
-    info['URN'] = root.find('.//URN').text
-    if root.find('.//QuestionGroupName/String') is not None:
-        info['Name'] = root.find('.//QuestionGroupName/String').text
-    else:
-        info['Name'] = None
-    if root.find('.//Label/Content').text is not None:
-        info['Label'] = root.find('.//Label/Content').text
-    else:
-        info['Label'] = None
-
-    # Concept Reference
-    ConceptRef = {}
-    if root.find('.//ConceptReference') is not None:
-        ConceptRef['Agency'] = root.find('.//ConceptReference/Agency').text
-        ConceptRef['ID'] = root.find('.//ConceptReference/ID').text
-        ConceptRef['Version'] = root.find('.//ConceptReference/Version').text
-        ConceptRef['Type'] = root.find('.//ConceptReference/TypeOfObject').text
-    info['ConceptRef'] = ConceptRef
-    # Question Item Reference
-    QuestionItemRef = root.findall(".//QuestionItemReference")
-    QIref_list = []
-    for x, ref in enumerate(QuestionItemRef):
-        ref_dict={}
-        ref_dict['position'] = x + 1
-        ref_dict['Agency'] = ref.find(".//Agency").text
-        ref_dict['ID'] = ref.find(".//ID").text
-        ref_dict['Version'] = ref.find(".//Version").text
-        ref_dict['Type'] = ref.find(".//TypeOfObject").text
-        QIref_list.append(ref_dict)
-    info['QuestionItemRef'] = QIref_list
-    # Question Group Reference
-    QuestionGroupRef = root.findall(".//QuestionGroupReference")
-    QGref_list = []
-    for x, ref in enumerate(QuestionGroupRef):
-        ref_dict={}
-        ref_dict['position'] = x + 1
-        ref_dict['Agency'] = ref.find(".//Agency").text
-        ref_dict['ID'] = ref.find(".//ID").text
-        ref_dict['Version'] = ref.find(".//Version").text
-        ref_dict['Type'] = ref.find(".//TypeOfObject").text
-        QGref_list.append(ref_dict)
-    info['QuestionGroupRef'] = QGref_list
-    return info
-
-
-def root_to_dict_concept(root):
-    """
-    Part of parse xml, item_type = Concept
+    def value(ctx):
+        attributes = {}
+        for pair in _USER_ATTRIBUTE_PAIRS.all(ctx):
+            k = child(pair, 'AttributeKey').text.split(':')[-1]
+            v = child(pair, 'AttributeValue').text
+            attributes[k] = attribute_text(v) if as_text else v
+        return attributes
+    return value
+
+
+def statement_instruction(ctx):
+    instruction = _ATTRIBUTE_VALUES.first(ctx).text
+    return '' if decode_attribute(instruction) == {} else instruction
+
+
+def question_label(ctx):
     """
-    info = {}
-    info['URN'] = root.find('.//URN').text
-    info['VersionResponsibility'] = root.find('.//VersionResponsibility').text
-    info['VersionRationale'] = root.find('.//VersionRationale/RationaleDescription/String').text
-    info['Name'] = root.find('.//ConceptName/String').text
-    info['Label'] = root.find('.//Label/Content').text
-    return info
+    The first value of the label dictionary, e.g. {"en-GB": "Q1"}
+    """
+    QLabel = decode_attribute(_ATTRIBUTE_VALUES.first(ctx).text)
+    if isinstance(QLabel, dict):
+        return next(iter(QLabel.values()), None)
+    return QLabel
 
 
-def root_to_dict_interviewer_instruction(root):
+def data_collection_date(ctx):
     """
-    Part of parse xml, item_type = Interviewer Instruction
+    The first of StartDate, EndDate and SimpleDate of a DataCollectionDate
     """
-    info = {}
-    info['InstructionURN'] = root.find('.//URN').text
-    info['UserID'] = root.find('.//UserID').text
-    info['InstructionText'] = root.find('.//InstructionText/LiteralText/Text').text
-    return info
+    for name in ('StartDate', 'EndDate', 'SimpleDate'):
+        el = ctx.first_descendant(name)
+        if el is not None:
+            return {name: el.text}
+    return {}
+
+
+def command_fields():
+    return [('ProgramLanguage', Text('.//Command/ProgramLanguage')),
+            ('CommandContent', Text('.//Command/CommandContent'))]
+
+
+# Item types parse_xml knows, keyed by item type GUID
+ITEM_SPECS = {api.item_dict[spec.name]: spec for spec in [
+    ItemSpec('Series', [
+        ('URN', Text('.//URN')),
+        ('study', RefList('.//StudyUnitReference')),
+        ('funding', Group('.//FundingInformation', [
+            ('GrantNumber', Text('./GrantNumber', omit=True)),
+            ('organization', Ref('./AgencyOrganizationReference'))])),
+    ]),
+    ItemSpec('Study', [
+        ('URN', Text('.//URN')),
+        ('sweep', Group(None, [
+            ('title', Text('.//Citation/Title/String')),
+            ('principal_investigator', Text('.//Citation/Creator/CreatorName/String')),
+            ('publisher', Text('.//Citation/Publisher/PublisherName/String')),
+            ('abstract', Text('.//Abstract/Content')),
+            ('population', Ref('.//UniverseReference')),
+            ('custom_field', Custom(custom_fields))])),
+        ('funding', Group('.//FundingInformation', [
+            ('organization', Ref('./AgencyOrganizationReference'))])),
+        ('data', Group(None, [
+            ('KindOfData', Custom(kind_of_data)),
+            ('Analysis Unit', Text('.//AnalysisUnit')),
+            ('Data File', Ref('.//PhysicalInstanceReference'))])),
+        ('Data Collection', Ref('.//DataCollectionReference')),
+        ('Metadata Packages', Ref('.//RequiredResourcePackages/ResourcePackageReference')),
+    ]),
+    ItemSpec('Metadata Package', [
+        (None, Custom(user_id_dict)),
+        ('URN', Text('.//URN')),
+        ('VersionResponsibility', Text('.//VersionResponsibility')),
+        ('VersionRationale', Text('.//VersionRationale/RationaleDescription/String', omit=True)),
+        ('Citation', Text('.//Citation/Title/String')),
+        ('Purpose', Text('.//Purpose/Content')),
+        ('InterviewerInstructionSchemeReference', Ref('.//InterviewerInstructionSchemeReference')),
+        ('ControlConstructSchemeReference', Ref('.//ControlConstructSchemeReference')),
+        ('QuestionSchemeReference', RefList('.//QuestionSchemeReference', position=False)),
+        ('CategorySchemeReference', Ref('.//CategorySchemeReference')),
+        ('CodeListSchemeReference', Ref('.//CodeListSchemeReference')),
+        ('InstrumentSchemeReference', Ref('.//InstrumentSchemeReference')),
+    ]),
+    ItemSpec('Data Collection', [
+        ('URN', Text('.//URN')),
+        ('Name', Text('.//DataCollectionModuleName/String')),
+        ('Label', Text('.//Label/Content')),
+        ('Ref', Custom(user_attributes(as_text=True))),
+        ('CollectionEvent', Group('.//CollectionEvent', [
+            ('URN', Text('./URN')),
+            ('Agency', Text('./Agency')),
+            ('ID', Text('./ID')),
+            ('Version', Text('./Version')),
+            ('OrganizationRef', RefList('./DataCollectorOrganizationReference', position=False)),
+            ('Date', Group('./DataCollectionDate', [(None, Custom(data_collection_date))])),
+            ('ModeOfCollection', Each('./ModeOfCollection', [
+                ('URN', Text('./URN')),
+                ('Agency', Text('./Agency')),
+                ('ID', Text('./ID')),
+                ('Version', Text('./Version')),
+                ('TypeOfMode', Text('./TypeOfModeOfCollection')),
+                ('Description', Text('./Description/Content'))])),
+        ])),
+        ('reference', Ref('.//QuestionSchemeReference', type_key='TypeOfObject')),
+    ]),
+    ItemSpec('Sequence', [
+        ('URN', Text('.//URN')),
+        ('SourceId', Text('.//UserID')),
+        ('ConstructName', Text('.//ConstructName/String')),
+        ('Label', Text('.//Label/Content')),
+        ('references', RefList('.//ControlConstructReference')),
+    ]),
+    ItemSpec('Statement', [
+        ('StatementURN', Text('.//URN')),
+        ('SourceId', Text('.//UserID')),
+        ('Instruction', Custom(statement_instruction)),
+        ('Label', Text('.//ConstructName/String')),
+        ('Literal', Text('.//DisplayText/LiteralText/Text')),
+    ]),
+    ItemSpec('Organization', [
+        ('URN', Text('.//URN')),
+        ('cust', Custom(user_attributes())),
+        ('Name', Text('.//OrganizationIdentification/OrganizationName/String')),
+        ('Image', Text('.//OrganizationIdentification/OrganizationImage/ImageLocation')),
+        ('Description', Text('.//Description/Content')),
+    ]),
+    ItemSpec('Instrument', [
+        ('InstrumentURN', Text('.//URN')),
+        ('InstrumentSourceID', Custom(user_id_of_type('colectica:sourceId'))),
+        ('InstrumentLabel', Custom(user_id_of_type('closer:sourceFileName'))),
+        ('InstrumentName', Text('.//InstrumentName/String')),
+        ('ExternalInstrumentLocation', Text('.//ExternalInstrumentLocation')),
+        ('references', RefList('.//ControlConstructReference')),
+    ]),
+    ItemSpec('Question Group', [
+        ('URN', Text('.//URN')),
+        ('Name', Text('.//QuestionGroupName/String')),
+        ('Label', Text('.//Label/Content')),
+        ('ConceptRef', Ref('.//ConceptReference')),
+        ('QuestionItemRef', RefList('.//QuestionItemReference')),
+        ('QuestionGroupRef', RefList('.//QuestionGroupReference')),
+    ]),
+    ItemSpec('Concept', [
+        ('URN', Text('.//URN')),
+        ('VersionResponsibility', Text('.//VersionResponsibility')),
+        ('VersionRationale', Text('.//VersionRationale/RationaleDescription/String')),
+        ('Name', Text('.//ConceptName/String')),
+        ('Label', Text('.//Label/Content')),
+    ]),
+    ItemSpec('Question', [
+        ('QuestionURN', Text('.//URN')),
+        ('QuestionUserID', Text('.//UserID')),
+        ('QuestionLabel', Custom(question_label)),
+        ('QuestionItemName', Text('.//QuestionItemName/String')),
+        ('QuestionLiteral', Text('.//QuestionText/LiteralText/Text')),
+        ('ResponseCardinality', Group('.//ResponseCardinality', [
+            ('minimumResponses', Attr(None, 'minimumResponses')),
+            ('maximumResponses', Attr(None, 'maximumResponses'))])),
+        ('Response', Choice([
+            ('.//CodeDomain', [
+                ('response_type', Const('CodeList')),
+                ('CodeList_Agency', Text('.//CodeListReference/Agency', root=True)),
+                ('CodeList_ID', Text('.//CodeListReference/ID')),
+                ('CodeList_version', Text('.//CodeListReference/Version')),
+                ('code_list_URN', RefUrn('.//CodeListReference'))]),
+            ('.//TextDomain', [
+                ('response_type', Const('Text')),
+                ('response_label', Text('.//Label/Content'))]),
+            ('.//NumericDomain', [
+                ('response_type', Const('Numeric')),
+                ('response_label', Text('.//Label', root=True)),
+                ('response_NumericType', Text('.//NumericTypeCode', root=True)),
+                ('response_RangeLow', Text('.//NumberRange/Low', root=True)),
+                ('response_RangeHigh', Text('.//NumberRange/High', root=True))]),
+            ('.//DateTimeDomain', [
+                ('response_type', Const('DateTime')),
+                ('DateTypeCode', Text('.//DateTypeCode')),
+                ('response_label', Text('.//Label/Content'))]),
+        ])),
+        ('Instruction', Ref('.//InterviewerInstructionReference')),
+    ]),
+    ItemSpec('Question Grid', [
+        ('QuestionGridURN', Text('.//URN')),
+        ('QuestionGridUserID', Text('.//UserID')),
+        ('QuestionGridLabel', Text('.//UserAttributePair/AttributeValue')),
+        ('QuestionGridName', Text('.//QuestionGridName/String')),
+        ('QuestionGridLiteral', Text('.//QuestionText/LiteralText/Text')),
+        ('GridDimension', Each('.//GridDimension', [
+            ('rank', Attr(None, 'rank')),
+            (None, Group('.//CodeDomain/ResponseCardinality', [
+                ('minimumResponses', Attr(None, 'minimumResponses')),
+                ('maximumResponses', Attr(None, 'maximumResponses'))])),
+            ('CodeListReference', Ref('.//CodeDomain/CodeListReference', type_key='TypeOfObject'))])),
+        ('NumericDomain', Group('.//NumericDomain', [
+            ('NumericTypeCode', Text('.//NumericTypeCode', root=True)),
+            ('Content', Text('.//Label/Content', root=True)),
+            ('NumberRangeLow', Text('.//NumberRange/Low')),
+            ('NumberRangeHigh', Text('.//NumberRange/High'))])),
+    ]),
+    ItemSpec('Code Set', [
+        ('URN', Text('.//URN')),
+        ('UserID', Text('.//UserID')),
+        ('Label', Text('.//Label/Content')),
+        ('Code', Each('.//Code', [
+            ('URN', Text('./URN')),
+            ('Agency', Text('./Agency')),
+            ('ID', Text('./ID')),
+            ('Version', Text('./Version')),
+            ('Value', Text('./Value')),
+            ('CategoryReference', Ref('CategoryReference', type_key='TypeOfObject'))])),
+    ]),
+    ItemSpec('Interviewer Instruction', [
+        ('InstructionURN', Text('.//URN')),
+        ('UserID', Text('.//UserID')),
+        ('InstructionText', Text('.//InstructionText/LiteralText/Text')),
+    ]),
+    ItemSpec('Category', [
+        ('URN', Text('.//URN')),
+        ('UserID', Text('.//UserID')),
+        ('Name', Text('.//CategoryName/String')),
+        ('Label', Text('.//Label/Content')),
+    ]),
+    ItemSpec('Question Activity', [
+        ('URN', Text('.//QuestionConstruct/URN')),
+        ('UserID', Text('.//QuestionConstruct/UserID')),
+        ('ConstructName', Text('.//QuestionConstruct/ConstructName/String')),
+        ('Label', Text('.//QuestionConstruct/Label/Content')),
+        ('ResponseUnit', Text('.//QuestionConstruct/ResponseUnit')),
+        ('QuestionReference', Ref('.//QuestionConstruct/QuestionReference', type_key='TypeOfObject', omit=True)),
+    ]),
+    ItemSpec('Variable', [
+        ('URN', Text('.//Variable/URN')),
+        ('UserID', Text('.//Variable/UserID')),
+        ('VariableName', Text('.//Variable/VariableName/String')),
+        ('Label', Text('.//Variable/Label/Content')),
+        ('QuestionReference', Ref('.//Variable/QuestionReference', type_key='TypeOfObject', omit=True)),
+        ('CodeRepresentation', Group('.//Variable/VariableRepresentation/CodeRepresentation', [
+            ('RecommendedDataType', Text('.//RecommendedDataType')),
+            ('CodeListReference', Ref('.//CodeListReference', type_key='TypeOfObject'))])),
+    ]),
+    ItemSpec('Conditional', [
+        ('URN', Text('.//IfThenElse/URN')),
+        ('UserID', Text('.//IfThenElse/UserID')),
+        ('ConstructName', Text('.//IfThenElse/ConstructName/String')),
+        ('IfCondition', Group('.//IfThenElse/IfCondition', [
+            ('Description', Text('.//Description/Content'))] + command_fields())),
+        ('IfThenReference', RefList('.//ThenConstructReference', type_key='TypeOfObject', position=False)),
+    ]),
+    ItemSpec('Loop', [
+        ('URN', Text('.//Loop/URN')),
+        ('UserID', Text('.//Loop/UserID')),
+        ('ConstructName', Text('.//Loop/ConstructName/String')),
+        ('InitialValue', Group('.//Loop/InitialValue', command_fields())),
+        ('LoopWhile', Group('.//Loop/LoopWhile', command_fields())),
+        ('ControlConstructReference', Ref('.//Loop/ControlConstructReference', type_key='TypeOfObject')),
+    ]),
+]}
+
+
+def parse_xml(xml, item_type, fields=None):
+    """
+    Used for parsing Item value
+    item_type is an item type GUID, or one of the names:
+        - Series
+        - Study
+        - Metadata Package
+        - Data Collection
+        - Sequence
+        - Statement
+        - Organization
+        - Instrument
+        - Question Group
+        - Concept
+        - Question
+        - Question Grid
+        - Code Set
+        - Interviewer Instruction
+        - Category
+        - Question Activity
+        - Variable
+        - Conditional
+        - Loop
+    xml is the Item text, str or bytes.
+    fields: keys to parse, e.g. ['QuestionURN', 'QuestionLiteral'], the other fields are skipped
+    (keys the item does not have are left out). By default all fields are parsed.
+    Other item types give {}
+    """
+    spec = ITEM_SPECS.get(api.item_dict.get(item_type, item_type))
+    if spec is None:
+        return {}
+    return spec.parse(parse_fragment(xml), fields)
 
 
-def root_to_dict_question(root):
+def result_to_dict(result, fields=None):
     """
-    Part of parse xml, item_type = Question
+    Flat out a get_an_item result: item type name, identification and the parsed Item xml
+    fields: only parse these keys of the Item, see parse_xml
+    Return a dictionary
     """
+    if result is None:
+        return {}
     info = {}
-    info['QuestionURN'] = root.find('.//URN').text
-    info['QuestionUserID'] = root.find('.//UserID').text
-    QLabel = root.find('.//UserAttributePair/AttributeValue').text
-    info['QuestionLabel'] = list(eval(QLabel).values())[0]
-    info['QuestionItemName'] = root.find(".//QuestionItemName/String").text
-    if root.find(".//QuestionText/LiteralText/Text") is not None:
-        info['QuestionLiteral'] = root.find(".//QuestionText/LiteralText/Text").text
-    else:
-        info['QuestionLiteral'] = None
-    # ResponseCardinality
-    cardinality = root.find('.//ResponseCardinality')
-    car_dict = {}
-    car_dict['minimumResponses'] = cardinality.attrib['minimumResponses']
-    car_dict['maximumResponses'] = cardinality.attrib['maximumResponses']
-    info['ResponseCardinality'] = car_dict
-    # response
-    response = {}
-    CodeDomain = root.find(".//CodeDomain")
-    TextDomain = root.find(".//TextDomain")
-    NumericDomain = root.find(".//NumericDomain")
-    DateTimeDomain = root.find(".//DateTimeDomain")
-    if CodeDomain is not None:
-        response['response_type'] = 'CodeList'
-        response['CodeList_Agency'] = root.find('.//CodeListReference/Agency').text
-        response['CodeList_ID'] = CodeDomain.find(".//CodeListReference/ID").text
-        response['CodeList_version'] = CodeDomain.find(".//CodeListReference/Version").text
-        response['code_list_URN'] = (':').join(['urn:ddi', response['CodeList_Agency'], response['CodeList_ID'], response['CodeList_version']])
-    elif TextDomain is not None:
-        response['response_type'] = 'Text'
-        response['response_label'] = TextDomain.find(".//Label/Content").text
-    elif NumericDomain is not None:
-        response['response_type'] = 'Numeric'
-        response['response_label'] = root.find(".//Label").text
-        response['response_NumericType'] = root.find(".//NumericTypeCode").text
-        if root.find(".//NumberRange/Low") is not None:
-            response['response_RangeLow'] = root.find(".//NumberRange/Low").text
-        else:
-            response['response_RangeLow'] = None
-        if root.find(".//NumberRange/High") is not None:
-            response['response_RangeHigh'] = root.find(".//NumberRange/High").text
+    item_info = None
+    for k, v in result.items():
+        if k == 'ItemType':
+            info[k] = api.item_dict_inv[v]
+        elif k == 'Item':
+            item_info = parse_xml(v, result['ItemType'], fields)
         else:
-            response['response_RangeHigh'] = None
-    elif DateTimeDomain is not None:
-        response['response_type'] = 'DateTime'
-        response['DateTypeCode'] = DateTimeDomain.find(".//DateTypeCode").text
-        response['response_label'] = DateTimeDomain.find(".//Label/Content").text
+            info[k] = v
+    return {**info, **item_info}
 
-    info['Response'] = response
 
-    # InterviewerInstructionReference
-    inst_dict = {}
-    InstructionRef = root.find(".//InterviewerInstructionReference")
-    if InstructionRef is not None:
-        inst_dict['Agency'] = InstructionRef.find(".//Agency").text
-        inst_dict['ID'] = InstructionRef.find(".//ID").text
-        inst_dict['Version'] = InstructionRef.find(".//Version").text
-        inst_dict['Type'] = InstructionRef.find(".//TypeOfObject").text
-    info['Instruction'] = inst_dict
-    return info
+def question_group_info(question_group):
+    """
+    UserID, label, item name and literal of a get_an_item result, see ColecticaObject.get_question_group_info
+    """
+    root = remove_xml_ns(question_group["Item"])
+
+    question = {}
+    for k, v in question_group.items():
+        if k == 'ItemType':
+            question[k] = api.item_dict_inv[v]
+        elif k == 'Item':
+            question['UserID'] = root.find(".//UserID").text
+            question['QuestionLabel'] = root.find(".//UserAttributePair/AttributeValue").text
+            question['QuestionItemName'] = root.find(".//QuestionItemName/String").text
+            question['QuestionLiteral'] = root.find(".//QuestionText/LiteralText/Text").text
+        else:
+            question[k] = v
+    return question
 
 
-def root_to_dict_question_grid(root):
+class LazyItem():
     """
-    Part of parse xml, item_type = Question Grid
+    A get_an_item result whose Item xml is parsed on first access to one of its fields,
+    each field read once and memoized. For callers that need a few fields of many items.
+
+        item = C.lazy_item(AgencyId, Identifier)
+        item['QuestionURN'], item['QuestionItemName']
+
+    The result keys (ItemType name, AgencyId, Identifier, Version, ...) need no parsing.
+    to_dict() gives the result_to_dict dictionary.
     """
-    info = {}
-    info['QuestionGridURN'] = root.find('.//URN').text
-    info['QuestionGridUserID'] = root.find('.//UserID').text
-    info['QuestionGridLabel'] = root.find(".//UserAttributePair/AttributeValue").text
-    info['QuestionGridName'] = root.find('.//QuestionGridName/String').text
-    info['QuestionGridLiteral'] = root.find('.//QuestionText/LiteralText/Text').text
-
-    # GridDimension
-    GridDimension = root.findall('.//GridDimension')
-    grid_dimension_list = []
-    for x, dim in enumerate(GridDimension):
-        dim_dict={}
-        dim_dict['rank'] = dim.attrib['rank']
-        ResponseCardinality = dim.find('.//CodeDomain/ResponseCardinality')
-        dim_dict['minimumResponses'] = ResponseCardinality.attrib['minimumResponses']
-        dim_dict['maximumResponses'] = ResponseCardinality.attrib['maximumResponses']
-
-        code_ref_dict = {}
-        code_ref = dim.find('.//CodeDomain/CodeListReference')
-        if not code_ref is None:
-            code_ref_dict['Agency'] = code_ref.find('.//Agency').text
-            code_ref_dict['ID'] = code_ref.find('.//ID').text
-            code_ref_dict['Version'] = code_ref.find('.//Version').text
-            code_ref_dict['TypeOfObject'] = code_ref.find('.//TypeOfObject').text
-
-        dim_dict['CodeListReference'] = code_ref_dict
-        grid_dimension_list.append(dim_dict)
-
-    info['GridDimension'] = grid_dimension_list
-
-    num_domain_dict = {}
-    NumericDomain = root.find('.//NumericDomain')
-    if not NumericDomain is None:
-        num_domain_dict['NumericTypeCode'] = root.find(".//NumericTypeCode").text
-        num_domain_dict['Content'] = root.find(".//Label/Content").text
-
-        if NumericDomain.find(".//NumberRange/Low") is not None:
-            num_domain_dict['NumberRangeLow'] = NumericDomain.find(".//NumberRange/Low").text
-        else:
-            num_domain_dict['NumberRangeLow'] = None
-        if NumericDomain.find(".//NumberRange/High") is not None:
-            num_domain_dict['NumberRangeHigh'] = NumericDomain.find(".//NumberRange/High").text
+    __slots__ = ('result', 'spec', '_context', '_values')
+
+    def __init__(self, result):
+        self.result = result
+        self.spec = ITEM_SPECS.get(result['ItemType'])
+        self._context = None
+        self._values = {'ItemType': api.item_dict_inv[result['ItemType']]}
+
+    def _field(self, key):
+        if self.spec is None:
+            return OMIT
+        if self._context is None:
+            # a few lookups scan the tree faster than indexing it
+            self._context = Context(parse_fragment(self.result['Item']), indexed=False)
+        return self.spec.value(self._context, key)
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        if key in self.result and key != 'Item' and (self.spec is None or key not in self.spec.keyed):
+            value = self.result[key]
         else:
-            num_domain_dict['NumberRangeHigh'] = None
+            value = self._field(key)
+            if value is OMIT:
+                raise KeyError(key)
+        self._values[key] = value
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key, OMIT) is not OMIT
+
+    @property
+    def key(self):
+        """
+        (AgencyId, Identifier)
+        """
+        return (self.result['AgencyId'], self.result['Identifier'])
+
+    def to_dict(self):
+        return result_to_dict(self.result)
 
-    info['NumericDomain'] = num_domain_dict
 
-    return info
+# compact slotted model of each item type in ITEM_SPECS, see models.py
+ITEM_MODELS = {guid: models.item_model_class(spec) for guid, spec in ITEM_SPECS.items()}
 
 
-def root_to_dict_code_set(root):
+def result_to_model(result):
     """
-    Part of parse xml, item_type = Code Set
+    result_to_dict as a slotted models.ItemModel, to_dict() gives the dictionary back
+    Return None for a missing result or an item type without a spec
     """
-    info = {}
-    info['URN'] = root.find('.//URN').text
-    info['UserID'] = root.find('.//UserID').text
-    info['Label'] = root.find('.//Label/Content').text
-
-    # Codes
-    codes = root.findall('.//Code')
-    code_list = []
-    for x, code in enumerate(codes):
-        code_dict={}
-        code_dict['URN'] = code.find('.//URN').text
-        code_dict['Agency'] = code.find('.//Agency').text
-        code_dict['ID'] = code.find('.//ID').text
-        code_dict['Version'] = code.find('.//Version').text
-        code_dict['Value'] = code.find('.//Value').text
-
-        cat_ref_dict = {}
-        cat = code.find('CategoryReference')
-        if not cat is None:
-            cat_ref_dict['Agency'] = cat.find('.//Agency').text
-            cat_ref_dict['ID'] = cat.find('.//ID').text
-            cat_ref_dict['Version'] = cat.find('.//Version').text
-            cat_ref_dict['TypeOfObject'] = cat.find('.//TypeOfObject').text
-        code_dict['CategoryReference'] = cat_ref_dict
-        code_list.append(code_dict)
-    info['Code'] = code_list
-
-    return info
-
-
-def root_to_dict_category(root):
-    """
-    Part of parse xml, item_type = Category
+    if result is None or result['ItemType'] not in ITEM_MODELS:
+        return None
+    return ITEM_MODELS[result['ItemType']].from_dict(result_to_dict(result))
+
+
+def question_frames(question_info, instruction_dict, code_result, category_dicts):
     """
-    info = {}
-    info['URN'] = root.find('.//URN').text
-    info['UserID'] = root.find('.//UserID').text
-    info['Name'] = root.find('.//CategoryName/String').text
-    if not root.find('.//Label/Content') is None:
-        info['Label'] = root.find('.//Label/Content').text
+    From a parsed question and its already fetched references, return question info and it's response
+        instruction_dict: parsed Interviewer Instruction, or None
+        code_result: parsed Code Set for a CodeList question, or None
+        category_dicts: parsed Category for each code in code_result['Code']
+    """
+    if question_info['Response']== {}:
+        QI_response_type = None
     else:
-        info['Label'] = None
-    return info
+        QI_response_type = question_info['Response']['response_type']
+    question_data = [ [ question_info['QuestionURN'],
+                        question_info['QuestionUserID'],
+                        question_info['QuestionLabel'],
+                        question_info['QuestionItemName'],
+                        question_info['QuestionLiteral'],
+                        QI_response_type ] ]
+
+    df_question = pd.DataFrame(question_data,
+                               columns=['QuestionURN', 'QuestionUserID', 'QuestionLabel', 'QuestionItemName', 
+                                        'QuestionLiteral', 'response_type'])
+
+    # instruction
+    if instruction_dict is not None:
+        df_question['Instruction_URN'] = instruction_dict['InstructionURN']
+        df_question['Instruction'] = instruction_dict['InstructionText']
+    else:
+        df_question['Instruction_URN'] = None
+        df_question['Instruction'] = None
+
+    if QI_response_type == 'CodeList':
+        code_list_sourceId = code_result['UserID']
+        code_list_label = code_result['Label']
+
+        code_list = code_result['Code']
+        rows = RowBuilder(['response_type', 'Value', 'Name', 'ID', 'Label'])
+        for c, category_dict in zip(code_list, category_dicts):
+            rows.append(['CodeList', c['Value'], category_dict['Name'], category_dict['UserID'], category_dict['Label']])
+        df = rows.to_frame()
+
+        df['code_list_URN'] = question_info['Response']['code_list_URN']
+        df['code_list_sourceId'] = code_list_sourceId
+        df['code_list_label'] = code_list_label
+        df['Order'] = df.index + 1
+        df['QuestionURN'] = question_info['QuestionURN']
+        df['QuestionItemName'] = question_info['QuestionItemName']
+
+        df_question['response'] = code_list_label
+        df_question['response_domain'] = question_info['Response']['code_list_URN']
+
+    elif QI_response_type == 'Text':
+        data = [ [ question_info['QuestionURN'],
+                   question_info['QuestionItemName'],
+                   question_info['Response']['response_type'],
+                   question_info['Response']['response_label'] ] ]
+        df = pd.DataFrame(data, columns=['QuestionURN', 'QuestionItemName', 'response_type', 'Label'])
+
+        df_question['response'] = question_info['Response']['response_label']
+
+    elif QI_response_type == 'Numeric':
+        data = [ [ question_info['QuestionURN'],
+                   question_info['QuestionItemName'], 
+                   question_info['Response']['response_type'], 
+                   question_info['Response']['response_label'],
+                   question_info['Response']['response_NumericType'],
+                   question_info['Response']['response_RangeLow'],
+                   question_info['Response']['response_RangeHigh'] ] ]
+        df = pd.DataFrame(data, columns=['QuestionURN', 'QuestionItemName', 'response_type', 'Label', 'response_NumericType', 'response_RangeLow', 'response_RangeHigh'])
+
+        df_question['response'] = question_info['Response']['response_label']
+
+    elif QI_response_type == 'DateTime':
+        data = [ [ question_info['QuestionURN'],
+                   question_info['QuestionItemName'],
+                   question_info['Response']['response_type'],
+                   question_info['Response']['response_label'],
+                   question_info['Response']['DateTypeCode'] ] ]
+        df = pd.DataFrame(data, columns=['QuestionURN', 'QuestionItemName', 'response_type', 'Label', 'DateTypeCode'])
+
+        df_question['response'] = question_info['Response']['response_label']
 
+    else:
+        print(QI_response_type)
+        print(question_info['Response'])
+        df = pd.DataFrame()
 
-def root_to_dict_question_activity(root):
+    return df_question, df
+
+
+def set_to_df(entries, item_code_inv=None):
     """
-    Part of parse xml, item_type = Question Activity
+    DataFrame of get_a_set_typed entries: ItemType (name), Identifier, AgencyId, Version
     """
-    info = {}
-    info['URN'] = root.find('.//QuestionConstruct/URN').text
-    info['UserID'] = root.find('.//QuestionConstruct/UserID').text
-    info['ConstructName'] = root.find('.//QuestionConstruct/ConstructName/String').text
-    info['Label'] = root.find('.//QuestionConstruct/Label/Content').text
-    info['ResponseUnit'] = root.find('.//QuestionConstruct/ResponseUnit').text
+    item_code_inv = item_code_inv or api.item_dict_inv.get
+    df = pd.DataFrame(
+         [item_code_inv(e["Item2"]), e["Item1"]["Item1"], e["Item1"]["Item3"], e["Item1"]["Item2"]] for e in entries
+     )
+    df.columns = ["ItemType", "Identifier", "AgencyId", "Version"]
+    return df
 
-    # QuestionReference
-    QuestionReference = root.find('.//QuestionConstruct/QuestionReference')
-    question_ref_dict = {}
-    if not QuestionReference is None:
-        question_ref_dict['Agency'] = QuestionReference.find('.//Agency').text
-        question_ref_dict['ID'] = QuestionReference.find('.//ID').text
-        question_ref_dict['Version'] = QuestionReference.find('.//Version').text
-        question_ref_dict['TypeOfObject'] = QuestionReference.find('.//TypeOfObject').text
-        info['QuestionReference'] = question_ref_dict
 
-    return info
+def item_references(value):
+    """
+    Yield the reference dictionaries (Agency, ID, Version, Type / TypeOfObject) anywhere in a parsed item
+    """
+    if isinstance(value, dict):
+        if 'ID' in value and 'Agency' in value and ('Type' in value or 'TypeOfObject' in value):
+            yield value
+            return
+        for v in value.values():
+            yield from item_references(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from item_references(v)
+
+
+def question_references(question_info):
+    """
+    (AgencyId, Identifier, Version) of the instruction and the code list a parsed question refers to
+    """
+    refs = []
+    if question_info.get('Instruction'):
+        instruction = question_info['Instruction']
+        refs.append((instruction['Agency'], instruction['ID'], instruction['Version']))
+    response = question_info.get('Response') or {}
+    if response.get('response_type') == 'CodeList':
+        refs.append((response['CodeList_Agency'], response['CodeList_ID'], response['CodeList_version']))
+    return refs
 
 
-def root_to_dict_variable(root):
+def category_references(code_result):
     """
-    Part of parse xml, item_type = Variable
+    (AgencyId, Identifier, Version) of the category of each code of a parsed code list
     """
-    info = {}
-    info['URN'] = root.find('.//Variable/URN').text
-    info['UserID'] = root.find('.//Variable/UserID').text
-    info['VariableName'] = root.find('.//Variable/VariableName/String').text
-    info['Label'] = root.find('.//Variable/Label/Content').text
-
-    # QuestionReference
-    QuestionReference = root.find('.//Variable/QuestionReference')
-    question_ref_dict = {}
-    if not QuestionReference is None:
-        question_ref_dict['Agency'] = QuestionReference.find('.//Agency').text
-        question_ref_dict['ID'] = QuestionReference.find('.//ID').text
-        question_ref_dict['Version'] = QuestionReference.find('.//Version').text
-        question_ref_dict['TypeOfObject'] = QuestionReference.find('.//TypeOfObject').text
-        info['QuestionReference'] = question_ref_dict
-
-    # VariableRepresentation/CodeRepresentation
-    CodeRepresentation = root.find('.//Variable/VariableRepresentation/CodeRepresentation')
-    code_rep_dict = {}
-    if not CodeRepresentation is None:
-        code_rep_dict['RecommendedDataType'] = CodeRepresentation.find('.//RecommendedDataType').text
-        # CodeListReference
-        code_ref = {}
-        CodeListReference = CodeRepresentation.find('.//CodeListReference')
-        if not CodeListReference is None:
-            code_ref['ID'] = CodeListReference.find('.//ID').text
-            code_ref['Version'] = CodeListReference.find('.//Version').text
-            code_ref['TypeOfObject'] = CodeListReference.find('.//TypeOfObject').text
-        code_rep_dict['CodeListReference'] = code_ref
-    info['CodeRepresentation'] = code_rep_dict
-
-    return info
-
-
-def root_to_dict_conditional(root):
-    """
-    Part of parse xml, item_type = Conditional
+    return [(c['CategoryReference']['Agency'], c['CategoryReference']['ID'], c['CategoryReference']['Version'])
+            for c in code_result.get('Code', [])]
+
+
+def distinct_identifiers(identifiers):
     """
-    info = {}
-    info['URN'] = root.find('.//IfThenElse/URN').text
-    info['UserID'] = root.find('.//IfThenElse/UserID').text
-    info['ConstructName'] = root.find('.//IfThenElse/ConstructName/String').text
+    identifiers without repeats, in first seen order
+    """
+    return list(dict.fromkeys(tuple(ident) for ident in identifiers))
 
-    IfCondition = root.find('.//IfThenElse/IfCondition')
-    ifcondition_dict = {}
-    if not IfCondition is None:
-        ifcondition_dict['Description'] = IfCondition.find('.//Description/Content').text
-        ifcondition_dict['ProgramLanguage'] = IfCondition.find('.//Command/ProgramLanguage').text
-        ifcondition_dict['CommandContent'] = IfCondition.find('.//Command/CommandContent').text
-    info['IfCondition'] = ifcondition_dict
 
-    # ThenConstructReference
-    ThenReference = root.findall('.//ThenConstructReference')
-    then_list = []
-    for x, ThenRef in enumerate(ThenReference):
-        then_ref_dict = {}
-        then_ref_dict['Agency'] = ThenRef.find('.//Agency').text
-        then_ref_dict['ID'] = ThenRef.find('.//ID').text
-        then_ref_dict['Version'] = ThenRef.find('.//Version').text
-        then_ref_dict['TypeOfObject'] = ThenRef.find('.//TypeOfObject').text
-        then_list.append(then_ref_dict)
-    info['IfThenReference'] = then_list
+def dicts_by_key(identifiers, dicts):
+    """
+    {(AgencyId, Identifier): dictionary} of identifiers and their items_to_dicts
+    """
+    return {ident[:2]: d for ident, d in zip(identifiers, dicts)}
 
-    return info
 
+def at_version(refs, latest):
+    """
+    (AgencyId, Identifier, Version) references as (AgencyId, Identifier) to get their latest version,
+    or unchanged to get the version they name
+    """
+    return [ref[:2] if latest else tuple(ref) for ref in refs]
 
-def root_to_dict_loop(root):
+
+def item_lookup(items):
     """
-    Part of parse xml, item_type = Loop
+    lookup(AgencyId, Identifier, what) over a {(AgencyId, Identifier): parsed item} dictionary,
+    raising KeyError for the ones missing or not found
     """
-    info = {}
-    info['URN'] = root.find('.//Loop/URN').text
-    info['UserID'] = root.find('.//Loop/UserID').text
-    info['ConstructName'] = root.find('.//Loop/ConstructName/String').text
-
-    InitialValue = root.find('.//Loop/InitialValue')
-    InitialValue_dict = {}
-    if not InitialValue is None:
-        InitialValue_dict['ProgramLanguage'] = InitialValue.find('.//Command/ProgramLanguage').text
-        InitialValue_dict['CommandContent'] = InitialValue.find('.//Command/CommandContent').text
-    info['InitialValue'] = InitialValue_dict
-
-    LoopWhile = root.find('.//Loop/LoopWhile')
-    LoopWhile_dict = {}
-    if not LoopWhile is None:
-        LoopWhile_dict['ProgramLanguage'] = LoopWhile.find('.//Command/ProgramLanguage').text
-        LoopWhile_dict['CommandContent'] = LoopWhile.find('.//Command/CommandContent').text
-    info['LoopWhile'] = LoopWhile_dict
-
-    #TODO StepValue
-    StepValue = root.find('.//Loop/StepValue')
-    StepValue_dict = {}
-    if not StepValue is None:
-        print('TODO StepValue')
-
-    # ControlConstructReference
-    CCReference = root.find('.//Loop/ControlConstructReference')
-    cc_ref_dict = {}
-    if not CCReference is None:
-        cc_ref_dict['Agency'] = CCReference.find('.//Agency').text
-        cc_ref_dict['ID'] = CCReference.find('.//ID').text
-        cc_ref_dict['Version'] = CCReference.find('.//Version').text
-        cc_ref_dict['TypeOfObject'] = CCReference.find('.//TypeOfObject').text
-    info['ControlConstructReference'] = cc_ref_dict
-
-    return info
-
-
-def parse_xml(xml, item_type):
+    def lookup(AgencyId, Identifier, what):
+        d = items.get((AgencyId, Identifier))
+        if not d:
+            raise KeyError('{} {}/{} not found'.format(what, AgencyId, Identifier))
+        return d
+    return lookup
+
+
+def resolved_question_frames(question_info, lookup):
     """
-    Used for parsing Item value
-    item_type in:
-        - Series
-        - Study
-        - Metadata Package
-        - Data Collection
-        - Sequence
-        - Statement
-        - Organization
-        - Instrument
-        - Question Group
-        - Concept
-        - Question
-        - Question Grid
-        - Code Set
-        - Interviewer Instruction
-        - Category
-        - Question Activity
-        - Variable
-        - Conditional
-        - Loop
+    question_frames of a parsed question, its instruction, code list and categories
+    taken from lookup(AgencyId, Identifier, what) instead of being fetched
     """
-    root = remove_xml_ns(xml)
-
-    if item_type == 'Series':
-        info = root_to_dict_series(root)
-    elif item_type == 'Study':
-        info = root_to_dict_study(root)
-    elif item_type == 'Metadata Package':
-        info = root_to_dict_metadata_package(root)
-    elif item_type == 'Data Collection':
-        info = root_to_dict_data_collection(root)
-    elif item_type == 'Sequence':
-        info = root_to_dict_sequence(root)
-    elif item_type == 'Statement':
-        info = root_to_dict_statement(root)
-    elif item_type == 'Organization':
-        info = root_to_dict_organization(root)
-    elif item_type == 'Instrument':
-        info = root_to_dict_instrument(root)
-    elif item_type == 'Question Group':
-        info = root_to_dict_question_group(root)
-    elif item_type == 'Concept':
-        info = root_to_dict_concept(root)
-    elif item_type == 'Question':
-        info = root_to_dict_question(root)
-    elif item_type == 'Question Grid':
-        info = root_to_dict_question_grid(root)
-    elif item_type == 'Code Set':
-        info = root_to_dict_code_set(root)
-    elif item_type == 'Interviewer Instruction':
-        info = root_to_dict_interviewer_instruction(root)
-    elif item_type == 'Category':
-        info = root_to_dict_category(root)
-    elif item_type == 'Question Activity':
-        info = root_to_dict_question_activity(root)
-    elif item_type == 'Variable':
-        info = root_to_dict_variable(root)
-    elif item_type == 'Conditional':
-        info = root_to_dict_conditional(root)
-    elif item_type == 'Loop':
-        info = root_to_dict_loop(root)
-    else:
-        info = {}
-    return info
+    instruction_dict = None
+    if question_info['Instruction'] != {}:
+        instruction_dict = lookup(question_info['Instruction']['Agency'], question_info['Instruction']['ID'], 'instruction')
+    code_result = None
+    category_dicts = []
+    if question_info['Response'] != {} and question_info['Response']['response_type'] == 'CodeList':
+        code_result = lookup(question_info['Response']['CodeList_Agency'], question_info['Response']['CodeList_ID'],
+                             'code list')
+        category_dicts = [lookup(AgencyId, Identifier, 'category')
+                          for AgencyId, Identifier, _ in category_references(code_result)]
+    return question_frames(question_info, instruction_dict, code_result, category_dicts)
+
+
+class InstrumentGraph():
+    """
+    An instrument and every item of its set, parsed, with reference indexes.
+    Built by ColecticaObject.load_instrument_graph, it answers without further requests.
+    Instructions, code lists and categories the questions refer to but the set lacks
+    are kept apart in outside, see missing_references.
+
+        G = C.load_instrument_graph(Agency, ID)
+        for question in G.of_type('Question'):
+            df_question, df_response = G.question_all(question)
+    """
+    def __init__(self, instrument, set_entries, items):
+        """
+            instrument: item_to_dict of the instrument
+            set_entries: get_a_set_typed of the instrument
+            items: item_to_dict of each set entry, {} for the ones not found
+        """
+        self.instrument = instrument
+        self.set_entries = set_entries
+        # (AgencyId, Identifier): parsed item
+        self.items = {}
+        # item type name: parsed items in set order
+        self.by_type = {}
+        # urn:ddi:agency:id:version: parsed item
+        self.by_urn = {}
+        # (AgencyId, Identifier): keys of the items referring to it
+        self.referenced_by = {}
+        # (AgencyId, Identifier): parsed item outside the set, {} if not found
+        self.outside = {}
+        for d in [instrument] + list(items):
+            if d == {}:
+                continue
+            key = (d['AgencyId'], d['Identifier'])
+            if key in self.items:
+                continue
+            self.items[key] = d
+            self.by_type.setdefault(d['ItemType'], []).append(d)
+            self.by_urn[':'.join(['urn:ddi', d['AgencyId'], d['Identifier'], str(d['Version'])])] = d
+            for ref in item_references(d):
+                self.referenced_by.setdefault((ref['Agency'], ref['ID']), []).append(key)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return tuple(key) in self.items
+
+    def get(self, AgencyId, Identifier):
+        """
+        Parsed item, None if it is not in the set
+        """
+        return self.items.get((AgencyId, Identifier))
+
+    def resolve(self, ref):
+        """
+        Parsed item a reference dictionary points to, None if it is not in the set
+        """
+        return self.items.get((ref['Agency'], ref['ID']))
+
+    def of_type(self, item_type):
+        """
+        Parsed items of an item type name, in set order
+        """
+        return self.by_type.get(item_type, [])
+
+    def referrers(self, AgencyId, Identifier):
+        """
+        Parsed items referring to an item
+        """
+        return [self.items[key] for key in self.referenced_by.get((AgencyId, Identifier), [])]
+
+    def set_df(self):
+        """
+        The instrument set as get_a_set_to_df
+        """
+        return set_to_df(self.set_entries)
+
+    def missing_references(self):
+        """
+        (AgencyId, Identifier, Version) of the instructions, code lists and categories
+        the questions refer to that are neither in the set nor in outside
+        """
+        refs = [ref for q in self.of_type('Question') for ref in question_references(q)]
+        code_lists = self.of_type('Code Set') + [d for d in self.outside.values() if d.get('ItemType') == 'Code Set']
+        refs += [ref for d in code_lists for ref in category_references(d)]
+        return list(dict.fromkeys(ref for ref in refs if ref[:2] not in self.items and ref[:2] not in self.outside))
+
+    def add_outside(self, items):
+        """
+        Keep {(AgencyId, Identifier): parsed item} fetched for missing_references
+        """
+        self.outside.update(items)
+
+    def missing_levels(self):
+        """
+        Yield missing_references until there are none left, add_outside what is fetched for each
+        before the next: instructions and code lists first, then the categories of those code lists
+        """
+        missing = self.missing_references()
+        while missing:
+            yield missing
+            missing = self.missing_references()
+
+    def _require(self, AgencyId, Identifier, what):
+        d = self.items.get((AgencyId, Identifier)) or self.outside.get((AgencyId, Identifier))
+        if not d:
+            raise KeyError('{} {}/{} of instrument {}/{} not found'.format(
+                what, AgencyId, Identifier, self.instrument['AgencyId'], self.instrument['Identifier']))
+        return d
+
+    def question_all(self, question_info):
+        """
+        get_question_all of a parsed question of the graph,
+        KeyError if an item it refers to is not found
+        """
+        return resolved_question_frames(question_info, self._require)
+
+    def questions_all(self):
+        """
+        question_all of every question in the instrument, in set order.
+        A question referring to an item not found is skipped with a warning.
+        """
+        frames = []
+        for q in self.of_type('Question'):
+            try:
+                frames.append(self.question_all(q))
+            except KeyError as e:
+                warnings.warn('question {}/{} skipped: {}'.format(q['AgencyId'], q['Identifier'], e.args[0]))
+        return frames
+
+
+
+def follow_keys(keys_by_type):
+    """
+    follow function for ColecticaObject.traverse: the references under the given keys of each item type name
+        follow_keys({'Series': ['study'], 'Study': ['Data Collection']})
+    """
+    def follow(d):
+        for key in keys_by_type.get(d['ItemType'], []):
+            yield from item_references(d.get(key))
+    return follow
+
+
+class ItemGraph():
+    """
+    Items reached from roots by following references, parsed, a level at a time.
+    Built by ColecticaObject.traverse, it answers without further requests.
+
+        G = C.traverse([(Agency, ID)], follow_keys({'Series': ['study'], 'Study': ['Data Collection']}))
+        for study in G.children(Agency, ID):
+            data_collection = G.resolve(study['Data Collection'])
+    """
+    def __init__(self, roots, follow=None, latest=False):
+        """
+            roots: identifiers to start from, (AgencyId, Identifier, Version) or (AgencyId, Identifier)
+            follow: function of a parsed item giving the reference dictionaries to follow,
+                    default every reference (item_references)
+            latest: reach the latest version of referenced items instead of the referenced version
+        """
+        self.follow = item_references if follow is None else follow
+        self.latest = latest
+        self.roots = [tuple(r[:2]) for r in roots]
+        # (AgencyId, Identifier): parsed item, {} for the ones not found
+        self.items = {}
+        # (AgencyId, Identifier): level it was reached at, 0 for the roots
+        self.depth = {}
+        # (AgencyId, Identifier): keys of the references followed from it
+        self.edges = {}
+        # levels fetched so far
+        self.levels = 0
+        self._next(roots)
+
+    def _next(self, identifiers):
+        # the next level: one identifier per item not reached yet, the first version seen
+        frontier = {}
+        for ident in identifiers:
+            key = tuple(ident[:2])
+            if key in self.items or key in frontier:
+                continue
+            frontier[key] = key if self.latest or len(ident) < 3 or not ident[2] else tuple(ident)
+        self.frontier = list(frontier.values())
+
+    def add_level(self, fetched):
+        """
+        Add the items of the frontier, fetched as {(AgencyId, Identifier): parsed item},
+        the frontier moves on to the references they have that were not reached yet
+        """
+        identifiers = []
+        for key, d in fetched.items():
+            self.items[key] = d
+            self.depth[key] = self.levels
+            refs = [] if d == {} else [(r['Agency'], r['ID'], r.get('Version')) for r in self.follow(d)]
+            self.edges[key] = [ref[:2] for ref in refs]
+            identifiers.extend(refs)
+        self.levels += 1
+        self._next(identifiers)
+
+    def walk(self, max_depth=None):
+        """
+        Yield the frontier of each level until no new item is reached or past max_depth levels,
+        add_level what is fetched for it before the next
+        """
+        while self.frontier and (max_depth is None or self.levels <= max_depth):
+            yield self.frontier
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return tuple(key) in self.items
+
+    def get(self, AgencyId, Identifier):
+        """
+        Parsed item, None if it was not reached
+        """
+        return self.items.get((AgencyId, Identifier))
+
+    def resolve(self, ref):
+        """
+        Parsed item a reference dictionary points to, None if it was not reached
+        """
+        return self.items.get((ref['Agency'], ref['ID']))
+
+    def children(self, AgencyId, Identifier):
+        """
+        Parsed items of the references followed from an item, in reference order
+        """
+        return [self.items[key] for key in self.edges.get((AgencyId, Identifier), []) if key in self.items]
+
+    def of_type(self, item_type):
+        """
+        Parsed items of an item type name, in the order they were reached
+        """
+        return [d for d in self.items.values() if d.get('ItemType') == item_type]
 
 
 class ColecticaObject(api.ColecticaLowLevelAPI):
     """Ask practical questions to Colectica."""
 
-    def item_to_dict(self, AgencyId, Identifier):
+    def item_to_dict(self, AgencyId, Identifier, fields=None):
         """
         From an agency ID and an identifier, get information using get_an_item
-        Return a dictionary
+        fields: only parse these keys of the item, see parse_xml
+        Return a dictionary, memoized (see self.memo), do not modify it
         """
-        result = self.get_an_item(AgencyId, Identifier)
-        info = {}
-        item_info = None
-        if not result is None:
-            for k, v in result.items():
-                if k == 'ItemType':
-                    info[k] = self.item_code_inv(v)
-                elif k == 'Item':
-                    item_info = parse_xml(v, self.item_code_inv(result['ItemType']))
-                else:
-                    info[k] = v
-            d = {**info, **item_info}
-        else:
-            d = {}
+        key = ('dict', AgencyId, Identifier, None) if fields is None else ('dict', AgencyId, Identifier, None, tuple(fields))
+        memoized = self.memo.get(key)
+        if memoized is not None:
+            return memoized
+        d = result_to_dict(self.get_an_item(AgencyId, Identifier), fields)
+        if d != {}:
+            self.memo.put(key, d, self.latest_ttl)
         return d
 
 
+    def lazy_item(self, AgencyId, Identifier):
+        """
+        get_an_item as a LazyItem, parsed only for the fields read. None if the item is not found
+        """
+        result = self.get_an_item(AgencyId, Identifier)
+        return None if result is None else LazyItem(result)
+
+
+    def items_to_dicts(self, identifiers):
+        """
+        item_to_dict for many items, fetched in bulk with get_items
+        identifiers is a list of (AgencyId, Identifier, Version), or (AgencyId, Identifier) for the latest version
+        Return a list of dictionaries in input order
+        """
+        keys = [('dict', ident[0], ident[1], str(ident[2]) if len(ident) == 3 and ident[2] is not None else None)
+                for ident in identifiers]
+        dicts = [self.memo.get(key) for key in keys]
+        missing = [i for i, d in enumerate(dicts) if d is None]
+        for i, result in zip(missing, self.get_items([identifiers[i] for i in missing])):
+            dicts[i] = result_to_dict(result)
+            if dicts[i] != {}:
+                self.memo.put(keys[i], dicts[i], self.latest_ttl if keys[i][3] is None else None)
+        return dicts
+
+
+    def items_to_models(self, identifiers):
+        """
+        result_to_model for many items, fetched in bulk with get_items, in input order (not memoized)
+        """
+        return [result_to_model(result) for result in self.get_items(identifiers)]
+
+
+    def items_by_key(self, identifiers):
+        """
+        items_to_dicts of the distinct identifiers, (AgencyId, Identifier, Version) or (AgencyId, Identifier)
+        Return a dictionary of (AgencyId, Identifier): dictionary
+        """
+        identifiers = distinct_identifiers(identifiers)
+        return dicts_by_key(identifiers, self.items_to_dicts(identifiers))
+
+
     def get_a_set_to_df(self, AgencyId, Identifier, Version):
         """
         From a study, find all questions
@@ -870,12 +1015,7 @@ class ColecticaObject(api.ColecticaLowLevelAPI):
 
         l = self.get_a_set_typed(AgencyId, Identifier, Version)
         # print(l)
-        df = pd.DataFrame(
-             [self.item_code_inv(l[i]["Item2"]), l[i]["Item1"]["Item1"]] for i in range(len(l))
-         )
-        df.columns = ["ItemType", "Identifier"]
-
-        return df
+        return set_to_df(l, self.item_code_inv)
 
 
     def item_info_set(self, AgencyId, Identifier):
@@ -887,122 +1027,64 @@ class ColecticaObject(api.ColecticaLowLevelAPI):
         return df, info
 
 
+    def load_instrument_graph(self, AgencyId, Identifier):
+        """
+        An instrument and all items of its set as an InstrumentGraph:
+        the set is fetched once and its items in bulk with items_to_dicts,
+        then the items the questions refer to outside the set with items_by_key.
+        The set lists the latest version of each item and the items outside it are taken at their latest version too.
+        """
+        instrument = self.item_to_dict(AgencyId, Identifier)
+        entries = self.get_a_set_typed(AgencyId, Identifier, str(instrument['Version']))
+        G = InstrumentGraph(instrument, entries, self.items_to_dicts([api.relationship_key(e) for e in entries]))
+        for missing in G.missing_levels():
+            G.add_outside(self.items_by_key(at_version(missing, latest=True)))
+        return G
+
+
+    def traverse(self, roots, follow=None, max_depth=None, latest=False):
+        """
+        Breadth first walk of the references from roots: each level is fetched in bulk with items_by_key
+        and an item already reached (by AgencyId and Identifier) is not fetched again,
+        so the requests grow with the depth of the walk, not its number of items.
+            roots, follow, latest: see ItemGraph
+            max_depth: levels of references to follow, None to follow them all
+        Return the ItemGraph of the items reached
+        """
+        G = ItemGraph(roots, follow, latest)
+        for frontier in G.walk(max_depth):
+            G.add_level(self.items_by_key(frontier))
+        return G
+
+
     def get_question_group_info(self, AgencyId, Identifier):
         """
         From a question identifier, get information about it
         """
-        question_group = self.get_an_item(AgencyId, Identifier)
-        root = remove_xml_ns(question_group["Item"])
-
-        question = {}
-        for k, v in question_result.items():
-            if k == 'ItemType':
-                question[k] = self.item_code_inv(v)
-            elif k == 'Item':
-                question['UserID'] = root.find(".//UserID").text
-                question['QuestionLabel'] = root.find(".//UserAttributePair/AttributeValue").text
-                question['QuestionItemName'] = root.find(".//QuestionItemName/String").text
-                question['QuestionLiteral'] = root.find(".//QuestionText/LiteralText/Text").text
-            else:
-                question[k] = v
-        return question
+        return question_group_info(self.get_an_item(AgencyId, Identifier))
 
 
-    def get_question_all(self, AgencyId, Identifier):
+    def get_question_all(self, AgencyId, Identifier, latest=True):
         """
         From a question ID, return question info and it's response
         """
-        # print(AgencyId, Identifier)
-        question_info = self.item_to_dict(AgencyId, Identifier)
-        # print(question_info)
+        return self.get_questions_all(AgencyId, [Identifier], latest)[0]
 
-        if question_info['Response']== {}:
-            QI_response_type = None
-        else:
-            QI_response_type = question_info['Response']['response_type']
-        question_data = [ [ question_info['QuestionURN'],
-                            question_info['QuestionUserID'],
-                            question_info['QuestionLabel'],
-                            question_info['QuestionItemName'],
-                            question_info['QuestionLiteral'],
-                            QI_response_type ] ]
-
-        df_question = pd.DataFrame(question_data,
-                                   columns=['QuestionURN', 'QuestionUserID', 'QuestionLabel', 'QuestionItemName', 
-                                            'QuestionLiteral', 'response_type'])
-
-        # instruction
-        if question_info['Instruction'] != {}:
-            instruction_dict = self.item_to_dict(question_info['Instruction']['Agency'], question_info['Instruction']['ID'])
-            df_question['Instruction_URN'] = instruction_dict['InstructionURN']
-            df_question['Instruction'] = instruction_dict['InstructionText']
-        else:
-            df_question['Instruction_URN'] = None
-            df_question['Instruction'] = None
-
-        if QI_response_type == 'CodeList':
-            code_result = self.item_to_dict(AgencyId, question_info['Response']['CodeList_ID'])
-            code_list_sourceId = code_result['UserID']
-            code_list_label = code_result['Label']
-
-            code_list = code_result['Code']
-            df = pd.DataFrame(columns=['response_type', 'Value', 'Name', 'ID', 'Label'])
-            for c in code_list:
-                category_dict = self.item_to_dict(c['CategoryReference']['Agency'], c['CategoryReference']['ID'])
-                df = df.append({'response_type': 'CodeList',
-                                        'Value': c['Value'],
-                                         'Name': category_dict['Name'],
-                                           'ID': category_dict['UserID'],
-                                        'Label': category_dict['Label']
-                               }, ignore_index=True)
-
-            df['code_list_URN'] = question_info['Response']['code_list_URN']
-            df['code_list_sourceId'] = code_list_sourceId
-            df['code_list_label'] = code_list_label
-            df['Order'] = df.index + 1
-            df['QuestionURN'] = question_info['QuestionURN']
-            df['QuestionItemName'] = question_info['QuestionItemName']
-
-            df_question['response'] = code_list_label
-            df_question['response_domain'] = question_info['Response']['code_list_URN']
-
-        elif QI_response_type == 'Text':
-            data = [ [ question_info['QuestionURN'],
-                       question_info['QuestionItemName'],
-                       question_info['Response']['response_type'],
-                       question_info['Response']['response_label'] ] ]
-            df = pd.DataFrame(data, columns=['QuestionURN', 'QuestionItemName', 'response_type', 'Label'])
-
-            df_question['response'] = question_info['Response']['response_label']
-
-        elif QI_response_type == 'Numeric':
-            data = [ [ question_info['QuestionURN'],
-                       question_info['QuestionItemName'], 
-                       question_info['Response']['response_type'], 
-                       question_info['Response']['response_label'],
-                       question_info['Response']['response_NumericType'],
-                       question_info['Response']['response_RangeLow'],
-                       question_info['Response']['response_RangeHigh'] ] ]
-            df = pd.DataFrame(data, columns=['QuestionURN', 'QuestionItemName', 'response_type', 'Label', 'response_NumericType', 'response_RangeLow', 'response_RangeHigh'])
-
-            df_question['response'] = question_info['Response']['response_label']
-
-        elif QI_response_type == 'DateTime':
-            data = [ [ question_info['QuestionURN'],
-                       question_info['QuestionItemName'],
-                       question_info['Response']['response_type'],
-                       question_info['Response']['response_label'],
-                       question_info['Response']['DateTypeCode'] ] ]
-            df = pd.DataFrame(data, columns=['QuestionURN', 'QuestionItemName', 'response_type', 'Label', 'DateTypeCode'])
-
-            df_question['response'] = question_info['Response']['response_label']
-
-        else:
-            print(QI_response_type)
-            print(question_info['Response'])
-            df = pd.DataFrame()
 
-        return df_question, df
+    def get_questions_all(self, AgencyId, identifiers, latest=True):
+        """
+        From a list of question IDs, return a list of (question info, response) as get_question_all
+        The questions, then the instructions and code lists they refer to, then the categories of all
+        code lists are each fetched in one bulk call, every distinct item once
+            latest: the instructions, code lists and categories at their latest version, as item_to_dict gives them;
+                    False takes the version the question or code list names, fetched with _getList in fewer requests
+        """
+        questions = self.items_by_key((AgencyId, Identifier) for Identifier in identifiers)
+        items = self.items_by_key(at_version((ref for q in questions.values() for ref in question_references(q)), latest))
+        code_lists = [d for d in items.values() if d.get('ItemType') == 'Code Set']
+        items.update(self.items_by_key(at_version((ref for d in code_lists for ref in category_references(d)), latest)))
+        questions, items = item_lookup(questions), item_lookup(items)
+        return [resolved_question_frames(questions(AgencyId, Identifier, 'question'), items) for Identifier in identifiers]
 
 
 if __name__ == "__main__":
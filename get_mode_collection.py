@@ -7,34 +7,30 @@ Python 3
 import colectica
 from colectica import ColecticaObject
 import api
+from cache import SQLiteItemCache
+from mirror import Mirror, MirrorObject
+from rows import RowBuilder
 import pandas as pd
 import os
 import numpy as np
+import argparse
 
 
 def get_all_series(C):
     """
-    Get a list of all series
+    Iterate over all series, fetched a page at a time
     """
-    all_series = C.general_search(C.item_code('Series'),'',MaxResults=0)['Results']
-    return all_series
+    return C.search_iter(C.item_code('Series'), '')
 
 
-def from_series_get_study(C, Agency, ID):
-    """
-    From a series, get list of studies
-    """
-    d = C.item_to_dict(Agency, ID)
-    return d['study']
+# Series -> Study -> Data Collection references walked by get_instruments_df
+FOLLOW = colectica.follow_keys({'Series': ['study'], 'Study': ['Data Collection']})
 
 
-def from_study_get_instrument(C, Agency, ID):
+def from_data_collection_get_instrument(c):
     """
-    From a study, get instrument and Mode of Data Collection
+    From a parsed data collection, get its name, instrument and Mode of Data Collection
     """
-    d = C.item_to_dict(Agency, ID)
-
-    c = C.item_to_dict(d['Data Collection']['Agency'], d['Data Collection']['ID'])
     name = c['Name']
     mode_list = [c['CollectionEvent']['ModeOfCollection'][i]['TypeOfMode'] for i in range(len(c['CollectionEvent']['ModeOfCollection']))]
 
@@ -45,30 +41,10 @@ def from_study_get_instrument(C, Agency, ID):
     return name, instrument_urn, mode_list
 
 
-def get_instruments_df(C):
+def unlist_modes(df):
     """
-    From series, return a dataframe of instrument/mode_list
+    One row per mode of data collection
     """
-    all_series = get_all_series(C)
-
-    df = pd.DataFrame(columns=['study_name', 'instrument_name', 'instrument_urn', 'data_collection_mode'])   
-    for s in all_series:
-        # print("*****")
-        study_name = list(s['ItemName'].values())[0]
-        # print('series')
-        # print(s['AgencyId'], s['Identifier'])
-        all_studies = from_series_get_study(C, s['AgencyId'], s['Identifier'])
-
-        for st in all_studies:
-            # print("======")
-            # print('studies')
-            # print(st['Agency'], st['ID'])
-            name, instrument_urn, mode_list = from_study_get_instrument(C, st['Agency'], st['ID'])
-            df = df.append({'study_name': study_name,
-                            'instrument_name': name,
-                            'instrument_urn': instrument_urn,
-                            'data_collection_mode': mode_list},
-                           ignore_index=True)
     lst_col = 'data_collection_mode'
     df_unlist = pd.DataFrame({col:np.repeat(df[col].values, df[lst_col].str.len()) 
                               for col in df.columns.difference([lst_col])}).assign(**{lst_col:np.concatenate(df[lst_col].values)})[df.columns.tolist()]
@@ -76,11 +52,42 @@ def get_instruments_df(C):
     return df_unlist
 
 
+def get_instruments_df(C, latest=True):
+    """
+    From series, return a dataframe of instrument/mode_list
+        latest: the latest version of each study and data collection, as item_to_dict gives,
+                False for the versions the series and studies refer to (one bulk request per level)
+    """
+    all_series = list(get_all_series(C))
+
+    # all studies, then all data collections, each level fetched concurrently
+    G = C.traverse([(s['AgencyId'], s['Identifier'], s['Version']) for s in all_series], FOLLOW, latest=latest)
+
+    rows = RowBuilder(['study_name', 'instrument_name', 'instrument_urn', 'data_collection_mode'])
+    for s in all_series:
+        study_name = list(s['ItemName'].values())[0]
+        for st in G.get(s['AgencyId'], s['Identifier'])['study']:
+            d = G.resolve(st)
+            c = G.resolve(d['Data Collection'])
+            name, instrument_urn, mode_list = from_data_collection_get_instrument(c)
+            rows.append([study_name, name, instrument_urn, mode_list])
+    return unlist_modes(rows.to_frame())
+
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mirror', help='read from this mirror.py SQLite file instead of the portal')
+    args = parser.parse_args()
+
     outdir = 'output'
     if not os.path.exists(outdir):
         os.makedirs(outdir)
 
+    if args.mirror:
+        df = get_instruments_df(MirrorObject(Mirror(args.mirror)))
+        df.to_csv(os.path.join(outdir, 'instrument_mode_data_collection.csv'), index=False, sep=';')
+        return
+
     hostname = None
     username = None
     password = None
@@ -91,7 +98,8 @@ def main():
     if not password:
         password = input("enter your password: ")
 
-    C = ColecticaObject(hostname, username, password)
+    # published item versions are kept on disk between runs
+    C = ColecticaObject(hostname, username, password, cache=SQLiteItemCache('colectica_cache.sqlite'))
 
     df = get_instruments_df(C)
     df.to_csv(os.path.join(outdir, 'instrument_mode_data_collection.csv'), index=False, sep=';')
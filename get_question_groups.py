@@ -7,32 +7,41 @@ Python 3
 import colectica
 from colectica import ColecticaObject
 import api
+from cache import SQLiteItemCache
 import pandas as pd
 import json
 import os
+import argparse
+from scheduler import Harvest
 
 
 def get_qi(C, row):
-    d = C.item_to_dict(row['Agency'], row['ID'])
+    # only two fields are needed, the rest of the question is not parsed
+    d = C.item_to_dict(row['Agency'], row['ID'], fields=['QuestionURN', 'QuestionItemName'])
     QuestionURN = d['QuestionURN']
     QuestionItemName = d['QuestionItemName']
     return [QuestionURN, QuestionItemName]
 
 
-def append_files_from_dir(indir):
+def question_group_rows(C, result):
     """
-    Append all files in a directory
+    Rows of a question group (a general_search result): one per question it references
     """
-    input_files = [i for i in os.listdir(indir) if i.startswith('QG')]
-    appended_df = []
-    for input_file in input_files:
-        df = pd.read_csv(os.path.join(indir, input_file), sep='\t')
-        appended_df.append(df)
-    appended_data = pd.concat(appended_df)
-    appended_data.to_csv(os.path.join(indir, 'question_group_all.csv'), sep='\t', index=False)
+    df, info = C.item_info_set(result['AgencyId'], result['Identifier'])
+    rows = []
+    for ref in info['QuestionItemRef']:
+        QI_URN, QI_Name = get_qi(C, ref)
+        rows.append(dict(ref, QI_URN=QI_URN, QI_Name=QI_Name,
+                         QG_URN=info['URN'], QG_Agency=info['AgencyId'], QG_Id=info['Identifier'],
+                         QG_Version=info['Version'], QG_Name=info['Name'], QG_Label=info['Label']))
+    return rows
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=4, help='question groups read at a time')
+    args = parser.parse_args()
+
     outdir = 'question_group'
     if not os.path.exists(outdir):
         os.makedirs(outdir)
@@ -47,50 +56,30 @@ def main():
     if not password:
         password = input("enter your password: ")
 
-    C = ColecticaObject(hostname, username, password)
-
-    # get all question groups
-    # C.general_search("5cc915a1-23c9-4487-9613-779c62f8c205", '', 10) will fetch 10 records
-#    L = C.general_search("5cc915a1-23c9-4487-9613-779c62f8c205", '', 0)
-#    print(L['TotalResults']) # 35952
-
-#    json.dump(L, open(os.path.join(outdir, 'all.txt'),'w'))
+    # published item versions are kept on disk between runs
+    C = ColecticaObject(hostname, username, password, cache=SQLiteItemCache('colectica_cache.sqlite'))
 
-    L = json.load(open(os.path.join(outdir, 'all.txt')))
-#    print(L)
+    # get all question groups, a page at a time, the first run saves them to all.txt
+    all_file = os.path.join(outdir, 'all.txt')
+    if not os.path.exists(all_file):
+        results = list(C.search_iter(C.item_code('Question Group'), ''))
+        print(len(results)) # 35952
+        json.dump({'TotalResults': len(results), 'Results': results}, open(all_file, 'w'))
 
-    import numpy as np
-    all_idx = np.array(range(L['TotalResults']))
-    # split into 10 chunks
-    chunks = np.array_split(all_idx, 10)
+    L = json.load(open(all_file))
 
-    this_chunk = 0
+    # the rows of each question group are kept in harvest.sqlite as it is done,
+    # rerun after a crash to finish the rest
+    H = Harvest(os.path.join(outdir, 'harvest.sqlite'))
+    H.add(('{}:{}'.format(r['AgencyId'], r['Identifier']), r) for r in L['Results'])
+    counts = H.run(lambda r: question_group_rows(C, r), workers=args.workers)
+    for name, attempts, error in H.failures():
+        print(name, error)
 
-    appended_df = []
-    for i in chunks[this_chunk]:
-        agency = L['Results'][i]['AgencyId']
-        Id = L['Results'][i]['Identifier']
-        df, info = C.item_info_set(agency, Id)
+    rows = [row for name, result in H.results() for row in result]
+    pd.DataFrame(rows).to_csv(os.path.join(outdir, 'question_group_all.csv'), sep='\t', index=False)
+    print(counts)
 
-        if info['QuestionItemRef'] != []:
-            print(i)
-            df_qi = pd.DataFrame(info['QuestionItemRef'])
-            # df_qi['QI_Name'] = df_qi.apply(lambda row: C.get_question_info(row['Agency'], row['ID'])['QuestionItemName'], axis=1)
-            df_qi[['QI_URN', 'QI_Name']] = df_qi.apply(lambda row: pd.Series(get_qi(C, row)), axis=1)
-            df_qi['QG_URN'] = info['URN']
-            df_qi['QG_Agency'] = info['AgencyId']
-            df_qi['QG_Id'] = info['Identifier']
-            df_qi['QG_Version'] = info['Version']
-            df_qi['QG_Name'] = info['Name']
-            df_qi['QG_Label'] = info['Label']
-            appended_df.append(df_qi)
-
-    appended_data = pd.concat(appended_df)
-    appended_data.to_csv(os.path.join(outdir, 'QG_{}.csv'.format(this_chunk)), sep='\t', index=False)
-
-    # combine all QG files
-    #append_files_from_dir(outdir)
 
 if __name__ == '__main__':
     main()
-
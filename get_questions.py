@@ -5,29 +5,24 @@ Python 3
     Try to get all questions from an instrument
 """
 import colectica
-from colectica import ColecticaObject
+from async_api import SyncColecticaObject
 import api
+from cache import SQLiteItemCache
 import pandas as pd
 import os
-import numpy as np
 import json
+import argparse
+from scheduler import Harvest
 
 
-def from_instrument_get_question_response(C, Agency, ID):
+def from_instrument_get_question_response(G):
     """
-    From an instrument get all questions, all response
+    From an instrument graph (C.load_instrument_graph) get all questions, all response
     """
-
-    df_instrument_set, instrument_info = C.item_info_set(Agency, ID)
-
-    df_question = df_instrument_set.loc[(df_instrument_set.ItemType == 'Question') , :]
-
     question_df_list = []
     codelist_df_list = []
     response_df_list = []
-    for question_id in df_question['Identifier']:
-        # print(question_id)
-        df_question, df_response = C.get_question_all(Agency, question_id)
+    for df_question, df_response in G.questions_all():
         # store DataFrame in list
         question_df_list.append(df_question)
 
@@ -36,7 +31,10 @@ def from_instrument_get_question_response(C, Agency, ID):
         else:
             response_df_list.append(df_response)
 
-    df_question_all = pd.concat(question_df_list)
+    if question_df_list == []:
+        df_question_all = pd.DataFrame()
+    else:
+        df_question_all = pd.concat(question_df_list)
 
     if codelist_df_list == []:
         df_codelist_all = pd.DataFrame()
@@ -48,30 +46,56 @@ def from_instrument_get_question_response(C, Agency, ID):
     else:
         df_response_all = pd.concat(response_df_list)
 
-    return instrument_info, df_question_all, df_codelist_all, df_response_all
+    return G.instrument, df_question_all, df_codelist_all, df_response_all
 
 
-def from_instrument_get_statement(C, Agency, ID):
+def from_instrument_get_statement(G):
     """
-    From an instrument get all Statement
+    From an instrument graph get all Statement
     """
-    df_instrument_set, instrument_info = C.item_info_set(Agency, ID)
-
-    df_statement = df_instrument_set.loc[(df_instrument_set.ItemType == 'Statement') , :]
-
-    statement_df_list = []
-    for statement_id in df_statement['Identifier']:
-        dict_statement = C.item_to_dict(Agency, statement_id)
-        df_statement = pd.DataFrame([dict_statement], columns=dict_statement.keys()) 
-        statement_df_list.append(df_statement)
-    if not statement_df_list == []:
-        df_statement_all = pd.concat(statement_df_list)
+    statements = G.of_type('Statement')
+    if not statements == []:
+        df_statement_all = pd.DataFrame(statements)
     else:
         df_statement_all = pd.DataFrame(columns=['AgencyId', 'Version', 'Identifier', 'URN', 'SourceId', 'Instruction', 'Label', 'Literal'])
     return df_statement_all
 
 
+def export_instrument(C, result, outdir):
+    """
+    Write the questions, responses and statements of an instrument (a general_search result) to outdir/<instrument name>
+    """
+    instrument_name = '_'.join(' '.join(result['ItemName'].values()).split(' '))
+    instrument_dir = os.path.join(outdir, instrument_name)
+    if not os.path.exists(instrument_dir):
+        os.makedirs(instrument_dir)
+
+    # the instrument set and all its items, fetched once
+    G = C.load_instrument_graph(result['AgencyId'], result['Identifier'])
+
+    # From an instrument get all questions, all response, print to file
+    instrument_info, df_question_all, df_codelist_all, df_response_all = from_instrument_get_question_response(G)
+
+    with open(os.path.join(instrument_dir, 'instrument.txt'), 'w') as f:
+        print(instrument_info, file=f)
+
+    df_question_all.to_csv(os.path.join(instrument_dir, 'question.csv'), index=False, sep='\t')
+    df_codelist_all.to_csv(os.path.join(instrument_dir, 'codelist.csv'), index=False, sep='\t')
+    df_response_all.to_csv(os.path.join(instrument_dir, 'response.csv'), index=False, sep='\t')
+
+    # From an instrument get all statements
+    df_statement_all = from_instrument_get_statement(G)
+    # reindex: statements have StatementURN, the URN column is left empty as .loc used to
+    df_statement_out = df_statement_all.reindex(columns=['AgencyId', 'Version', 'Identifier', 'URN', 'SourceId', 'Instruction', 'Label', 'Literal'])
+    df_statement_out.to_csv(os.path.join(instrument_dir, 'statement.csv'), index=False, sep='\t')
+    return instrument_name
+
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=4, help='instruments exported at a time')
+    args = parser.parse_args()
+
     outdir = 'instrument'
     if not os.path.exists(outdir):
         os.makedirs(outdir)
@@ -86,51 +110,25 @@ def main():
     if not password:
         password = input("enter your password: ")
 
-    C = ColecticaObject(hostname, username, password)
-
-
-    # get all instruments
-#    L = C.general_search('f196cc07-9c99-4725-ad55-5b34f479cf7d', '', 0)
-#    print(L['TotalResults']) # 313
-
-#    json.dump(L, open(os.path.join(outdir, 'all_instrument.txt'),'w'))
-
-    L = json.load(open(os.path.join(outdir, 'all_instrument.txt')))
-#    print(L)
+    # published item versions are kept on disk between runs
+    C = SyncColecticaObject(hostname, username, password, cache=SQLiteItemCache('colectica_cache.sqlite'))
 
-    all_idx = np.array(range(L['TotalResults']))
-    # split into 10 chunks
-    chunks = np.array_split(all_idx, 10)
+    # get all instruments, the first run saves them to all_instrument.txt
+    all_file = os.path.join(outdir, 'all_instrument.txt')
+    if not os.path.exists(all_file):
+        results = list(C.search_iter(C.item_code('Instrument'), ''))
+        print(len(results)) # 313
+        json.dump({'TotalResults': len(results), 'Results': results}, open(all_file, 'w'))
 
-    this_chunk = 9
+    L = json.load(open(all_file))
 
-    for i in chunks[this_chunk]:
-        print(i)
-        Agency = L['Results'][i]['AgencyId']
-        ID = L['Results'][i]['Identifier']
-        Version = L['Results'][i]['Version']
-
-        instrument_name = '_'.join(' '.join(L['Results'][i]['ItemName'].values()).split(' '))
-        instrument_dir = os.path.join(outdir, instrument_name)
-        if not os.path.exists(instrument_dir):
-            os.makedirs(instrument_dir)
-
-        # From an instrument get all questions, all response, print to file
-        instrument_info, df_question_all, df_codelist_all, df_response_all = from_instrument_get_question_response(C, Agency, ID)
-
-        with open(os.path.join(instrument_dir, 'instrument.txt'), 'w') as f:
-            print(instrument_info, file=f)
-
-        df_question_all.to_csv(os.path.join(instrument_dir, 'question.csv'), index=False, sep='\t')
-        df_codelist_all.to_csv(os.path.join(instrument_dir, 'codelist.csv'), index=False, sep='\t')
-        df_response_all.to_csv(os.path.join(instrument_dir, 'response.csv'), index=False, sep='\t')
-
-        # From an instrument get all statements
-        df_statement_all = from_instrument_get_statement(C, Agency, ID)
-        df_statement_out = df_statement_all.loc[:, ['AgencyId', 'Version', 'Identifier', 'URN', 'SourceId', 'Instruction', 'Label', 'Literal']]
-        df_statement_out.to_csv(os.path.join(instrument_dir, 'statement.csv'), index=False, sep='\t')
+    # instruments already exported are skipped, rerun after a crash to finish the rest
+    H = Harvest(os.path.join(outdir, 'harvest.sqlite'))
+    H.add(('{}:{}'.format(r['AgencyId'], r['Identifier']), r) for r in L['Results'])
+    H.run(lambda r: export_instrument(C, r, outdir), workers=args.workers)
+    for name, attempts, error in H.failures():
+        print(name, error)
 
 
 if __name__ == '__main__':
     main()
-
@@ -5,20 +5,31 @@ Python 3
     Try to get all raw items from an instrument
 """
 import colectica
-from colectica import ColecticaObject
+from async_api import SyncColecticaObject
+from mirror import dump_instrument, dump_mirror
+from scheduler import Harvest
 import api
 import pandas as pd
 import os
-import numpy as np
 import json
+import argparse
 from pandas.io.json import json_normalize
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mirror', help='read the instruments from this mirror.py SQLite file instead of the portal')
+    parser.add_argument('--workers', type=int, default=4, help='instruments dumped at a time')
+    args = parser.parse_args()
+
     outdir = 'instrument_dict_original'
     if not os.path.exists(outdir):
         os.makedirs(outdir)
 
+    if args.mirror:
+        dump_mirror(args.mirror, outdir)
+        return
+
     hostname = None
     username = None
     password = None
@@ -29,45 +40,16 @@ def main():
     if not password:
         password = input("enter your password: ")
 
-    C = ColecticaObject(hostname, username, password)
+    C = SyncColecticaObject(hostname, username, password)
 
     L = json.load(open('../../colectica_api_get_questions/instrument/all_instrument.txt'))
-#    print(L)
-
-    all_idx = np.array(range(L['TotalResults']))
-    # split into 10 chunks
-    chunks = np.array_split(all_idx, 0)
-
-    this_chunk = 10
-    print(chunks[this_chunk])
-
-    for i in chunks[this_chunk]:
-        print(i)
-        Agency = L['Results'][i]['AgencyId']
-        ID = L['Results'][i]['Identifier']
-        Version = L['Results'][i]['Version']
-
-        df_instrument_set, instrument_info = C.item_info_set(Agency, ID)
-
-        instrument_name = instrument_info['InstrumentSourceID']
-        instrument_dir = os.path.join(outdir, instrument_name)
-        if not os.path.exists(instrument_dir):
-            os.makedirs(instrument_dir)
-
-        item_types = df_instrument_set.ItemType.unique()
-        for item_type in item_types:
-
-            df_part = df_instrument_set.loc[(df_instrument_set.ItemType == item_type) , :]
-
-            dict_list = []
-            for part_id in df_part['Identifier']:
-                part_dict = C.get_an_item(Agency, part_id)
-
-                if part_dict is not None:
-                    dict_list.append(part_dict)
 
-            with open(os.path.join(instrument_dir, item_type + '.txt'), 'w') as outfile:
-                json.dump(dict_list, outfile, indent=4)
+    # instruments already dumped are skipped, rerun after a crash to finish the rest
+    H = Harvest(os.path.join(outdir, 'harvest.sqlite'))
+    H.add(('{}:{}'.format(r['AgencyId'], r['Identifier']), r) for r in L['Results'])
+    H.run(lambda r: dump_instrument(C, r['AgencyId'], r['Identifier'], outdir), workers=args.workers)
+    for name, attempts, error in H.failures():
+        print(name, error)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,418 @@
+"""
+    Declarative field specs used by colectica.parse_xml
+
+    An ItemSpec lists the fields of one item type as (key, field) pairs. Paths are compiled
+    once, when the spec is built at import. Parsing a fragment indexes its elements by local
+    name in one walk, so every './/X' lookup from the root is a dictionary access and no
+    element is searched for twice.
+
+    Paths are a subset of ElementTree paths: 'A/B', './A/B' (children) and './/A/B'
+    (descendants), matched on local names so namespaces do not matter.
+
+    Fragments are read by parse_fragment: the parser builds the tree in C and the index walk
+    is the only pass over it in Python. Tags keep their namespaces, nothing is rewritten.
+"""
+
+import abc
+import xml.etree.ElementTree as ET
+
+# use lxml when it is installed
+try:
+    from lxml import etree as lxml_etree
+    LXML_PARSER = lxml_etree.XMLParser(remove_comments=True, remove_pis=True, resolve_entities=False,
+                                       no_network=True, huge_tree=True)
+except ImportError:
+    lxml_etree = None
+
+# returned by a field to leave its key out of the parsed dictionary
+OMIT = object()
+
+
+def parse_fragment(xml):
+    """
+    Root element of an item fragment, xml as str or as bytes straight from the response
+    """
+    if lxml_etree is not None:
+        try:
+            return lxml_etree.fromstring(xml, LXML_PARSER)
+        except ValueError:
+            # lxml refuses str with an encoding declaration
+            return lxml_etree.fromstring(xml.encode('utf-8'), LXML_PARSER)
+    return ET.fromstring(xml)
+
+
+_local_names = {}
+
+
+def local_name(tag):
+    """
+    Tag without its {namespace}
+    """
+    name = _local_names.get(tag)
+    if name is None:
+        name = _local_names[tag] = tag[tag.rfind('}') + 1:]
+    return name
+
+
+def child(elem, name):
+    for c in elem:
+        if local_name(c.tag) == name:
+            return c
+    return None
+
+
+def build_index(elem):
+    """
+    Descendants of elem by local name, in document order. elem itself is left out, as './/' does.
+    """
+    index = {}
+    descendants = elem.iter()
+    next(descendants)
+    for el in descendants:
+        name = local_name(el.tag)
+        found = index.get(name)
+        if found is None:
+            index[name] = [el]
+        else:
+            found.append(el)
+    return index
+
+
+class Context():
+    """
+    An element being parsed. The fragment root keeps an index of its descendants by local name;
+    below the root, lookups scan the (small) subtree and stop at the first match.
+    root is the context of the whole fragment. indexed=False indexes the root only for the names
+    looked up, cheaper when only a few fields are read.
+    """
+    __slots__ = ('elem', 'root', 'index', 'partial')
+
+    def __init__(self, elem, root=None, indexed=True):
+        self.elem = elem
+        self.partial = False
+        if root is None:
+            self.root = self
+            if indexed:
+                self.index = build_index(elem)
+            else:
+                # filled a name at a time by descendants
+                self.index = {}
+                self.partial = True
+        else:
+            self.root = root
+            self.index = None
+
+    def sub(self, elem):
+        return Context(elem, self.root)
+
+    def _scan(self, name):
+        descendants = self.elem.iter()
+        next(descendants)
+        for el in descendants:
+            if local_name(el.tag) == name:
+                yield el
+
+    def descendants(self, name):
+        """
+        Descendants with local name name, in document order
+        """
+        if self.index is None:
+            return self._scan(name)
+        found = self.index.get(name)
+        if found is None:
+            if not self.partial:
+                return ()
+            found = self.index[name] = list(self._scan(name))
+        return found
+
+    def first_descendant(self, name):
+        if self.index is None or (self.partial and name not in self.index):
+            # stops at the first match, the name may never be needed again
+            return next(self._scan(name), None)
+        found = self.index.get(name)
+        return found[0] if found else None
+
+
+class Path():
+    """
+    A compiled path: descendant or child first step, then child steps
+    """
+    __slots__ = ('path', 'descendant', 'head', 'tail')
+
+    def __init__(self, path):
+        self.path = path
+        if path.startswith('.//'):
+            self.descendant, path = True, path[3:]
+        else:
+            self.descendant, path = False, path[2:] if path.startswith('./') else path
+        names = path.split('/')
+        self.head = names[0]
+        self.tail = tuple(names[1:])
+
+    def _heads(self, ctx):
+        if self.descendant:
+            return ctx.descendants(self.head)
+        return [c for c in ctx.elem if local_name(c.tag) == self.head]
+
+    def first(self, ctx):
+        """
+        First matching element in document order, None if there is none
+        """
+        if not self.tail:
+            if self.descendant:
+                return ctx.first_descendant(self.head)
+            return child(ctx.elem, self.head)
+        for el in self._heads(ctx):
+            for name in self.tail:
+                el = child(el, name)
+                if el is None:
+                    break
+            else:
+                return el
+        return None
+
+    def all(self, ctx):
+        """
+        All matching elements in document order
+        """
+        found = list(self._heads(ctx))
+        for name in self.tail:
+            found = [c for el in found for c in el if local_name(c.tag) == name]
+        return found
+
+
+def ref_dict(elem, type_key='Type', position=None):
+    """
+    Agency, ID, Version and type of a reference element
+    """
+    parts = {}
+    for c in elem:
+        parts[local_name(c.tag)] = c.text
+    ref = {} if position is None else {'position': position}
+    ref['Agency'] = parts.get('Agency')
+    ref['ID'] = parts.get('ID')
+    ref['Version'] = parts.get('Version')
+    ref[type_key] = parts.get('TypeOfObject')
+    return ref
+
+
+def evaluate(fields, ctx):
+    """
+    Dictionary of the fields evaluated on a context. A field with key None is merged in.
+    """
+    info = {}
+    for key, field in fields:
+        value = field.value(ctx)
+        if value is OMIT:
+            continue
+        if key is None:
+            info.update(value)
+        else:
+            info[key] = value
+    return info
+
+
+class Field(abc.ABC):
+    """
+    Base class of the field kinds
+    """
+    @abc.abstractmethod
+    def value(self, ctx):
+        """
+        Parsed value of the field on a context, or OMIT to leave its key out
+        """
+
+
+class Text(Field):
+    """
+    Text of the first element at path, None if missing (left out with omit=True).
+    root=True looks the path up from the fragment root instead of the current element.
+    """
+    def __init__(self, path, omit=False, root=False):
+        self.path = Path(path)
+        self.omit = omit
+        self.root = root
+
+    def value(self, ctx):
+        el = self.path.first(ctx.root if self.root else ctx)
+        if el is None:
+            return OMIT if self.omit else None
+        return el.text
+
+
+class Attr(Field):
+    """
+    Attribute of the element at path, or of the current element when path is None
+    """
+    def __init__(self, path, name):
+        self.path = None if path is None else Path(path)
+        self.name = name
+
+    def value(self, ctx):
+        el = ctx.elem if self.path is None else self.path.first(ctx)
+        if el is None:
+            return None
+        return el.attrib.get(self.name)
+
+
+class Ref(Field):
+    """
+    Reference at path as a dictionary, {} if missing (left out with omit=True)
+    """
+    def __init__(self, path, type_key='Type', omit=False):
+        self.path = Path(path)
+        self.type_key = type_key
+        self.omit = omit
+
+    def value(self, ctx):
+        el = self.path.first(ctx)
+        if el is None:
+            return OMIT if self.omit else {}
+        return ref_dict(el, self.type_key)
+
+
+class RefList(Field):
+    """
+    All references at path, numbered from 1 with position=True
+    """
+    def __init__(self, path, type_key='Type', position=True):
+        self.path = Path(path)
+        self.type_key = type_key
+        self.position = position
+
+    def value(self, ctx):
+        return [ref_dict(el, self.type_key, x + 1 if self.position else None)
+                for x, el in enumerate(self.path.all(ctx))]
+
+
+class RefUrn(Field):
+    """
+    urn:ddi:agency:id:version of the reference at path, None if missing
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def value(self, ctx):
+        el = self.path.first(ctx)
+        if el is None:
+            return None
+        ref = ref_dict(el)
+        return ':'.join(['urn:ddi', ref['Agency'], ref['ID'], ref['Version']])
+
+
+class Group(Field):
+    """
+    Dictionary of fields evaluated on the element at path, {} if missing.
+    path None groups fields of the current element.
+    """
+    def __init__(self, path, fields):
+        self.path = None if path is None else Path(path)
+        self.fields = list(fields)
+
+    def value(self, ctx):
+        if self.path is None:
+            return evaluate(self.fields, ctx)
+        el = self.path.first(ctx)
+        if el is None:
+            return {}
+        return evaluate(self.fields, ctx.sub(el))
+
+
+class Each(Field):
+    """
+    List of dictionaries of fields, one per element at path
+    """
+    def __init__(self, path, fields):
+        self.path = Path(path)
+        self.fields = list(fields)
+
+    def value(self, ctx):
+        return [evaluate(self.fields, ctx.sub(el)) for el in self.path.all(ctx)]
+
+
+class Choice(Field):
+    """
+    Fields of the first option whose path is found, {} if none is.
+    options: list of (path, fields)
+    """
+    def __init__(self, options):
+        self.options = [(Path(path), list(fields)) for path, fields in options]
+
+    def value(self, ctx):
+        for path, fields in self.options:
+            el = path.first(ctx)
+            if el is not None:
+                return evaluate(fields, ctx.sub(el))
+        return {}
+
+
+class Const(Field):
+    def __init__(self, value):
+        self.const = value
+
+    def value(self, ctx):
+        return self.const
+
+
+class Custom(Field):
+    """
+    Value computed by fn(ctx), for fields no other kind describes
+    """
+    def __init__(self, fn):
+        self.fn = fn
+
+    def value(self, ctx):
+        return self.fn(ctx)
+
+
+class ItemSpec():
+    """
+    Fields of one item type
+    """
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = list(fields)
+        self.keyed = {key: field for key, field in self.fields if key is not None}
+
+    def value(self, ctx, key):
+        """
+        Value of one key of the parsed dictionary, OMIT if the item has none
+        """
+        field = self.keyed.get(key)
+        if field is not None:
+            return field.value(ctx)
+        for k, field in self.fields:
+            if k is None:
+                merged = field.value(ctx)
+                if merged is not OMIT and key in merged:
+                    return merged[key]
+        return OMIT
+
+    def parse(self, root, fields=None):
+        """
+        Parsed dictionary of an item's root element.
+        With fields, a list of keys, only those fields are evaluated, the others are skipped,
+        and the fragment is indexed only for the names those fields look up.
+        """
+        if fields is None:
+            return evaluate(self.fields, Context(root))
+        wanted = set(fields)
+        ctx = Context(root, indexed=False)
+        info = {}
+        for key, field in self.fields:
+            if key is None:
+                merged = field.value(ctx)
+                if merged is not OMIT:
+                    info.update((k, v) for k, v in merged.items() if k in wanted)
+            elif key in wanted:
+                value = field.value(ctx)
+                if value is not OMIT:
+                    info[key] = value
+        return info
+
+    def __call__(self, root):
+        return self.parse(root)
+
+
+if __name__ == "__main__":
+    raise RuntimeError("don't run this directly")
@@ -0,0 +1,368 @@
+"""
+    Local mirror of a Colectica portal in an SQLite file, kept up to date incrementally
+
+    Mirror stores the latest version of every item of the mirrored item types: the get_an_item
+    result (Item xml included), its colectica.result_to_dict dictionary and its general_search
+    result, plus the typed set of each instrument and its members at the versions the set refers to.
+    Item versions are kept once stored, a published version does not change. Mirror.sync lists each
+    item type with general_search and fetches only the items that are new or whose version changed
+    since the last sync, in bulk. MirrorObject answers the ColecticaObject methods from the file, so
+    scripts can run against the mirror instead of the portal.
+
+        M = Mirror('colectica_mirror.sqlite')
+        M.sync(ColecticaObject(hostname, username, password))
+        C = MirrorObject(M)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import api
+import colectica
+from cache import MemoryLRU
+
+# item types mirrored by default: all the ones parse_xml reads
+ITEM_TYPES = [spec.name for spec in colectica.ITEM_SPECS.values()]
+
+# item types whose typed set is mirrored
+SET_TYPES = ['Instrument']
+
+
+class Mirror():
+    """
+    The SQLite file of the mirror
+    """
+    def __init__(self, path='colectica_mirror.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS items (
+                                  agency TEXT NOT NULL,
+                                  id TEXT NOT NULL,
+                                  version INTEGER NOT NULL,
+                                  item_type TEXT NOT NULL,
+                                  latest INTEGER NOT NULL,
+                                  summary TEXT,
+                                  result TEXT NOT NULL,
+                                  parsed TEXT NOT NULL,
+                                  synced REAL NOT NULL,
+                                  PRIMARY KEY (agency, id, version))""")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(items)")]
+        if 'latest' not in columns:
+            self._conn.close()
+            raise RuntimeError('{} was made by an older mirror.py, sync into a new file'.format(path))
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_latest ON items (agency, id, latest)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_item_type ON items (item_type, latest)")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS sets (
+                                  agency TEXT NOT NULL,
+                                  id TEXT NOT NULL,
+                                  version INTEGER NOT NULL,
+                                  entries TEXT NOT NULL,
+                                  PRIMARY KEY (agency, id, version))""")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS syncs (
+                                  item_type TEXT PRIMARY KEY,
+                                  synced REAL NOT NULL,
+                                  items INTEGER NOT NULL)""")
+        self._conn.commit()
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def versions(self, item_type):
+        """
+        {(AgencyId, Identifier): latest Version} of the mirrored items of an item type GUID
+        """
+        rows = self._query("SELECT agency, id, version FROM items WHERE item_type = ? AND latest = 1", (item_type,))
+        return {(agency, identifier): version for agency, identifier, version in rows}
+
+    def has(self, AgencyId, Identifier, Version):
+        return self._query("SELECT 1 FROM items WHERE agency = ? AND id = ? AND version = ?",
+                           (AgencyId, Identifier, int(Version))) != []
+
+    def store(self, results, summaries=None, latest=True):
+        """
+        Store get_an_item results, parsed, in one transaction.
+        summaries: {(AgencyId, Identifier): general_search result}
+        latest: the results are the latest versions, the versions stored before are not;
+                with latest=False they are older versions, as set members refer to them
+        """
+        now = time.time()
+        rows = []
+        for result in results:
+            key = (result['AgencyId'], result['Identifier'])
+            summary = (summaries or {}).get(key)
+            rows.append((result['AgencyId'], result['Identifier'], int(result['Version']), result['ItemType'], int(latest),
+                         None if summary is None else json.dumps(summary), json.dumps(result),
+                         json.dumps(colectica.result_to_dict(result)), now))
+        with self._lock:
+            if latest:
+                self._conn.executemany("UPDATE items SET latest = 0 WHERE agency = ? AND id = ?", [row[:2] for row in rows])
+                self._conn.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            else:
+                self._conn.executemany("INSERT OR IGNORE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def mark_latest(self, identifiers, summaries=None):
+        """
+        Make stored versions, (AgencyId, Identifier, Version), the latest ones
+        """
+        with self._lock:
+            for agency, identifier, version in identifiers:
+                summary = (summaries or {}).get((agency, identifier))
+                self._conn.execute("UPDATE items SET latest = 0 WHERE agency = ? AND id = ?", (agency, identifier))
+                self._conn.execute("UPDATE items SET latest = 1, summary = ? WHERE agency = ? AND id = ? AND version = ?",
+                                   (None if summary is None else json.dumps(summary), agency, identifier, int(version)))
+            self._conn.commit()
+
+    def store_set(self, AgencyId, Identifier, Version, entries):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sets VALUES (?, ?, ?, ?)",
+                               (AgencyId, Identifier, int(Version), json.dumps(entries)))
+            self._conn.commit()
+
+    def remove(self, keys):
+        """
+        Remove every version of items, (AgencyId, Identifier)
+        """
+        with self._lock:
+            self._conn.executemany("DELETE FROM items WHERE agency = ? AND id = ?", keys)
+            self._conn.executemany("DELETE FROM sets WHERE agency = ? AND id = ?", keys)
+            self._conn.commit()
+
+    def sync(self, C, item_types=None, set_types=None, prune=False, chunk_size=200):
+        """
+        Bring the mirror up to date with the portal of C, a ColecticaObject.
+        Each item type is listed with general_search, a page at a time; only items new or whose
+        version changed are fetched, in bulk, and stored a chunk at a time, so an interrupted
+        sync keeps what it stored. The typed set of changed items of set_types is fetched again,
+        with the members at the versions it refers to that are not mirrored yet.
+            item_types: item type names, default ITEM_TYPES
+            set_types: item type names whose set is mirrored, default SET_TYPES
+            prune: remove mirrored items no longer listed by the portal
+        Return {item type name: {'listed', 'fetched', 'removed'}}
+        """
+        item_types = ITEM_TYPES if item_types is None else item_types
+        set_types = SET_TYPES if set_types is None else set_types
+        counts = {}
+        for item_type in item_types:
+            type_id = api.item_dict[item_type]
+            listed = {(s['AgencyId'], s['Identifier']): s for s in C.search_iter(type_id, '')}
+            known = self.versions(type_id)
+            changed = [(key[0], key[1], s['Version']) for key, s in listed.items() if known.get(key) != s['Version']]
+            # a version stored as a set member only needs to become the latest
+            stored = [ident for ident in changed if self.has(*ident)]
+            self.mark_latest(stored, listed)
+            changed = [ident for ident in changed if ident not in stored]
+
+            fetched = 0
+            for i in range(0, len(changed), chunk_size):
+                chunk = changed[i:i + chunk_size]
+                results = [r for r in C.get_items(chunk) if r is not None]
+                self.store(results, listed)
+                fetched += len(results)
+            if item_type in set_types:
+                for agency, identifier, version in stored + changed:
+                    fetched += self.sync_set(C, agency, identifier, version, chunk_size)
+
+            removed = [key for key in known if key not in listed] if prune else []
+            self.remove(removed)
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)", (item_type, time.time(), len(listed)))
+                self._conn.commit()
+            counts[item_type] = {'listed': len(listed), 'fetched': fetched, 'removed': len(removed)}
+        return counts
+
+    def sync_set(self, C, AgencyId, Identifier, Version, chunk_size=200):
+        """
+        Store the typed set of an item version and its members at the versions it refers to.
+        Return the number of members fetched.
+        """
+        entries = C.get_a_set_typed(AgencyId, Identifier, str(Version))
+        if entries is None:
+            return 0
+        self.store_set(AgencyId, Identifier, Version, entries)
+        missing = [(e['Item1']['Item3'], e['Item1']['Item1'], e['Item1']['Item2']) for e in entries]
+        missing = [ident for ident in dict.fromkeys(missing) if not self.has(*ident)]
+        fetched = 0
+        for i in range(0, len(missing), chunk_size):
+            results = [r for r in C.get_items(missing[i:i + chunk_size]) if r is not None]
+            self.store(results, latest=False)
+            fetched += len(results)
+        return fetched
+
+    def last_sync(self):
+        """
+        {item type name: (time of the last sync, items listed)}
+        """
+        return {item_type: (synced, items) for item_type, synced, items in self._query("SELECT * FROM syncs")}
+
+    def reparse(self):
+        """
+        Parse the stored results again, after parse_xml changed
+        """
+        rows = self._query("SELECT result FROM items")
+        with self._lock:
+            self._conn.executemany("UPDATE items SET parsed = ? WHERE agency = ? AND id = ? AND version = ?",
+                                   [(json.dumps(colectica.result_to_dict(r)), r['AgencyId'], r['Identifier'], int(r['Version']))
+                                    for r in (json.loads(row[0]) for row in rows)])
+            self._conn.commit()
+
+    def __len__(self):
+        """
+        Number of item versions stored
+        """
+        return self._query("SELECT COUNT(*) FROM items")[0][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MirrorObject(colectica.ColecticaObject):
+    """
+    A ColecticaObject answering from a Mirror instead of the portal, no requests are made.
+
+        C = MirrorObject(Mirror('colectica_mirror.sqlite'))
+        C.item_to_dict(Agency, ID), C.search_iter(C.item_code('Series'), ''), C.load_instrument_graph(Agency, ID)
+
+    Requests without a version get the latest mirrored one; a version that is not mirrored is
+    answered as a missing item (None, or {} for dictionaries), as the portal answers a missing item.
+    Calls the mirror cannot answer raise RuntimeError.
+    """
+    def __init__(self, mirror, memo_size=4096):
+        self.mirror = mirror
+        self.host = mirror.path
+        self.max_workers = 1
+        self.cache = None
+        self.memo = MemoryLRU(memo_size)
+        # the mirror only changes on sync
+        self.latest_ttl = None
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+
+    def close(self):
+        pass
+
+
+    def _request(self, method, path, endpoint, jsonquery=None):
+        raise RuntimeError('{} is not mirrored, ask the portal'.format(endpoint))
+
+
+    def _row(self, column, AgencyId, Identifier, Version=None):
+        # the latest version with Version None, else that version only
+        if Version is None:
+            rows = self.mirror._query("SELECT " + column + " FROM items WHERE agency = ? AND id = ? AND latest = 1",
+                                      (AgencyId, Identifier))
+        else:
+            rows = self.mirror._query("SELECT " + column + " FROM items WHERE agency = ? AND id = ? AND version = ?",
+                                      (AgencyId, Identifier, int(Version)))
+        if not rows:
+            return None
+        return json.loads(rows[0][0])
+
+
+    def get_an_item(self, AgencyId, Identifier):
+        return self._row('result', AgencyId, Identifier)
+
+
+    def get_an_item_version(self, AgencyId, Identifier, Version):
+        return self._row('result', AgencyId, Identifier, Version)
+
+
+    def get_item_list(self, identifiers):
+        results = [self._row('result', *ident) for ident in identifiers]
+        return [r for r in results if r is not None]
+
+
+    def get_items(self, identifiers, chunk_size=200):
+        return [self._row('result', *ident) for ident in identifiers]
+
+
+    def item_to_dict(self, AgencyId, Identifier, fields=None):
+        """
+        The stored dictionary, see colectica.ColecticaObject.item_to_dict
+        """
+        d = self._row('parsed', AgencyId, Identifier) or {}
+        if fields is not None and d != {}:
+            spec = colectica.ITEM_SPECS[api.item_dict[d['ItemType']]]
+            d = {k: v for k, v in d.items() if k in fields or k not in spec.keyed}
+        return d
+
+
+    def items_to_dicts(self, identifiers):
+        return [self._row('parsed', *ident) or {} for ident in identifiers]
+
+
+    def get_a_set_typed(self, AgencyId, Identifier, Version):
+        """
+        The stored typed set of an item version, None if it is not mirrored
+        """
+        rows = self.mirror._query("SELECT entries FROM sets WHERE agency = ? AND id = ? AND version = ?",
+                                  (AgencyId, Identifier, int(Version)))
+        if not rows:
+            return None
+        return json.loads(rows[0][0])
+
+
+    def general_search(self, item_type, search_term, MaxResults=1, RankResults=True, SearchDepricatedItems=False, SearchLatestVersion=True, ResultOffset=0):
+        """
+        Stored general_search results of an item type, search_term matched against names and labels
+        """
+        select = "FROM items WHERE item_type = ? AND latest = 1 AND summary IS NOT NULL"
+        if not search_term:
+            # a page at a time, as search_iter asks
+            total = self.mirror._query("SELECT COUNT(*) " + select, (item_type,))[0][0]
+            rows = self.mirror._query("SELECT summary " + select + " ORDER BY agency, id LIMIT ? OFFSET ?",
+                                      (item_type, -1 if MaxResults == 0 else MaxResults, ResultOffset))
+            return {'TotalResults': total, 'Results': [json.loads(row[0]) for row in rows]}
+        term = search_term.lower()
+        results = [r for r in (json.loads(row[0]) for row in
+                               self.mirror._query("SELECT summary " + select + " ORDER BY agency, id", (item_type,)))
+                   if any(term in str(v).lower() for v in list((r.get('ItemName') or {}).values())
+                                                           + list((r.get('Label') or {}).values()))]
+        end = None if MaxResults == 0 else ResultOffset + MaxResults
+        return {'TotalResults': len(results), 'Results': results[ResultOffset:end]}
+
+
+def dump_instrument(C, Agency, ID, outdir):
+    """
+    Write the items of an instrument's set to outdir/<instrument source id>/<item type>.txt,
+    the files instrument_to_dict.py writes and RCNIC.py / ESRC.py read
+    """
+    df_instrument_set, instrument_info = C.item_info_set(Agency, ID)
+
+    instrument_name = instrument_info['InstrumentSourceID']
+    instrument_dir = os.path.join(outdir, instrument_name)
+    if not os.path.exists(instrument_dir):
+        os.makedirs(instrument_dir)
+
+    item_types = df_instrument_set.ItemType.unique()
+    for item_type in item_types:
+
+        df_part = df_instrument_set.loc[(df_instrument_set.ItemType == item_type) , :]
+
+        # fetched in bulk, chunks sent concurrently
+        part_dicts = C.get_items(list(zip(df_part['AgencyId'], df_part['Identifier'], df_part['Version'])))
+        dict_list = [part_dict for part_dict in part_dicts if part_dict is not None]
+
+        with open(os.path.join(instrument_dir, item_type + '.txt'), 'w') as outfile:
+            json.dump(dict_list, outfile, indent=4)
+
+
+def dump_mirror(path, outdir):
+    """
+    Write every instrument of a local mirror to outdir, without asking the portal
+    """
+    C = MirrorObject(Mirror(path))
+    for result in C.search_iter(C.item_code('Instrument'), ''):
+        dump_instrument(C, result['AgencyId'], result['Identifier'], outdir)
+
+
+if __name__ == "__main__":
+    raise RuntimeError("don't run this directly")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""
+Python 3
+    Create or bring up to date a local mirror of the portal, see mirror.py.
+    The first run fetches every item, later runs only the items whose version changed.
+
+    python mirror_sync.py --path colectica_mirror.sqlite
+"""
+from colectica import ColecticaObject
+from mirror import Mirror, ITEM_TYPES
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--path', default='colectica_mirror.sqlite', help='SQLite file of the mirror')
+    parser.add_argument('--types', nargs='*', default=ITEM_TYPES, help='item type names to mirror')
+    parser.add_argument('--prune', action='store_true', help='remove items the portal no longer lists')
+    args = parser.parse_args()
+
+    hostname = None
+    username = None
+    password = None
+    if not hostname:
+        hostname = input ("enter the url of the site: ")
+    if not username:
+        username = input("enter your username: ")
+    if not password:
+        password = input("enter your password: ")
+
+    C = ColecticaObject(hostname, username, password)
+    M = Mirror(args.path)
+    counts = M.sync(C, item_types=args.types, prune=args.prune)
+    for item_type, count in counts.items():
+        print('{}: {listed} listed, {fetched} fetched, {removed} removed'.format(item_type, **count))
+
+
+if __name__ == '__main__':
+    main()
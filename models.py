@@ -0,0 +1,263 @@
+"""
+    Compact item models: one __slots__ class per item type, built from its ItemSpec
+
+    parse_xml dictionaries hold a dict per reference, group and code. The models hold the same
+    values in slotted objects, references as Reference (agency, id and type interned, version
+    an int), lists as tuples, so a large instrument or the whole catalogue fits in memory.
+    to_dict() gives back the dictionary of colectica.result_to_dict.
+
+        M = colectica.result_to_model(C.get_an_item(Agency, ID))
+        M.QuestionLiteral, M.Instruction.urn
+        M.to_dict() == colectica.result_to_dict(result)
+"""
+
+import re
+import sys
+
+from item_spec import Ref, RefList, Group, Each, Choice
+
+# value of a field left out of the dictionary
+MISSING = object()
+
+# result keys every item model has a slot for
+IDENTIFICATION = ('ItemType', 'AgencyId', 'Identifier', 'Version')
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def compact_version(version):
+    """
+    Version text as an int, when it is written as one
+    """
+    if isinstance(version, str) and version.isdigit() and str(int(version)) == version:
+        return int(version)
+    return version
+
+
+class Reference():
+    """
+    A reference to an item: Agency, ID, Version, type of object and, in numbered lists, position
+    """
+    __slots__ = ('agency', 'id', 'version', 'type', 'position')
+
+    def __init__(self, agency, id, version, type, position=None):
+        self.agency = intern(agency)
+        self.id = intern(id)
+        self.version = compact_version(version)
+        self.type = intern(type)
+        self.position = position
+
+    @classmethod
+    def from_dict(cls, d, type_key='Type'):
+        return cls(d['Agency'], d['ID'], d['Version'], d[type_key], d.get('position'))
+
+    @property
+    def key(self):
+        """
+        (AgencyId, Identifier)
+        """
+        return (self.agency, self.id)
+
+    @property
+    def urn(self):
+        return ':'.join(['urn:ddi', self.agency, self.id, str(self.version)])
+
+    def to_dict(self, type_key='Type'):
+        """
+        The reference as parse_xml gives it, type under type_key
+        """
+        d = {} if self.position is None else {'position': self.position}
+        d['Agency'] = self.agency
+        d['ID'] = self.id
+        d['Version'] = None if self.version is None else str(self.version)
+        d[type_key] = self.type
+        return d
+
+    def _values(self):
+        return (self.agency, self.id, self.version, self.type, self.position)
+
+    def __eq__(self, other):
+        return isinstance(other, Reference) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return 'Reference({!r}, {!r}, {!r}, {!r})'.format(self.agency, self.id, self.version, self.type)
+
+
+class Model():
+    """
+    Base class of the generated models. _fields lists (attribute, key, load, dump):
+    load turns a parse_xml value into the stored one, dump turns it back.
+    Keys of the dictionary that no field declares are kept in the _rest slot,
+    to_dict puts them back after the first _rest_at fields.
+    """
+    __slots__ = ()
+    _fields = ()
+    _keys = frozenset()
+    _attributes = {}
+    _rest_at = 0
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls.__new__(cls)
+        for attribute, key, load, dump in cls._fields:
+            value = d.get(key, MISSING)
+            object.__setattr__(obj, attribute, value if value is MISSING else load(value))
+        rest = {k: v for k, v in d.items() if k not in cls._keys}
+        object.__setattr__(obj, '_rest', rest or None)
+        return obj
+
+    def to_dict(self):
+        d = {}
+        for x, (attribute, key, load, dump) in enumerate(self._fields):
+            if x == self._rest_at and self._rest:
+                d.update(self._rest)
+            value = getattr(self, attribute)
+            if value is not MISSING:
+                d[key] = dump(value)
+        if self._rest_at >= len(self._fields) and self._rest:
+            d.update(self._rest)
+        return d
+
+    def __getitem__(self, key):
+        """
+        Stored value of a dictionary key, references as Reference and lists as tuples
+        """
+        attribute = self._attributes.get(key)
+        value = MISSING if attribute is None else getattr(self, attribute)
+        if value is MISSING:
+            if self._rest and key in self._rest:
+                return self._rest[key]
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, a) == getattr(other, a) for a in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(key, getattr(self, attribute))
+            for attribute, key, _, _ in self._fields if getattr(self, attribute) is not MISSING))
+
+
+class ItemModel(Model):
+    """
+    Base class of the item type models, with the identification of the get_an_item result
+    """
+    __slots__ = ()
+
+    @property
+    def key(self):
+        """
+        (AgencyId, Identifier)
+        """
+        return (self.AgencyId, self.Identifier)
+
+    @property
+    def urn(self):
+        return ':'.join(['urn:ddi', self.AgencyId, self.Identifier, str(self.Version)])
+
+
+def identity(value):
+    return value
+
+
+def to_list(values):
+    return [v.to_dict() for v in values]
+
+
+def attribute_name(key):
+    return re.sub(r'\W', '_', key)
+
+
+def declared_fields(fields):
+    """
+    (key, field) pairs of fields, with the fields of unkeyed groups put in their place.
+    Unkeyed custom fields are left out, their keys end up in _rest.
+    """
+    for key, field in fields:
+        if key is not None:
+            yield key, field
+        elif isinstance(field, Group):
+            yield from declared_fields(field.fields)
+
+
+def converters(name, field):
+    """
+    (load, dump) of a field's values
+    """
+    if isinstance(field, Ref):
+        type_key = field.type_key
+        return ((lambda v: Reference.from_dict(v, type_key) if v else None),
+                (lambda r: {} if r is None else r.to_dict(type_key)))
+    if isinstance(field, RefList):
+        type_key = field.type_key
+        return ((lambda v: tuple(Reference.from_dict(d, type_key) for d in v)),
+                (lambda refs: [r.to_dict(type_key) for r in refs]))
+    if isinstance(field, Group):
+        cls = model_class(name, field.fields)
+        return cls.from_dict, cls.to_dict
+    if isinstance(field, Each):
+        cls = model_class(name, field.fields)
+        return (lambda v: tuple(cls.from_dict(d) for d in v)), to_list
+    if isinstance(field, Choice):
+        options = [(frozenset(k for k, _ in declared_fields(fields)), model_class('{}{}'.format(name, x), fields))
+                   for x, (_, fields) in enumerate(field.options)]
+
+        def load(v):
+            if not v:
+                return None
+            for keys, cls in options:
+                if keys == v.keys():
+                    return cls.from_dict(v)
+            raise ValueError('{}: no option has the keys {}'.format(name, sorted(v)))
+        return load, (lambda m: {} if m is None else m.to_dict())
+    # Text, Attr, Const, RefUrn, Custom: as parsed
+    return identity, identity
+
+
+def model_class(name, fields, base=Model, extra_keys=()):
+    """
+    A Model subclass with a slot per declared key of fields, after the keys in extra_keys.
+    Undeclared keys go after extra_keys, or at the end when there are none.
+    """
+    keys = list(extra_keys) + [k for k, _ in declared_fields(fields) if k not in extra_keys]
+    specs = dict(declared_fields(fields))
+    field_list = []
+    for key in keys:
+        attribute = attribute_name(key)
+        field = specs.get(key)
+        load, dump = (identity, identity) if field is None else converters(name + attribute, field)
+        field_list.append((attribute, key, load, dump))
+    return type(name, (base,), {
+        '__slots__': tuple(a for a, _, _, _ in field_list) + ('_rest',),
+        '_fields': tuple(field_list),
+        '_keys': frozenset(keys),
+        '_attributes': {k: a for a, k, _, _ in field_list},
+        '_rest_at': len(extra_keys) if extra_keys else len(field_list),
+    })
+
+
+def item_model_class(spec):
+    """
+    ItemModel subclass of an ItemSpec, named after the item type ('Code Set' gives CodeSet)
+    """
+    return model_class(attribute_name(spec.name.title()).replace('_', ''), spec.fields,
+                       base=ItemModel, extra_keys=IDENTIFICATION)
+
+
+if __name__ == "__main__":
+    raise RuntimeError("don't run this directly")
@@ -0,0 +1,45 @@
+"""
+    Build DataFrames a row at a time without copying the frame for every row
+"""
+
+import pandas as pd
+
+
+class RowBuilder():
+    """
+    Rows collected column by column and made into a DataFrame once, at the end.
+
+        rows = RowBuilder(['item_type', 'item_urn', 'content'])
+        rows.append(['question', urn, literal])
+        df = rows.to_frame()
+
+    df.loc[len(df)] = row and df.append(row) copy the whole frame for each row, which is quadratic
+    in the number of rows; append here is constant time.
+    """
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._values = [[] for _ in self.columns]
+
+    def append(self, row):
+        """
+        Add a row, a list of values in column order or a dictionary of column: value (missing columns are None)
+        """
+        if isinstance(row, dict):
+            row = [row.get(c) for c in self.columns]
+        elif len(row) != len(self.columns):
+            raise ValueError('row has {} values, expected {}'.format(len(row), len(self.columns)))
+        for values, value in zip(self._values, row):
+            values.append(value)
+
+    def __len__(self):
+        return len(self._values[0]) if self._values else 0
+
+    def to_frame(self):
+        """
+        DataFrame of the rows so far, indexed from 0
+        """
+        return pd.DataFrame(dict(zip(self.columns, self._values)), columns=self.columns)
+
+
+if __name__ == "__main__":
+    raise RuntimeError("don't run this directly")
@@ -0,0 +1,194 @@
+"""
+    Resumable harvest: a persistent queue of work units run across worker threads
+
+    A Harvest keeps its units in an SQLite file. Each unit has a name and a JSON payload
+    (an instrument, a question group); run() calls work(payload) for every unit not yet done,
+    in worker threads, and records each finished unit and what work returned in one
+    transaction. A unit is done only once its record is committed, so after a crash or
+    Ctrl-C the next run() starts again from the units left, and re-running a finished
+    harvest does nothing. work should be idempotent: a unit interrupted half way is run again.
+
+        H = Harvest('question_group/harvest.sqlite')
+        H.add((r['Identifier'], r) for r in C.search_iter(C.item_code('Question Group'), ''))
+        H.run(lambda r: harvest_question_group(C, r), workers=4)
+        rows = [row for name, result in H.results() for row in result]
+"""
+
+import json
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Harvest():
+    """
+    The work queue of a harvest, in an SQLite file
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS units (
+                                  position INTEGER PRIMARY KEY AUTOINCREMENT,
+                                  name TEXT NOT NULL UNIQUE,
+                                  payload TEXT NOT NULL,
+                                  state TEXT NOT NULL,
+                                  attempts INTEGER NOT NULL DEFAULT 0,
+                                  result TEXT,
+                                  error TEXT,
+                                  finished REAL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS units_state ON units (state)")
+        self._conn.commit()
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def add(self, units):
+        """
+        Queue (name, payload) pairs; units already queued, done or not, are left as they are.
+        Return the number of units added.
+        """
+        rows = [(str(name), json.dumps(payload), PENDING) for name, payload in units]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO units (name, payload, state) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def counts(self):
+        """
+        {state: number of units}
+        """
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(self._query("SELECT state, COUNT(*) FROM units GROUP BY state")))
+        return counts
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM units")[0][0]
+
+    def todo(self):
+        """
+        (name, payload) of the units not done, in the order they were added
+        """
+        rows = self._query("SELECT name, payload FROM units WHERE state != ? ORDER BY position", (DONE,))
+        return [(name, json.loads(payload)) for name, payload in rows]
+
+    def results(self):
+        """
+        (name, result) of the done units, in the order they were added
+        """
+        rows = self._query("SELECT name, result FROM units WHERE state = ? ORDER BY position", (DONE,))
+        return [(name, json.loads(result)) for name, result in rows]
+
+    def failures(self):
+        """
+        (name, attempts, error) of the units whose last run raised
+        """
+        return self._query("SELECT name, attempts, error FROM units WHERE state = ? ORDER BY position", (FAILED,))
+
+    def _finish(self, name, state, result=None, error=None):
+        with self._lock:
+            self._conn.execute("UPDATE units SET state = ?, attempts = attempts + 1, result = ?, error = ?, finished = ? WHERE name = ?",
+                               (state, result, error, time.time(), name))
+            self._conn.commit()
+
+    def reset(self):
+        """
+        Queue every unit again, to harvest from scratch
+        """
+        with self._lock:
+            self._conn.execute("UPDATE units SET state = ?, attempts = 0, result = NULL, error = NULL, finished = NULL", (PENDING,))
+            self._conn.commit()
+
+    def run(self, work, workers=4, report_every=5.0, out=sys.stderr):
+        """
+        Run work(payload) for each unit not done, workers at a time, failed units included.
+        Units that raise are recorded as failed with their traceback and run again by the next run().
+        Progress (units done, failed, units per second and time left) is written to out
+        every report_every seconds and at the end; out=None keeps quiet.
+        Return counts().
+        """
+        todo = self.todo()
+        progress = Progress(len(todo), self.counts()[DONE], report_every, out)
+        units = iter(todo)
+        running = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def submit():
+                unit = next(units, None)
+                if unit is not None:
+                    running[executor.submit(work, unit[1])] = unit[0]
+
+            try:
+                # at most two units per worker in flight, the queue can be large
+                for _ in range(2 * workers):
+                    submit()
+                while running:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        try:
+                            self._finish(name, DONE, result=json.dumps(future.result()))
+                            progress.update(done=1)
+                        except Exception:
+                            self._finish(name, FAILED, error=traceback.format_exc())
+                            progress.update(failed=1)
+                        submit()
+            except BaseException:
+                # units not started stay pending, the ones running are run again next time
+                for future in running:
+                    future.cancel()
+                progress.report(interrupted=True)
+                raise
+        progress.report()
+        return self.counts()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Progress():
+    """
+    Live progress of a run: units done and failed, throughput and time left
+    """
+    def __init__(self, total, done_before=0, report_every=5.0, out=sys.stderr):
+        self.total = total
+        self.done_before = done_before
+        self.report_every = report_every
+        self.out = out
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._last = self.start
+
+    def update(self, done=0, failed=0):
+        self.done += done
+        self.failed += failed
+        now = time.perf_counter()
+        if now - self._last >= self.report_every:
+            self._last = now
+            self.report()
+
+    def report(self, interrupted=False):
+        if self.out is None:
+            return
+        elapsed = time.perf_counter() - self.start
+        finished = self.done + self.failed
+        rate = finished / elapsed if elapsed > 0 else 0.0
+        left = (self.total - finished) / rate if rate > 0 else float('nan')
+        print('{}/{} units ({} done before, {} failed) {:.2f} units/s, {:.0f}s elapsed, {:.0f}s left{}'.format(
+            finished, self.total, self.done_before, self.failed, rate, elapsed, left,
+            ', interrupted' if interrupted else ''), file=self.out, flush=True)
+
+
+if __name__ == "__main__":
+    raise RuntimeError("don't run this directly")
@@ -0,0 +1,252 @@
+"""
+    Transport policies shared by the blocking and async Colectica clients
+"""
+
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+# statuses telling the client to slow down; a 500 is an application error, not backpressure
+OVERLOAD_STATUSES = frozenset((429, 502, 503, 504))
+
+
+def is_overload_status(status):
+    """
+    True for the statuses telling the client to slow down
+    """
+    return status in OVERLOAD_STATUSES
+
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header, given in seconds or as an HTTP date.
+    None if missing or unreadable.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy():
+    """
+    Retry idempotent calls with jittered exponential backoff.
+
+        C = ColecticaObject(hostname, username, password, retry_policy=RetryPolicy(max_retries=8, deadline=900))
+
+    The n-th retry waits a random time up to backoff_factor * 2 ** n seconds, capped at max_backoff,
+    or what the server asks for in Retry-After. No retry starts after deadline seconds from the first attempt.
+    RetryPolicy(max_retries=0) disables retries.
+    """
+    def __init__(self, max_retries=5, backoff_factor=0.5, max_backoff=60, deadline=600,
+                 retry_statuses=(429, 500, 502, 503, 504)):
+        """
+            max_retries: maximum number of retries per call
+            backoff_factor: base of the exponential backoff, in seconds
+            max_backoff: longest wait between two attempts, in seconds
+            deadline: total seconds a call may take including retries, None for no limit
+            retry_statuses: HTTP status codes worth retrying
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retries = {}
+        self.gave_up = {}
+        self._lock = threading.Lock()
+
+    def should_retry_status(self, status):
+        return status in self.retry_statuses
+
+    def next_delay(self, attempt, started, retry_after=None):
+        """
+        Seconds to wait before retry number attempt + 1 of a call started at time.monotonic() started,
+        None when the call should give up.
+        """
+        if attempt >= self.max_retries:
+            return None
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+        else:
+            delay = min(delay, self.max_backoff)
+        if self.deadline is not None and time.monotonic() - started + delay > self.deadline:
+            return None
+        return delay
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self.retries[endpoint] = self.retries.get(endpoint, 0) + 1
+
+    def record_give_up(self, endpoint):
+        with self._lock:
+            self.gave_up[endpoint] = self.gave_up.get(endpoint, 0) + 1
+
+    def stats(self):
+        """
+        Return a dictionary of endpoint: {retries, gave_up}
+        """
+        with self._lock:
+            return {endpoint: {'retries': self.retries.get(endpoint, 0), 'gave_up': self.gave_up.get(endpoint, 0)}
+                    for endpoint in set(self.retries) | set(self.gave_up)}
+
+
+class TokenBucket():
+    """
+    Client-side rate limit: at most rate requests per second on average, bursts up to burst.
+
+        C = ColecticaObject(hostname, username, password, rate_limiter=TokenBucket(rate=20, burst=40))
+    """
+    def __init__(self, rate, burst=None):
+        """
+            rate: tokens added per second
+            burst: bucket size, default one second worth of tokens
+        """
+        self.rate = float(rate)
+        self.burst = float(burst) if burst is not None else max(1.0, self.rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token, return the seconds to wait before using it
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """
+        Block until a token is available
+        """
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveConcurrencyLimit():
+    """
+    Limit on requests in flight that adapts to the server (AIMD).
+
+    Each successful request raises the limit by about one per limit requests (additive increase);
+    a 429, 502, 503 or 504 status, a timeout or a connection error multiplies it by decrease_factor
+    (multiplicative decrease), at most once per cooldown seconds.
+    Latency alone never lowers the limit unless latency_target is given: then a response
+    slower than latency_target seconds counts as an overload too.
+
+        C = ColecticaObject(hostname, username, password,
+                            concurrency_limit=AdaptiveConcurrencyLimit(initial=4, max_limit=16, latency_target=2.0))
+
+    A limit serves either threads (acquire / release) or one event loop (acquire_async / release_async),
+    whichever uses it first: give the blocking and the async client a limit each, and each event loop its own.
+    """
+    def __init__(self, initial=4, min_limit=1, max_limit=64, latency_target=None,
+                 decrease_factor=0.5, cooldown=1.0):
+        """
+            initial: starting limit
+            min_limit, max_limit: bounds of the limit
+            latency_target: seconds above which a response counts as slow, None to ignore latency
+            decrease_factor: factor applied to the limit on overloads
+            cooldown: minimum seconds between two decreases
+        """
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_cond = None
+        # 'threads' or the event loop, set by the first acquire
+        self._mode = None
+
+    def _claim(self, mode):
+        with self._cond:
+            if self._mode is None:
+                self._mode = mode
+            elif self._mode is not mode:
+                raise RuntimeError('this AdaptiveConcurrencyLimit is used by {}, give each client and event loop its own limit'.format(
+                    self._mode if self._mode == 'threads' else 'another event loop'))
+
+    def _may_enter(self):
+        return self.in_flight < int(self.limit)
+
+    def _update(self, latency, error):
+        slow = (latency is not None and not error
+                and self.latency_target is not None and latency > self.latency_target)
+        now = time.monotonic()
+        if error or slow:
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = now
+                self.decreases += 1
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def acquire(self):
+        """
+        Block until a request may start
+        """
+        self._claim('threads')
+        with self._cond:
+            while not self._may_enter():
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, error=False):
+        """
+        A request finished after latency seconds, error if the server was overloaded or could not be reached
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self._update(latency, error)
+            self._cond.notify_all()
+
+    async def acquire_async(self):
+        # the condition binds to the loop of its first use, the one _claim holds the limit to
+        self._claim(asyncio.get_running_loop())
+        if self._async_cond is None:
+            self._async_cond = asyncio.Condition()
+        async with self._async_cond:
+            await self._async_cond.wait_for(self._may_enter)
+            self.in_flight += 1
+
+    async def release_async(self, latency=None, error=False):
+        async with self._async_cond:
+            self.in_flight -= 1
+            self._update(latency, error)
+            self._async_cond.notify_all()
+
+    def stats(self):
+        """
+        Return a dictionary of the current limit, requests in flight and decreases
+        """
+        return {'limit': int(self.limit), 'in_flight': self.in_flight, 'decreases': self.decreases}
+
+
+if __name__ == "__main__":
+    raise RuntimeError("don't run this directly")